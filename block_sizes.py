@@ -4,6 +4,7 @@ import anvil.server
 import anvil.tables as tables
 import anvil.tables.query as q
 from anvil.tables import app_tables
+from .. import session
 
 
 class block_sizes(block_sizesTemplate):
@@ -272,7 +273,8 @@ class block_sizes(block_sizesTemplate):
                 DP, overall_FA, A_blocks, B_blocks, molecules, strength, pattern,
                 efficiency, A_cutoff, DP_cutoff, ion_eff)
         data_blocks = anvil.server.call('block_sizes', DP, overall_FA, A_blocks, B_blocks, molecules, strength, pattern,
-                                        efficiency, A_cutoff, DP_cutoff, ion_eff)
+                                        efficiency, A_cutoff, DP_cutoff, ion_eff,
+                                        seed=session.SEED)
         # create plot and show options to download
         media_obj = anvil.server.call('make_blocks_plot',
                                       data_blocks,
@@ -4,6 +4,7 @@ import anvil.server
 import anvil.tables as tables
 import anvil.tables.query as q
 from anvil.tables import app_tables
+from .. import session
 
 
 class pattern_analysis(pattern_analysisTemplate):
@@ -204,7 +205,8 @@ class pattern_analysis(pattern_analysisTemplate):
             filename = "nmr_DP%s_FA0-1_mol%s_s%s_p%s" % (DP, molecules, strength, pattern)
         else:
             filename = "nmr_DP%s_FA%s_%sA_%sB_mol%s_s%s_p%s" % (DP, overall_FA, A_blocks, B_blocks, molecules, strength, pattern)
-        data_nmr = anvil.server.call('diads_triads', DP, overall_FA, A_blocks, B_blocks, molecules, strength, pattern)
+        data_nmr = anvil.server.call('diads_triads', DP, overall_FA, A_blocks, B_blocks, molecules, strength, pattern,
+                                     seed=session.SEED)
         # create plot and show options to download
         media_obj = anvil.server.call('make_PA_plot',
                                       data_nmr,
@@ -4,6 +4,7 @@ import anvil.server
 import anvil.tables as tables
 import anvil.tables.query as q
 from anvil.tables import app_tables
+from .. import session
 
 
 class product_profile(product_profileTemplate):
@@ -377,42 +378,20 @@ class product_profile(product_profileTemplate):
                                                                                                  molecules, FA_pattern,
                                                                                                  pattern, minus_specificity,
                                                                                                  plus_specificity, efficiency)
-                    data_profile = anvil.server.call('profile_FAp_molar_enzyme',
-                                                    DP, overall_FA,
-                                                    pattern, FA_pattern,
-                                                    A_blocks, B_blocks, molecules,
-                                                    minus_specificity,
-                                                    plus_specificity,
-                                                    efficiency)
                 else:
                     filename = "prof_enz_molar_DP%s_FA%s_%sA_%sB_mol%s_s%s_p%s_-%s_+%s_e%s" % (DP, overall_FA, A_blocks, B_blocks,
                                                                                             molecules, strength,
                                                                                             pattern, minus_specificity,
                                                                                             plus_specificity, efficiency)
-                    data_profile = anvil.server.call('profile_strength_molar_enzyme',
-                                                    DP, overall_FA,
-                                                    pattern, strength,
-                                                    A_blocks, B_blocks, molecules,
-                                                    minus_specificity,
-                                                    plus_specificity,
-                                                    efficiency)
             elif self.radio_button_nano2.selected == True:
                 if self.radio_button_FAp.selected == True:
                     filename = "prof_nano2_molar_DP%s_FA%s_%sA_%sB_mol%s_FAp%s_p%s_c%s" % (DP, overall_FA, A_blocks, B_blocks,
                                                                                             molecules, FA_pattern,
                                                                                             pattern, cuts)
-                    data_profile = anvil.server.call('profile_FAp_molar_nano2',
-                                                    DP, overall_FA,
-                                                    pattern, FA_pattern,
-                                                    A_blocks, B_blocks, molecules, cuts)
                 else:
                     filename = "prof_nano2_molar_DP%s_FA%s_%sA_%sB_mol%s_s%s_p%s_c%s" % (DP, overall_FA, A_blocks, B_blocks,
                                                                                             molecules, strength,
                                                                                             pattern, cuts)
-                    data_profile = anvil.server.call('profile_strength_molar_nano2',
-                                                    DP, overall_FA,
-                                                    pattern, strength,
-                                                    A_blocks, B_blocks, molecules, cuts)
         elif self.radio_button_weight_fraction.selected == True:
             y_label = "weight fraction"
             if self.radio_button_enzyme.selected == True:
@@ -421,46 +400,39 @@ class product_profile(product_profileTemplate):
                                                                                             A_blocks, B_blocks, molecules, FA_pattern,
                                                                                             pattern, minus_specificity,
                                                                                             plus_specificity, efficiency)
-                    data_profile = anvil.server.call('profile_FAp_weight_enzyme',
-                                                    DP, overall_FA,
-                                                    pattern, FA_pattern,
-                                                    A_blocks, B_blocks, molecules,
-                                                    minus_specificity,
-                                                    plus_specificity,
-                                                    efficiency,
-                                                    mass_A, mass_B)
                 else:
                     filename = "prof_enz_weight_DP%s_FA%s_%sA_%sB_mol%s_s%s_p%s_-%s_+%s_e%s" % (DP, overall_FA,
                                                                                             A_blocks, B_blocks, molecules, strength,
                                                                                             pattern, minus_specificity,
                                                                                             plus_specificity, efficiency)
-                    data_profile = anvil.server.call('profile_strength_weight_enzyme',
-                                                    DP, overall_FA,
-                                                    pattern, strength,
-                                                    A_blocks, B_blocks, molecules,
-                                                    minus_specificity,
-                                                    plus_specificity,
-                                                    efficiency,
-                                                    mass_A, mass_B)
             elif self.radio_button_nano2.selected == True:
                 if self.radio_button_FAp.selected == True:
                     filename = "profile_nano2_weight_DP%s_FA%s_%sA_%sB_mol%s_FAp%s_p%s_c%s" % (DP, overall_FA,
                                                                                             A_blocks, B_blocks, molecules, FA_pattern,
                                                                                             pattern, cuts)
-                    data_profile = anvil.server.call('profile_FAp_weight_nano2',
-                                                    DP, overall_FA,
-                                                    pattern, FA_pattern,
-                                                    A_blocks, B_blocks, molecules, cuts,
-                                                    mass_A, mass_B)
                 else:
                     filename = "prof_nano2_weight_DP%s_FA%s_%sA_%sB_mol%s_s%s_p%s_c%s" % (DP, overall_FA,
                                                                                             A_blocks, B_blocks, molecules, strength,
                                                                                             pattern, cuts)
-                    data_profile = anvil.server.call('profile_strength_weight_nano2',
-                                                    DP, overall_FA,
-                                                    pattern, strength,
-                                                    A_blocks, B_blocks, molecules, cuts,
-                                                    mass_A, mass_B)
+        # the same spec for all options and tabs, so that the server reuses the
+        # library and products of this session (see digest_outputs)
+        spec = {"DP": DP, "overall_FA": overall_FA, "pattern": pattern,
+                "A_blocks": A_blocks, "B_blocks": B_blocks,
+                "molecules": molecules, "seed": session.SEED}
+        if self.radio_button_FAp.selected == True:
+            spec["FA_pattern"] = FA_pattern
+        else:
+            spec["strength"] = strength
+        if self.radio_button_enzyme.selected == True:
+            spec["digestion"] = ["enzyme", minus_specificity,
+                                 plus_specificity, efficiency]
+        elif self.radio_button_nano2.selected == True:
+            spec["digestion"] = ["nano2", cuts]
+        if self.radio_button_weight_fraction.selected == True:
+            output = ["profile", mass_A, mass_B]
+        else:
+            output = ["profile"]
+        data_profile = anvil.server.call('digest_outputs', spec, [output])[0]
         # create plot and show options to download
         media_obj = anvil.server.call('make_profile',
                                       data_profile,
@@ -1,11 +1,23 @@
 import anvil.server
 import anvil.media
-import random
 import numpy as np
-import re
 import math
-from sys import exit
 from collections import Counter
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import time
+import zipfile
+from multiprocessing import shared_memory
+try:
+    import numba
+except ImportError:
+    numba = None
 import matplotlib.pyplot as plt
 import anvil.mpl_util
 import pandas as pd
@@ -16,175 +28,125 @@ import pandas as pd
 # To allow anvil.server.call() to call functions here, we mark
 # them with @anvil.server.callable.
 
-#### GENERAL FUNCTIONS ####
+#### RANDOM NUMBERS ####
 
-def chitosan_generator(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks):
-    """Generates one chitosan molecule of either...
-    A) a specific DP and overall FA. If the given FA_pattern equals the given
-    overall FA, the chitosan molecule features a random PA. Otherwise, every
-    nth unit (n = pattern) features either an overrepresentation of A-units
-    (FA_pattern > FA) or of B-units (FA_pattern < FA).
-    B) a specific DP and exactly defined blocks of A- and B-units, e.g. always
-    3 As followed by always 2 Bs. It is chosen at random whether the molecule
-    starts with an A- or B-block.
+# All random numbers are drawn from numpy Generators (PCG64). A simulation is
+# defined by one seed, from which independent streams are derived for the
+# generation and the digestion of the library, and within each stream one
+# substream per chunk of CHUNK_MOLECULES molecules. Results therefore do not
+# depend on how many workers process the chunks. Within a chunk, the random
+# numbers of each stream are drawn in the order of the molecules, so neither
+# do they depend on how the chunk is split into batches (see MEMORY_LIMIT).
+CHUNK_MOLECULES = 256
+GENERATE_STREAM = 0
+DIGEST_STREAM = 1
+# the number of cuts of a digestion (see digest_library)
+CUT_STREAM = 2
+# all points of an FA sweep use the same random numbers (common random
+# numbers), so that differences between the points are not hidden by noise
+SWEEP_STREAM = (0,)
 
-    returns chitosan molecule in format: ["B", "A", "B", "B", "A", ...]"""
 
-    # OPTION A: specific FA and pattern
-    if A_blocks == 0 and B_blocks == 0:
-        # calculate FA_non_pattern of all residues that are not part of pattern
-        pattern_spaces = int(np.ceil(DP / pattern))
-        non_pattern_spaces = DP - pattern_spaces
-        proportion_pattern = pattern_spaces / DP
-        proportion_non_pattern = non_pattern_spaces / DP
-        FA_non_pattern = ((overall_FA - proportion_pattern * FA_pattern) /
-                          proportion_non_pattern)
-        if FA_non_pattern < 0:
-            print("ERROR: combination of overall_FA, FA_pattern and pattern not \
-    sensible!")
-            exit()
-        # generate A/B-sequence lists for residues that are (not) part of pattern
-        pattern_list = ["A" if random.choices(["A", "B"],
-                                              [FA_pattern,
-                                              1 - FA_pattern])
-                        == ["A"]
-                        else "B" for i in range(int(pattern_spaces))]
-        non_pattern_list = ["A" if random.choices(["A", "B"],
-                                                  [FA_non_pattern,
-                                                  1 - FA_non_pattern])
-                            == ["A"]
-                            else "B" for i in range(int(non_pattern_spaces))]
-        # insert pattern sequence into non-pattern sequence at every nth product
-        nth_index = list(range(0, DP, pattern))
-        position_pattern_list = 0
-        for position in nth_index:
-            non_pattern_list.insert(position, pattern_list[position_pattern_list])
-            position_pattern_list += 1
-        final_molecule = non_pattern_list
+def resolve_seed(seed):
+    """Returns the given seed, or a new random seed if seed is None, so that
+    all streams of one simulation are derived from the same seed."""
+
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    return seed
+
+
+def molecule_chunks(number_molecules):
+    """Splits the molecule indices of a library into chunks of
+    CHUNK_MOLECULES molecules.
+
+    returns list of ranges: [range(0, 256), range(256, 512), ...]"""
+
+    return [range(start, min(start + CHUNK_MOLECULES, number_molecules))
+            for start in range(0, number_molecules, CHUNK_MOLECULES)]
+
+
+def chunk_rngs(seed, number_molecules, *stream):
+    """Creates one random number generator per chunk of molecules (see
+    molecule_chunks) for a given seed and stream, e.g. (DIGEST_STREAM,).
+
+    returns list of numpy Generators: [rng_chunk1, rng_chunk2, ...]"""
+
+    sequence = np.random.SeedSequence(resolve_seed(seed), spawn_key=stream)
+    children = sequence.spawn(len(molecule_chunks(number_molecules)))
+    return [np.random.Generator(np.random.PCG64(child)) for child in children]
 
-    # OPTION B: specific A- and B-blocks
-    else:
-        block_polymer = []
-        A_seq = ["A"] * A_blocks
-        B_seq = ["B"] * B_blocks
-        A_or_B = random.choices(["A", "B"], [0.5, 0.5])
-        if A_or_B == ["A"]:
-            block_polymer.extend(A_seq)
-        elif A_or_B == ["B"]:
-            block_polymer.extend(B_seq)
-        while len(block_polymer) < DP:
-            if block_polymer[-1] == "A":
-                block_polymer.extend(B_seq)
-            elif block_polymer[-1] == "B":
-                block_polymer.extend(A_seq)
-        final_molecule = block_polymer[0:DP]
-    return final_molecule
-
-
-def chitosan_library(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks,
-    number_molecules):
-    """Generates library containing a given number of chitosan molecules
-    created via chitosan_generator.
-
-    returns chitosan library: ["molecule1", "molecule2", ...] with molecule1
-    e.g. = "BABBBAAB" """
-
-    library = []
-    for i in range(0, number_molecules):
-        molecule = "".join(chitosan_generator(DP, overall_FA, pattern,
-                                              FA_pattern, A_blocks, B_blocks))
-        library.append(molecule)
-    return library
 
+#### GENERAL FUNCTIONS ####
 
-def enzyme(substrate, minus_specificity, plus_specificity, efficiency):
+def enzyme(substrate, minus_specificity, plus_specificity, efficiency,
+           rng=None, sites=None):
     """Simulates cleavage of an individual chitosan molecule (given as string)
     by an enzyme of given specificity. The plus and minus specificities always
     consist of three characters, e.g. AAA, ABB, AXX, AB., ...
     with A = unit A, B = unit B, X = A or B but subsite needs to be
     occupied, . = A or B or unoccupied.
+    Random numbers are drawn from rng (numpy Generator, new one if None).
+    The cleavage sites can be given if they are already known (see
+    enzyme_sites). The molecule is cleaved via enzyme_cuts and
+    partial_cuts, the products at both chain ends are not returned.
 
     returns a list of products: [product1, product2, ...]"""
 
-    minus = [*minus_specificity]
-    minus = ["[^-]" if pref == "X" else pref for pref in minus]
-    minus = ["." if pref == "_" else pref for pref in minus]
-    plus = [*plus_specificity]
-    plus = ["[^-]" if pref == "X" else pref for pref in plus]
-    plus = ["." if pref == "_" else pref for pref in plus]
-    clvg_yn = (True, False)
-    clvg_prob = [efficiency, 1-efficiency]
-    product_list = []
-    dig_substrate = [*substrate]
-    clvg_idx_list = []
+    if rng is None:
+        rng = np.random.default_rng()
+    table = specificity_table(minus_specificity, plus_specificity)
+    monomers = molecule_array(substrate)
+    offsets = np.array([0, len(monomers)])
     # identify potential cleavage sites and their indices
-    for idx, monomer in enumerate(dig_substrate[:-5]):
-        if re.match(minus[0], dig_substrate[idx]) and \
-           re.match(minus[1], dig_substrate[idx + 1]) and \
-           re.match(minus[2], dig_substrate[idx + 2]) and \
-           re.match(plus[0], dig_substrate[idx + 3]) and \
-           re.match(plus[1], dig_substrate[idx + 4]) and \
-           re.match(plus[2], dig_substrate[idx + 5]):
-            clvg_idx_list.append(idx)
-    # shuffle to simulate random endo-cleavage of enzyme
-    random.shuffle(clvg_idx_list)
-    # cleave at identified sites if former cut did not destroy cleavage site
-    for clvg_no in range(len(clvg_idx_list)):
-        if re.match(minus[0], dig_substrate[clvg_idx_list[clvg_no]]) and \
-           re.match(minus[1], dig_substrate[clvg_idx_list[clvg_no] + 1]) and \
-           re.match(minus[2], dig_substrate[clvg_idx_list[clvg_no] + 2]) and \
-           re.match(plus[0], dig_substrate[clvg_idx_list[clvg_no] + 3]) and \
-           re.match(plus[1], dig_substrate[clvg_idx_list[clvg_no] + 4]) and \
-           re.match(plus[2], dig_substrate[clvg_idx_list[clvg_no] + 5]):
-            dig_substrate.insert(clvg_idx_list[clvg_no] + 3, "-")
-            clvg_idx_list = [clvg_idx + 1 if (
-                clvg_idx > clvg_idx_list[clvg_no]) else
-                clvg_idx for clvg_idx in clvg_idx_list]
-    dig_substrate_str = "".join(dig_substrate)
-    dig_substrate_list = dig_substrate_str.split("-")
+    if sites is None:
+        sites = find_sites(monomers, offsets, table)
+    sites = np.asarray(sites, dtype=np.int64)
+    # random priorities simulate random endo-cleavage of enzyme
+    cut = enzyme_cuts(monomers, offsets, sites, table,
+                      rng.random(len(sites)))
     # implement efficiency < 1 by putting products back together
-    partial_dig_sub_list = [dig_substrate_list[0]]
-    for product in dig_substrate_list[1:]:
-        if random.choices(clvg_yn, weights=clvg_prob) == [True]:
-            partial_dig_sub_list.append(product)
-        else:
-            partial_dig_sub_list[-1] = partial_dig_sub_list[-1]+product
-    for product in range(1, len(partial_dig_sub_list)-1):
-        product_list.append(partial_dig_sub_list[product])
-    return product_list
+    cut = partial_cuts(cut, efficiency, rng)
+    _, starts, ends = cut_products(offsets, cut, True)
+    return [substrate[start:end] for start, end in zip(starts.tolist(),
+                                                        ends.tolist())]
+
+
+def enzyme_sites(substrate, minus_specificity, plus_specificity):
+    """Identifies all potential cleavage sites of an enzyme (see enzyme) in an
+    uncleaved chitosan molecule (given as string).
+
+    returns list of site indices (index of the first unit of the 6 subsites):
+    [idx1, idx2, ...]"""
+
+    monomers = molecule_array(substrate)
+    offsets = np.array([0, len(monomers)])
+    table = specificity_table(minus_specificity, plus_specificity)
+    return find_sites(monomers, offsets, table).tolist()
 
 
-def nano2(substrate, cuts):
+def nano2(substrate, cuts, rng=None, cut_distribution="fixed"):
     """Simulates cleavage of an individual chitosan molecule (given as string)
     using sodium nitrite (NaNO3) that cleaves after each B-unit
+    Random numbers are drawn from rng (numpy Generator, new one if None).
+    The number of cuts is limited by cuts (see nano2_cut_counts for other
+    cut distributions). The molecule is cleaved via nano2_cuts.
 
     returns a list of products: [product1, product2, ...]"""
 
-    product_list = []
-    dig_substrate = [*substrate]
-    clvg_idx_list = []
+    if rng is None:
+        rng = np.random.default_rng()
+    monomers = molecule_array(substrate)
+    offsets = np.array([0, len(monomers)])
     # identify potential cleavage sites and their indices
-    for idx, monomer in enumerate(dig_substrate[:-1]):
-        if re.match("B", dig_substrate[idx]) and \
-           re.match(".", dig_substrate[idx + 1]):
-            clvg_idx_list.append(idx)
-    # shuffle to simulate random endo-cleavage
-    random.shuffle(clvg_idx_list)
-    # cleave at identified sites if former cut did not destroy cleavage site
-    for clvg_no in range(len(clvg_idx_list)):
-        if cuts > 0:
-            if re.match("B", dig_substrate[clvg_idx_list[clvg_no]]) and \
-               re.match(".", dig_substrate[clvg_idx_list[clvg_no] + 1]):
-                dig_substrate.insert(clvg_idx_list[clvg_no] + 1, "-")
-                clvg_idx_list = [clvg_idx + 1 if (
-                    clvg_idx > clvg_idx_list[clvg_no]) else
-                    clvg_idx for clvg_idx in clvg_idx_list]
-                cuts -= 1
-        else:
-            break
-    product_str = "".join(dig_substrate)
-    product_list = product_str.split("-")
-    return product_list
+    sites = nano2_sites(monomers, offsets)
+    # random priorities simulate random endo-cleavage
+    priorities = rng.random(len(sites))
+    cut_counts = nano2_cut_counts(offsets, sites, cuts, cut_distribution, rng)
+    cut = nano2_cuts(monomers, offsets, sites, cut_counts, priorities)
+    _, starts, ends = cut_products(offsets, cut, False)
+    return [substrate[start:end] for start, end in zip(starts.tolist(),
+                                                        ends.tolist())]
 
 
 def FA_pattern_calc(overall_FA, pattern, strength):
@@ -223,31 +185,12 @@ def calc_DP(oligomer):
     return sum + int(temp)
 
 
-def diads_PA(library):
-    """Determines diad frequencies (AA, AB, BA and BB) and calculates the PA
-    value for a given library.
+def diad_fractions(AA, AB, BA, BB):
+    """Calculates diad frequencies and the PA value from diad counts.
 
     returns respective values in a list: [AA, AB, BA, BB, PA]"""
 
-    # count diads
-    AA = 0
-    AB = 0
-    BA = 0
-    BB = 0
-    for molecule in library:
-        for idx, monomer in enumerate(molecule[:-1]):
-            if monomer == "A":
-                if molecule[idx + 1] == "A":
-                    AA += 1
-                elif molecule[idx + 1] == "B":
-                    AB += 1
-            elif monomer == "B":
-                if molecule[idx + 1] == "A":
-                    BA += 1
-                elif molecule[idx + 1] == "B":
-                    BB += 1
     sum_all_diads = AA + AB + BA + BB
-    # calculate diad frequencies
     F_AA = AA / sum_all_diads
     F_BB = BB / sum_all_diads
     F_BA = BA / sum_all_diads
@@ -255,61 +198,17 @@ def diads_PA(library):
     F_AB_BA = (AB + BA) / sum_all_diads
     # calculate PA value based on Kumirska et al. (2009)
     PA = F_AB_BA / (2 * F_AA + F_AB_BA) + F_AB_BA / (2 * F_BB + F_AB_BA)
-    output = [F_AA, F_AB, F_BA, F_BB, PA]
-    return output
+    return [F_AA, F_AB, F_BA, F_BB, PA]
 
 
-def triads(library):
-    """Determines triad frequencies (AAA, AAB, BAA, ABA, ABB, BBA, BAB, BBB)
-    and calculates their fractions for a given chitosan library.
+def triad_fractions(triad_counts):
+    """Calculates triad frequencies from triad counts given in the order
+    [AAA, AAB, BAA, ABA, ABB, BBA, BAB, BBB].
 
     returns values in list: [AAA, AAB, BAA, ABA, ABB, BBA, BAB, BBB]"""
 
-    # count triads
-    AAA = 0
-    AAB = 0
-    BAA = 0
-    ABA = 0
-    ABB = 0
-    BBA = 0
-    BAB = 0
-    BBB = 0
-    for molecule in library:
-        for idx, monomer in enumerate(molecule[:-2]):
-            if monomer == "A":
-                if molecule[idx + 1] == "A":
-                    if molecule[idx + 2] == "A":
-                        AAA += 1
-                    elif molecule[idx + 2] == "B":
-                        AAB += 1
-                elif molecule[idx + 1] == "B":
-                    if molecule[idx + 2] == "A":
-                        ABA += 1
-                    elif molecule[idx + 2] == "B":
-                        ABB += 1
-            elif monomer == "B":
-                if molecule[idx + 1] == "A":
-                    if molecule[idx + 2] == "A":
-                        BAA += 1
-                    elif molecule[idx + 2] == "B":
-                        BAB += 1
-                elif molecule[idx + 1] == "B":
-                    if molecule[idx + 2] == "A":
-                        BBA += 1
-                    elif molecule[idx + 2] == "B":
-                        BBB += 1
-    sum_all_triads = AAA + AAB + BAA + ABA + ABB + BBA + BAB + BBB
-    # calculate triad frequencies
-    F_AAA = AAA / sum_all_triads
-    F_AAB = AAB / sum_all_triads
-    F_BAA = BAA / sum_all_triads
-    F_ABA = ABA / sum_all_triads
-    F_ABB = ABB / sum_all_triads
-    F_BBA = BBA / sum_all_triads
-    F_BAB = BAB / sum_all_triads
-    F_BBB = BBB / sum_all_triads
-    output = [F_AAA, F_AAB, F_BAA, F_ABA, F_ABB, F_BBA, F_BAB, F_BBB]
-    return output
+    sum_all_triads = sum(triad_counts)
+    return [count / sum_all_triads for count in triad_counts]
 
 
 def blocks(product_list, A_cutoff, DP_cutoff, ion_eff):
@@ -325,344 +224,2976 @@ def blocks(product_list, A_cutoff, DP_cutoff, ion_eff):
 
     returns block_sizes: (block_An, block_Bn, block_Aw, block_Bw)"""
 
-    # remove products bigger than DP_cutoff and with more As than A_cutoff
-    a_b_tuple_list = []
-    if A_cutoff == False and DP_cutoff == False:
-        for oligomer in product_list:
-            a_b_tuple_list.append((oligomer.count("A"), oligomer.count("B")))
-    elif A_cutoff != False and DP_cutoff == False:
-        for oligomer in product_list:
-            if oligomer.count("A") <= A_cutoff:
-                a_b_tuple_list.append((oligomer.count("A"), oligomer.count("B")))
-    elif A_cutoff == False and DP_cutoff != False:
-        for oligomer in product_list:
-            if len(oligomer) <= DP_cutoff:
-                a_b_tuple_list.append((oligomer.count("A"), oligomer.count("B")))
-    elif A_cutoff != False and DP_cutoff != False:
-        for oligomer in product_list:
-            if len(oligomer) <= DP_cutoff and oligomer.count("A") <= A_cutoff:
-                a_b_tuple_list.append((oligomer.count("A"), oligomer.count("B")))
     # create dictionary with numbers of each chitinosanase product
-    product_dict = dict(Counter(a_b_tuple_list))
+    product_dict = Counter((oligomer.count("A"), oligomer.count("B"))
+                           for oligomer in product_list)
+    compositions = (np.array([product[0] for product in product_dict],
+                             dtype=np.int64),
+                    np.array([product[1] for product in product_dict],
+                             dtype=np.int64),
+                    np.array(list(product_dict.values()), dtype=float))
+    return composition_blocks(compositions, A_cutoff, DP_cutoff, ion_eff)
+
+
+def ion_efficiency(lengths):
+    """Relative ionization efficiency of products of a given DP in MS.
+
+    returns array of factors per DP"""
+
+    return np.select([lengths > 8, lengths > 4, lengths == 4, lengths == 2],
+                     [0.2, 0.35, 0.65, 0.3], 1.0)
+
+
+def composition_blocks(compositions, A_cutoff, DP_cutoff, ion_eff):
+    """Same as blocks, but for products that were already counted per
+    composition (see composition_matrix): (A_counts, B_counts, counts)
+
+    returns block_sizes: (block_An, block_Bn, block_Aw, block_Bw)"""
+
+    A_counts, B_counts, counts = compositions
+    lengths = A_counts + B_counts
+    # remove products bigger than DP_cutoff and with more As than A_cutoff
+    keep = np.ones(len(counts), dtype=bool)
+    if A_cutoff != False:
+        keep &= A_counts <= A_cutoff
+    if DP_cutoff != False:
+        keep &= lengths <= DP_cutoff
+    A_counts, B_counts, lengths, counts = (A_counts[keep], B_counts[keep],
+                                           lengths[keep], counts[keep])
     # if applicable: consider different ionization efficiencies per DP
     if ion_eff:
-        for product in product_dict:
-            if sum(product) == 2:
-                product_dict[product] *= 0.3
-            elif sum(product) == 3:
-                product_dict[product] *= 1.0
-            elif sum(product) == 4:
-                product_dict[product] *= 0.65
-            elif sum(product) > 4 and sum(product) <= 8:
-                product_dict[product] *= 0.35
-            elif sum(product) > 8:
-                product_dict[product] *= 0.2
-    # calculate block-sizes, product[0] = number As, product[1] = number Bs
-    block_An = 0
-    block_Bn = 0
-    Aw_sum = 0
-    Bw_sum = 0
-    DP_sum = 0
-    sum_all_products = sum(product_dict.values())
-    for product in product_dict:
-        rel_abundance_product = (product_dict[product] /
-                                 sum_all_products)
-        product_DP = sum(product)
-        block_An += product[0] * rel_abundance_product
-        block_Bn += product[1] * rel_abundance_product
-        Aw_sum += product[0] * rel_abundance_product * product_DP
-        Bw_sum += product[1] * rel_abundance_product * product_DP
-        DP_sum += rel_abundance_product * product_DP
-    block_Aw = Aw_sum/DP_sum
-    block_Bw = Bw_sum/DP_sum
+        counts = counts * ion_efficiency(lengths)
+    # calculate block-sizes
+    rel_abundance = counts / counts.sum()
+    block_An = float(np.sum(A_counts * rel_abundance))
+    block_Bn = float(np.sum(B_counts * rel_abundance))
+    DP_sum = np.sum(rel_abundance * lengths)
+    block_Aw = float(np.sum(A_counts * rel_abundance * lengths) / DP_sum)
+    block_Bw = float(np.sum(B_counts * rel_abundance * lengths) / DP_sum)
     block_sizes = [block_An, block_Bn, block_Aw, block_Bw]
     return block_sizes
 
 
-#### DP HISTOGRAM ####
+#### ENGINE REGISTRY ####
+
+# Some operations have several implementations (engines), e.g. NumPy and
+# Numba kernels, or expected and simulated products. Each engine declares the
+# features of a request it supports (see library_features and
+# digestion_features), and a request is passed to the usable engines in turn
+# until one returns a result (see run_engine). Among interchangeable engines
+# the one that was fastest for a library of about the size of the request
+# goes first, as timed by EngineTuner once the module is loaded (see
+# ENGINE_WARM_UP, otherwise on the first request) and saved for later
+# sessions.
+
+# file with the timings of the engines (None: time them in every session)
+ENGINE_CALIBRATION_FILE = os.path.join(tempfile.gettempdir(),
+                                       "lcp_simulator_engines.json")
+# library sizes (DP, molecules) the engines are timed for
+CALIBRATION_SIZES = ((100, 16), (100, 256), (1000, 256))
+# timings per engine and size, of which the fastest counts
+CALIBRATION_REPEATS = 3
+# version of the benchmarks, saved timings of other versions are discarded
+CALIBRATION_VERSION = 2
+# time the engines in a background thread once the module is loaded, so that
+# the first request does not wait for it
+ENGINE_WARM_UP = True
+
+
+class Engine:
+    """One implementation (function) of an operation. It supports requests
+    with the given features (all if features is None), is only used for
+    requests with all features in requires (e.g. "expected") and only if
+    available() is true (if given), e.g. if an optional package is
+    installed. The function returns None for requests it cannot handle after
+    all, which are passed to the next engine."""
+
+    def __init__(self, name, function, features=None, requires=(),
+                 available=None):
+        self.name = name
+        self.function = function
+        self.features = None if features is None else frozenset(features)
+        self.requires = frozenset(requires)
+        self.available = available
+
+    def usable(self, features):
+        """Checks whether the engine can handle a request with the given
+        features."""
+
+        features = frozenset(features)
+        if self.features is not None and not features <= self.features:
+            return False
+        if not self.requires <= features:
+            return False
+        return self.available is None or bool(self.available())
+
+
+# features of all requests that can be simulated, i.e. all but "expected"
+SIMULATED_FEATURES = frozenset({"option A", "option B", "markov",
+                                "polydisperse", "enzyme", "nano2",
+                                "efficiency < 1", "wildcard specificities",
+                                "random cut counts"})
+# engines per operation in order of registration, and per operation with
+# interchangeable engines the arguments and features of its benchmark
+ENGINES = {}
+BENCHMARKS = {}
+
+
+def register_engine(operation, engine):
+    """Adds an engine (see Engine) for an operation, e.g. "digest".
+
+    returns the engine"""
+
+    ENGINES.setdefault(operation, []).append(engine)
+    return engine
+
+
+def register_benchmark(operation, arguments, features=()):
+    """Declares that the engines of an operation give the same results, so
+    that the fastest one can be used (see EngineTuner). arguments(DP,
+    molecules) returns the arguments of a request for a library of that
+    size, with the given features."""
+
+    BENCHMARKS[operation] = (arguments, frozenset(features))
+
+
+def benchmark_library(DP, molecules):
+    """Random library as flat monomers and offsets (see flat_library) for
+    the benchmarks of the engines, the same in every session.
+
+    returns (monomers, offsets)"""
+
+    rng = np.random.default_rng(0)
+    monomers = (rng.random(DP * molecules) < 0.5).view(np.uint8)
+    return monomers, np.arange(0, DP * molecules + 1, DP)
+
+
+class EngineTuner:
+    """Timings of the engines of each operation with a benchmark (see
+    register_benchmark) for the library sizes in CALIBRATION_SIZES. They are
+    read from path (if given) on first use, and engines that are usable but
+    not timed yet (e.g. once Numba is installed) are timed and saved to
+    path. The first use is a background thread at import if ENGINE_WARM_UP
+    is set."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.timings = None
+        self.lock = threading.RLock()
+        self.calibrating = False
+
+    def load(self):
+        try:
+            with open(self.path) as file:
+                stored = json.load(file)
+            if (stored.get("version") == CALIBRATION_VERSION and
+                    stored["sizes"] == [list(size)
+                                        for size in CALIBRATION_SIZES]):
+                return stored["timings"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def save(self):
+        try:
+            temporary = "%s.%s.tmp" % (self.path, os.getpid())
+            with open(temporary, "w") as file:
+                json.dump({"version": CALIBRATION_VERSION,
+                           "sizes": CALIBRATION_SIZES,
+                           "timings": self.timings}, file)
+            os.replace(temporary, self.path)
+        except OSError:
+            pass
+
+    def untimed(self):
+        """Operations with several usable engines of which one has not been
+        timed yet."""
+
+        untimed = []
+        for operation, (arguments, features) in BENCHMARKS.items():
+            usable = [engine.name for engine in ENGINES.get(operation, [])
+                      if engine.usable(features)]
+            timed = self.timings.get(operation, {})
+            if len(usable) > 1 and any(name not in timed for name in usable):
+                untimed.append(operation)
+        return untimed
+
+    def calibrate(self, operations):
+        """Times all usable engines of the given operations for each size,
+        the first call of each engine not counting (e.g. compilation)."""
+
+        for operation in operations:
+            arguments, features = BENCHMARKS[operation]
+            timings = {}
+            for DP, molecules in CALIBRATION_SIZES:
+                request = arguments(DP, molecules)
+                for engine in ENGINES[operation]:
+                    if not engine.usable(features):
+                        continue
+                    engine.function(*request)
+                    seconds = []
+                    for _ in range(CALIBRATION_REPEATS):
+                        start = time.perf_counter()
+                        engine.function(*request)
+                        seconds.append(time.perf_counter() - start)
+                    timings.setdefault(engine.name, []).append(min(seconds))
+            # later benchmarks already use the fastest engines of this one
+            self.timings[operation] = timings
+
+    def current(self):
+        """Timings of all engines, timing untimed ones first.
+
+        returns {operation: {engine name: [seconds per size]}}"""
+
+        with self.lock:
+            if self.calibrating:
+                return self.timings
+            if self.timings is None:
+                stored = self.load() if self.path is not None else None
+                self.timings = stored or {}
+            untimed = self.untimed()
+            if untimed:
+                self.calibrating = True
+                try:
+                    self.calibrate(untimed)
+                finally:
+                    self.calibrating = False
+                if self.path is not None:
+                    self.save()
+            return self.timings
+
+    def seconds(self, operation, units):
+        """Timings of the engines of an operation for the calibrated size
+        closest to units (DP * molecules).
+
+        returns {engine name: seconds}"""
+
+        timings = self.current().get(operation, {})
+        sizes = [math.log(DP * molecules)
+                 for DP, molecules in CALIBRATION_SIZES]
+        closest = int(np.argmin([abs(size - math.log(max(units, 1)))
+                                 for size in sizes]))
+        return {name: seconds[closest] for name, seconds in timings.items()}
+
+
+ENGINE_TUNER = EngineTuner(ENGINE_CALIBRATION_FILE)
+
+
+def engines_for(operation, features=(), units=None):
+    """Finds the engines of an operation that can handle a request with the
+    given features: those requiring one of its features (e.g. expected
+    products) first, then the fastest for a library of units units
+    (DP * molecules, see EngineTuner), otherwise in order of registration.
+
+    returns list of engines"""
+
+    engines = [engine for engine in ENGINES.get(operation, [])
+               if engine.usable(features)]
+    seconds = {}
+    if units is not None and operation in BENCHMARKS and len(engines) > 1:
+        seconds = ENGINE_TUNER.seconds(operation, units)
+    return sorted(engines, key=lambda engine: (
+        not engine.requires, seconds.get(engine.name, math.inf)))
+
+
+def run_engine(operation, features, *arguments, units=None, **keywords):
+    """Passes a request with the given features to the engines of an
+    operation (see engines_for) until one returns a result. Raises
+    ValueError if none can, e.g. for expected results that are not known
+    exactly.
+
+    returns result of the engine"""
+
+    for engine in engines_for(operation, features, units):
+        result = engine.function(*arguments, **keywords)
+        if result is not None:
+            return result
+    raise ValueError("%s is not available for %s" %
+                     (operation, ", ".join(sorted(features))))
+
+
+def library_features(A_blocks, B_blocks, polydispersity=None, PA=None):
+    """Features of a library request for the engines (see Engine): "option A"
+    or "option B" (see chitosan_chunk_array), "markov" with a PA and
+    "polydisperse" with a polydispersity.
+
+    returns set of features"""
+
+    features = {"option A" if A_blocks == 0 and B_blocks == 0 else "option B"}
+    if PA is not None:
+        features.add("markov")
+    if polydispersity is not None:
+        features.add("polydisperse")
+    return features
+
+
+def digestion_features(digestion):
+    """Features of a digestion (see digest_library) for the engines (see
+    Engine): "enzyme" or "nano2", "efficiency < 1" for an enzyme that only
+    cleaves part of its sites, "wildcard specificities" for an enzyme with X,
+    _ or . in its specificities and "random cut counts" for NaNO2 with a
+    cut_distribution other than "fixed".
+
+    returns set of features"""
+
+    features = {digestion[0]}
+    if digestion[0] == "enzyme":
+        minus_specificity, plus_specificity, efficiency = digestion[1:]
+        if 0 < efficiency < 1:
+            features.add("efficiency < 1")
+        if set(minus_specificity + plus_specificity) & {"X", "_", "."}:
+            features.add("wildcard specificities")
+    elif len(digestion) > 2 and digestion[2] != "fixed":
+        features.add("random cut counts")
+    return features
+
+
+@anvil.server.callable
+def engine_timings():
+    """Timings of the interchangeable engines (see EngineTuner).
+
+    returns {operation: {engine name: [seconds per size in
+    CALIBRATION_SIZES]}}"""
+
+    return ENGINE_TUNER.current()
+
+
+#### LIBRARY ARRAYS ####
+
+# unit B is encoded as 0 and unit A as 1 in all library arrays
+MONOMER_LETTERS = np.frombuffer(b"BA", dtype=np.uint8)
+# upper limit (in bytes) for the molecules generated and digested at once
+MEMORY_LIMIT = 256 * 2**20
+# estimated memory per unit while generating (one float64 random number and
+# the array) and digesting (molecule and product strings) a library
+BYTES_PER_UNIT = 16
+# products up to this number of As and Bs are counted in a dense composition
+# matrix, longer ones per occurring composition (see composition_matrix)
+DENSE_COMPOSITION_UNITS = 2048
+COMPOSITION_KEY = 2**32
+
+
+def position_FA(DP, overall_FA, pattern, FA_pattern):
+    """Calculates the probability of unit A at each position of a molecule
+    generated via option A of chitosan_chunk_array: FA_pattern at every nth
+    position (n = pattern, starting with the first unit) and FA_non_pattern
+    at all other positions. Raises ValueError if the other positions cannot
+    make up the overall FA.
+
+    returns array of length DP: [FA_pattern, FA_non_pattern, ...]"""
+
+    pattern_spaces = int(np.ceil(DP / pattern))
+    non_pattern_spaces = DP - pattern_spaces
+    proportion_pattern = pattern_spaces / DP
+    proportion_non_pattern = non_pattern_spaces / DP
+    if non_pattern_spaces == 0:
+        FA_non_pattern = overall_FA
+    else:
+        FA_non_pattern = ((overall_FA - proportion_pattern * FA_pattern) /
+                          proportion_non_pattern)
+    if FA_non_pattern < 0:
+        raise ValueError("combination of overall_FA, FA_pattern and pattern "
+                         "not sensible")
+    FA_per_position = np.full(DP, FA_non_pattern)
+    FA_per_position[::pattern] = FA_pattern
+    return FA_per_position
+
+
+def chitosan_library_array(DP, overall_FA, pattern, FA_pattern, A_blocks,
+                           B_blocks, number_molecules, seed=None,
+                           stream=(GENERATE_STREAM,), PA=None):
+    """Generates a library of chitosan molecules via chitosan_chunk_array, one
+    chunk of CHUNK_MOLECULES molecules at a time, each chunk with its own
+    random number generator (see chunk_rngs).
+
+    returns chitosan library as array of shape (number_molecules, DP) with
+    unit A = 1 and unit B = 0"""
+
+    batches = list(library_batches(DP, overall_FA, pattern, FA_pattern,
+                                   A_blocks, B_blocks, number_molecules, seed,
+                                   stream, PA=PA))
+    if not batches:
+        return np.zeros((0, DP), dtype=np.uint8)
+    return np.concatenate(batches)
+
+
+def batch_molecules(DP, memory_limit=None):
+    """Calculates how many molecules of a given DP can be generated and
+    digested at once without exceeding memory_limit (MEMORY_LIMIT if None).
+
+    returns number of molecules per batch (at least 1)"""
+
+    if memory_limit is None:
+        memory_limit = MEMORY_LIMIT
+    return max(1, int(memory_limit // (DP * BYTES_PER_UNIT)))
+
+
+def library_batches(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks,
+                    number_molecules, seed=None, stream=(GENERATE_STREAM,),
+                    memory_limit=None, PA=None, merge_chunks=True,
+                    chunks=None):
+    """Generates the same library as chitosan_library_array in consecutive
+    batches of at most batch_molecules molecules, so that the whole library
+    is never held in memory. Batches can span several chunks (unless
+    merge_chunks is False), and chunks are split into several batches for
+    large DP (the random numbers of a chunk are drawn in the same order
+    either way). If chunks is given (e.g. range(2, 4)), only the chunks
+    with these indices are generated.
+
+    yields library arrays of shape (molecules in batch, DP)"""
+
+    max_molecules = batch_molecules(DP, memory_limit)
+    batch = []
+    molecules_in_batch = 0
+    rngs = chunk_rngs(seed, number_molecules, *stream)
+    for idx, (chunk, rng) in enumerate(zip(molecule_chunks(number_molecules),
+                                           rngs)):
+        if chunks is not None and idx not in chunks:
+            continue
+        if A_blocks == 0 and B_blocks == 0:
+            pieces = (chitosan_chunk_array(DP, overall_FA, pattern,
+                                           FA_pattern, A_blocks, B_blocks,
+                                           min(max_molecules,
+                                               len(chunk) - start),
+                                           rng, PA)
+                      for start in range(0, len(chunk), max_molecules))
+        else:
+            # block molecules need no memory besides the library array itself
+            chunk_array = chitosan_chunk_array(DP, overall_FA, pattern,
+                                               FA_pattern, A_blocks, B_blocks,
+                                               len(chunk), rng)
+            pieces = (chunk_array[start:start + max_molecules]
+                      for start in range(0, len(chunk), max_molecules))
+        for piece in pieces:
+            batch.append(piece)
+            molecules_in_batch += len(piece)
+            if molecules_in_batch >= max_molecules or not merge_chunks:
+                yield np.concatenate(batch)
+                batch = []
+                molecules_in_batch = 0
+    if batch:
+        yield np.concatenate(batch)
+
+
+def chitosan_chunk_array(DP, overall_FA, pattern, FA_pattern, A_blocks,
+                         B_blocks, number_molecules, rng, PA=None):
+    """Generates chitosan molecules of either...
+    A) a specific DP and overall FA. If the given FA_pattern equals the given
+    overall FA, the chitosan molecule features a random PA. Otherwise, every
+    nth unit (n = pattern) features either an overrepresentation of A-units
+    (FA_pattern > FA) or of B-units (FA_pattern < FA). Each unit is A if its
+    uniform random number is below the probability of unit A at its
+    position (see position_FA).
+    B) a specific DP and exactly defined blocks of A- and B-units, e.g. always
+    3 As followed by always 2 Bs. It is chosen at random whether the molecule
+    starts with an A- or B-block (see block_template).
+    If a PA is given (and no blocks), the molecules are instead generated as
+    Markov chains with the given overall FA and PA (see markov_units).
+
+    returns array of shape (number_molecules, DP) with unit A = 1 and
+    unit B = 0"""
+
+    # OPTION B: specific A- and B-blocks
+    if A_blocks != 0 or B_blocks != 0:
+        A_or_B = rng.integers(0, 2, number_molecules)
+        library = block_template(DP, A_blocks, B_blocks)[A_or_B]
+    # specific FA and PA
+    elif PA is not None:
+        first = np.arange(number_molecules * DP) % DP == 0
+        library = markov_units(rng.random(number_molecules * DP), overall_FA,
+                               PA, first).reshape(number_molecules, DP)
+    # OPTION A: specific FA and pattern
+    else:
+        FA_per_position = position_FA(DP, overall_FA, pattern, FA_pattern)
+        library = (rng.random((number_molecules, DP)) <
+                   FA_per_position).view(np.uint8)
+    return library
+
+
+def markov_probabilities(overall_FA, PA):
+    """Calculates the transition probabilities P(A|A) and P(A|B) of a first
+    order Markov chain with a given overall FA and PA. For such a chain, the
+    PA of Kumirska et al. (2009) (see diad_fractions) equals P(B|A) + P(A|B)
+    and FA * P(B|A) = (1 - FA) * P(A|B), so PA = 1 gives a Bernoullian
+    (random) chain, PA < 1 a blockwise and PA > 1 an alternating chain.
+    Raises ValueError if PA is negative or above the highest value possible
+    for the given FA, min(1/FA, 1/(1-FA)).
+
+    returns (A_after_A, A_after_B)"""
+
+    highest_PA = 1 / max(overall_FA, 1 - overall_FA)
+    # a PA rounded up from the highest value is still accepted
+    if not 0 <= PA <= highest_PA * (1 + 1e-9):
+        raise ValueError("PA %g not possible for an FA of %g, it lies between "
+                         "0 and %g" % (PA, overall_FA, highest_PA))
+    PA = min(PA, highest_PA)
+    A_after_A = 1 - PA * (1 - overall_FA)
+    A_after_B = PA * overall_FA
+    return (A_after_A, A_after_B)
+
+
+def numpy_markov_units(random_numbers, overall_FA, PA, first):
+    """Generates units of Markov chains (see markov_probabilities) from one
+    uniform random number per unit, for all molecules at once. first marks
+    the first unit of each molecule, which is A with probability overall_FA.
+    Every other unit either does not depend on the unit before (if its random
+    number gives the same unit after A and after B) or equals or inverts it,
+    so each unit is the last independent unit, inverted once per inversion
+    since then.
+
+    returns array of units (A = 1, B = 0) in the shape of random_numbers"""
+
+    A_after_A, A_after_B = markov_probabilities(overall_FA, PA)
+    after_A = random_numbers < A_after_A
+    after_B = random_numbers < A_after_B
+    after_A[first] = after_B[first] = random_numbers[first] < overall_FA
+    independent = after_A == after_B
+    inverted = after_B & ~after_A
+    positions = np.arange(len(random_numbers), dtype=np.int64)
+    last_independent = np.maximum.accumulate(
+        np.where(independent, positions, 0))
+    inversions = np.cumsum(inverted, dtype=np.int64)
+    inversions -= inversions[last_independent]
+    units = after_A[last_independent] ^ (inversions % 2 == 1)
+    return units.view(np.uint8)
+
+
+def markov_units(random_numbers, overall_FA, PA, first):
+    """Same as numpy_markov_units, via the fastest engine for the number of
+    units (see run_engine), e.g. numba_markov_units.
+
+    returns array of units (A = 1, B = 0)"""
+
+    return run_engine("markov units", (), random_numbers, overall_FA, PA,
+                      first, units=len(random_numbers))
+
+
+def markov_units_benchmark(DP, molecules):
+    """Arguments of markov_units for a library of a given size (see
+    register_benchmark)."""
+
+    random_numbers = np.random.default_rng(0).random(DP * molecules)
+    first = np.zeros(DP * molecules, dtype=bool)
+    first[::DP] = True
+    return (random_numbers, 0.4, 0.8, first)
+
+
+register_engine("markov units", Engine("numpy", numpy_markov_units))
+register_benchmark("markov units", markov_units_benchmark)
+
+
+def block_template(DP, A_blocks, B_blocks):
+    """Generates the only two molecules possible with option B of
+    chitosan_chunk_array, by reading one periodic A/B-block sequence from its
+    first A-unit and from its first B-unit.
+
+    returns array of shape (2, DP): [molecule starting with A-block,
+    molecule starting with B-block]"""
+
+    period = A_blocks + B_blocks
+    block = np.concatenate([np.ones(A_blocks, dtype=np.uint8),
+                            np.zeros(B_blocks, dtype=np.uint8)])
+    template = np.tile(block, DP // period + 2)
+    starts = np.array([0, A_blocks])
+    return template[starts[:, np.newaxis] + np.arange(DP)]
+
+
+def block_library(DP, A_blocks, B_blocks, number_molecules, seed=None,
+                  stream=(GENERATE_STREAM,)):
+    """Generates the same library as chitosan_library_array with option B,
+    but stores each of its two distinct molecules only once together with
+    the number of times it occurs in the library.
+
+    returns (molecules, multiplicities): array of shape (2, DP) (see
+    block_template) and array [number of molecules starting with A-block,
+    number of molecules starting with B-block]"""
+
+    multiplicities = np.zeros(2, dtype=np.int64)
+    rngs = chunk_rngs(seed, number_molecules, *stream)
+    for chunk, rng in zip(molecule_chunks(number_molecules), rngs):
+        A_or_B = rng.integers(0, 2, len(chunk))
+        multiplicities += np.bincount(A_or_B, minlength=2)
+    return (block_template(DP, A_blocks, B_blocks), multiplicities)
+
+
+def molecule_string(molecule):
+    """Converts one molecule of a library array into its string, e.g.
+    [0, 1, 0, 0] -> "BABB" """
+
+    return MONOMER_LETTERS[molecule].tobytes().decode("ascii")
+
+
+def molecule_array(substrate):
+    """Converts a molecule string into its units as in a library array, e.g.
+    "BABB" -> [0, 1, 0, 0]"""
+
+    return (np.frombuffer(substrate.encode("ascii"), dtype=np.uint8) ==
+            ord("A")).view(np.uint8)
+
+
+class LibraryView:
+    """Read-only view of a library array as list of molecule strings, for
+    functions that still work on strings. Molecules are only converted when
+    they are accessed."""
+
+    def __init__(self, library):
+        self.library = library
+
+    def __len__(self):
+        return len(self.library)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return LibraryView(self.library[idx])
+        return molecule_string(self.library[idx])
+
+    def __iter__(self):
+        for molecule in self.library:
+            yield molecule_string(molecule)
+
+
+def digestion_is_deterministic(substrate, digestion):
+    """Checks whether the products of a digestion of one molecule (see
+    digest_library) are the same for any random numbers. This is the case
+    for an enzyme with efficiency 0 or 1 if no two cleavage sites are less
+    than 3 units apart (only then can a cut destroy another site), and for
+    NaNO2 if all or no sites are cleaved (see nano2_cut_counts).
+
+    returns True or False"""
+
+    if digestion[0] == "enzyme":
+        minus_specificity, plus_specificity, efficiency = digestion[1:]
+        if 0 < efficiency < 1:
+            return False
+        sites = enzyme_sites(substrate, minus_specificity, plus_specificity)
+        return all(np.diff(sites) > 2)
+    cuts = digestion[1]
+    cut_distribution = digestion[2] if len(digestion) > 2 else "fixed"
+    if cut_distribution == "poisson":
+        return cuts <= 0
+    if cut_distribution == "binomial":
+        return cuts <= 0 or cuts >= 1
+    return cuts <= 0 or cuts >= substrate[:-1].count("B")
+
+
+def digested_library(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks,
+                     molecules, seed, digestion, *stream, memory_limit=None,
+                     polydispersity=None, PA=None, expected=False, keep=True):
+    """Generates a library and cleaves it via the first "digest" engine that
+    can (see run_engine): with expected, the expected products of an
+    infinite library (see expected_digest, raises ValueError where they are
+    not known exactly), otherwise the two distinct molecules of a library
+    with A- and B-blocks if their digestion is deterministic (see
+    unique_molecule_digest), otherwise batch by batch (see
+    simulated_digest). stream is appended to the
+    generation and digestion streams (see chunk_rngs). Without keep, the
+    library is not kept in LIBRARY_CACHE even with a seed.
+
+    yields per batch: ((lengths, A_counts) of the products, weight of each
+    product)"""
+
+    features = (library_features(A_blocks, B_blocks, polydispersity, PA) |
+                digestion_features(digestion))
+    if expected:
+        features.add("expected")
+    yield from run_engine("digest", features, DP, overall_FA, pattern,
+                          FA_pattern, A_blocks, B_blocks, molecules, seed,
+                          digestion, *stream, memory_limit=memory_limit,
+                          polydispersity=polydispersity, PA=PA, keep=keep)
+
+
+def unique_molecule_digest(DP, overall_FA, pattern, FA_pattern, A_blocks,
+                           B_blocks, molecules, seed, digestion, *stream,
+                           memory_limit=None, polydispersity=None, PA=None,
+                           keep=True):
+    """Cleaves a library with A- and B-blocks, which only consists of two
+    distinct molecules (see block_library): if their digestion is
+    deterministic, each is only cleaved once and its products are weighted
+    by how often it occurs in the library.
+
+    returns list with ((lengths, A_counts) of the products, weight of each
+    product), or None if the digestion is random"""
+
+    seed = resolve_seed(seed)
+    unique_library, multiplicities = block_library(
+        DP, A_blocks, B_blocks, molecules, seed, (GENERATE_STREAM, *stream))
+    if not all(digestion_is_deterministic(substrate, digestion)
+               for substrate in LibraryView(unique_library)):
+        return None
+    products = digest_library(unique_library, digestion,
+                              np.random.default_rng(seed))
+    weights = multiplicities[products[0]]
+    occurring = weights > 0
+    return [((products[2][occurring], products[3][occurring]),
+             weights[occurring])]
+
+
+def simulated_digest(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks,
+                     molecules, seed, digestion, *stream, memory_limit=None,
+                     polydispersity=None, PA=None, keep=True):
+    """Generates a library batch by batch via library_batches (or
+    polydisperse_batches if polydispersity is given) and cleaves each batch
+    via digest_batches. Only one batch of molecules is held in memory at
+    once, so callers can fold the products into running totals for
+    libraries of any size. Libraries with a given seed are kept in
+    LIBRARY_CACHE (see cached_batches) unless keep is False, so that
+    digesting them again with another digestion skips their generation.
+
+    yields per batch: ((lengths, A_counts) of the products, weight of each
+    product)"""
+
+    parameters = library_parameters(DP, overall_FA, pattern, FA_pattern,
+                                    A_blocks, B_blocks, molecules, seed,
+                                    stream, memory_limit, polydispersity, PA)
+    seed = resolve_seed(seed)
+    if polydispersity is not None:
+        batches = polydisperse_batches(DP, overall_FA, pattern, FA_pattern,
+                                       A_blocks, B_blocks, molecules,
+                                       polydispersity, seed,
+                                       (GENERATE_STREAM, *stream), PA)
+    else:
+        batches = library_batches(DP, overall_FA, pattern, FA_pattern,
+                                  A_blocks, B_blocks, molecules, seed,
+                                  (GENERATE_STREAM, *stream), memory_limit, PA,
+                                  merge_chunks=False)
+    if keep:
+        batches = cached_batches(parameters, batches)
+    yield from digest_batches(batches, molecules, seed, digestion, *stream)
+
+
+# the expected engine is registered with the expected products
+register_engine("digest", Engine("unique molecules", unique_molecule_digest,
+                                 features={"option B", "enzyme", "nano2",
+                                           "wildcard specificities",
+                                           "random cut counts"},
+                                 requires={"option B"}))
+register_engine("digest", Engine("simulated", simulated_digest,
+                                 features=SIMULATED_FEATURES))
+
+
+def digest_batches(batches, molecules, seed, digestion, *stream,
+                   first_chunk=0):
+    """Cleaves the batches of a library (see library_batches with
+    merge_chunks False or polydisperse_batches) via
+    digest_library with the random numbers of the chunk each batch lies in
+    (stream is appended to the digestion and cut streams, see chunk_rngs).
+    The batches start with chunk first_chunk.
+
+    yields per batch: ((lengths, A_counts) of the products, weight of each
+    product)"""
+
+    rngs = chunk_rngs(seed, molecules, DIGEST_STREAM, *stream)
+    cut_rngs = chunk_rngs(seed, molecules, CUT_STREAM, *stream)
+    first_molecule = first_chunk * CHUNK_MOLECULES
+    for batch in batches:
+        # batches lie within one chunk, whose random numbers are used in turn
+        chunk = first_molecule // CHUNK_MOLECULES
+        molecule_ids, _, lengths, A_counts = digest_library(
+            batch, digestion, rngs[chunk], cut_rngs[chunk])
+        yield ((lengths, A_counts), np.ones(len(molecule_ids), dtype=np.int64))
+        first_molecule += len(flat_library(batch)[1]) - 1
+
+
+def composition_matrix(digested):
+    """Counts the products yielded by digested_library per composition in a
+    matrix: matrix[number As, number Bs] = summed weight of the products. The
+    matrix is dense (see DENSE_COMPOSITION_UNITS) and only the occurring
+    compositions are kept once longer products occur (sparse).
+
+    returns compositions: (A_counts, B_counts, counts) of all occurring
+    compositions, sorted by DP, then number As"""
+
+    matrix = np.zeros((1, 1))
+    keys = np.zeros(0, dtype=np.int64)
+    counts = np.zeros(0)
+    for (lengths, A_counts), weights in digested:
+        if len(lengths) == 0:
+            continue
+        B_counts = lengths - A_counts
+        size = int(max(A_counts.max(), B_counts.max())) + 1
+        if matrix is not None and size <= DENSE_COMPOSITION_UNITS:
+            if size > len(matrix):
+                matrix = np.pad(matrix, (0, size - len(matrix)))
+            matrix += np.bincount(A_counts * len(matrix) + B_counts, weights,
+                                  minlength=matrix.size).reshape(matrix.shape)
+            continue
+        if matrix is not None:
+            A_matrix, B_matrix = np.nonzero(matrix)
+            keys = A_matrix.astype(np.int64) * COMPOSITION_KEY + B_matrix
+            counts = matrix[A_matrix, B_matrix]
+            matrix = None
+        keys, inverse = np.unique(np.concatenate(
+            [keys, A_counts.astype(np.int64) * COMPOSITION_KEY + B_counts]),
+            return_inverse=True)
+        counts = np.bincount(inverse.reshape(-1),
+                             np.concatenate([counts, weights]))
+    if matrix is not None:
+        A_counts, B_counts = np.nonzero(matrix)
+        counts = matrix[A_counts, B_counts]
+    else:
+        A_counts, B_counts = np.divmod(keys, COMPOSITION_KEY)
+    order = np.lexsort((A_counts, A_counts + B_counts))
+    return (A_counts[order], B_counts[order], counts[order])
+
+
+def DP_histogram(compositions, mass_A=None, mass_B=None, mass_offset=0):
+    """Reduces compositions (see composition_matrix) to a DP histogram: the
+    fraction of all products per DP (molar), or of their mass if mass_A and
+    mass_B are given, minus the water lost per glycosidic bond and
+    mass_offset per product (weight), and the average FA per DP.
+
+    returns [DP_list, fraction_list, average_FA_list]"""
+
+    A_counts, B_counts, counts = compositions
+    lengths = A_counts + B_counts
+    DPs = np.unique(lengths)
+    DP_counts = np.bincount(lengths, counts)[DPs]
+    average_FA = (np.bincount(lengths, A_counts * counts)[DPs] /
+                  (DPs * DP_counts))
+    mole_fractions = DP_counts / sum(DP_counts.tolist())
+    if mass_A is None:
+        return [DPs.tolist(), mole_fractions.tolist(), average_FA.tolist()]
+    average_mass = (DPs * (average_FA * mass_A + (1 - average_FA) * mass_B) -
+                    (DPs - 1) * 18 - mass_offset)
+    mass_mole_fractions = mole_fractions * average_mass
+    weight_fractions = mass_mole_fractions / sum(mass_mole_fractions.tolist())
+    return [DPs.tolist(), weight_fractions.tolist(), average_FA.tolist()]
+
+
+def composition_profile(compositions, mass_A=None, mass_B=None):
+    """Reduces compositions (see composition_matrix) to a product profile:
+    the fraction of all products per composition (molar), or of their mass
+    if mass_A and mass_B are given (weight). Compositions are named as
+    "A2B3" and sorted by DP, then by name.
+
+    returns [oligomer_list, proportion_list]"""
+
+    A_counts, B_counts, counts = compositions
+    if mass_A is not None:
+        counts = counts * (A_counts * mass_A + B_counts * mass_B)
+    proportions = counts / sum(counts.tolist())
+    profile = sorted(zip((A_counts + B_counts).tolist(),
+                         ["A%sB%s" % composition for composition
+                          in zip(A_counts.tolist(), B_counts.tolist())],
+                         proportions.tolist()))
+    return [[name for _, name, _ in profile],
+            [proportion for _, _, proportion in profile]]
+
+
+#### POLYDISPERSE LIBRARIES ####
+
+# A polydisperse library is stored as one flat array of all units (monomers)
+# and an array of offsets, molecule i being monomers[offsets[i]:offsets[i+1]].
+# The chain lengths are given by polydispersity, e.g.
+# {"distribution": "poisson"}, {"distribution": "schulz_zimm",
+# "dispersity": 1.5}, {"distribution": "lognormal", "dispersity": 1.5} or
+# {"distribution": "histogram", "DP": [50, 100, 150], "fractions": [1, 2, 1]}
+
+
+def chain_lengths(DP, number_molecules, polydispersity, rng):
+    """Draws the DP of each molecule of a polydisperse library with number
+    average DP (except for a histogram, which defines the DPs itself).
+    Schulz-Zimm and log-normal distributions are set to the given
+    dispersity (Mw/Mn), the Poisson distribution has a dispersity of about
+    1 + 1/DP. Raises ValueError for a DP below 1, a negative number of
+    molecules, a dispersity below 1 or a histogram without positive DPs and
+    fractions.
+
+    returns array of chain lengths (at least 1 unit each)"""
+
+    distribution = polydispersity["distribution"]
+    dispersity = polydispersity.get("dispersity", 1)
+    if not (np.isfinite(DP) and DP >= 1 and number_molecules >= 0):
+        raise ValueError("DP %s or number of molecules %s not sensible"
+                         % (DP, number_molecules))
+    if not (np.isfinite(dispersity) and dispersity >= 1):
+        raise ValueError("dispersity %s not sensible, Mw/Mn is at least 1"
+                         % dispersity)
+    if distribution == "poisson":
+        lengths = rng.poisson(DP, number_molecules)
+    elif distribution in ("schulz_zimm", "lognormal") and dispersity == 1:
+        lengths = np.full(number_molecules, DP)
+    elif distribution == "schulz_zimm":
+        # gamma distribution with shape k has Mw/Mn = 1 + 1/k
+        k = 1 / (dispersity - 1)
+        lengths = np.rint(rng.gamma(k, DP / k, number_molecules))
+    elif distribution == "lognormal":
+        # log-normal distribution has Mw/Mn = exp(sigma^2)
+        sigma = np.sqrt(np.log(dispersity))
+        mu = np.log(DP) - sigma**2 / 2
+        lengths = np.rint(rng.lognormal(mu, sigma, number_molecules))
+    elif distribution == "histogram":
+        fractions = np.asarray(polydispersity["fractions"], dtype=float)
+        histogram_DP = np.asarray(polydispersity["DP"])
+        if (histogram_DP.shape != fractions.shape or
+                not np.all(histogram_DP >= 1) or
+                not np.all(fractions >= 0) or not fractions.sum() > 0):
+            raise ValueError("chain length histogram not sensible")
+        lengths = rng.choice(histogram_DP, number_molecules,
+                             p=fractions / fractions.sum())
+    else:
+        raise ValueError("unknown chain length distribution %s" % distribution)
+    return np.maximum(lengths, 1).astype(np.int64)
+
+
+def polydisperse_chunk(DP, overall_FA, pattern, FA_pattern, A_blocks,
+                       B_blocks, number_molecules, polydispersity, rng,
+                       PA=None):
+    """Generates chitosan molecules of different DP (see chain_lengths) with
+    the same options as chitosan_chunk_array. For option A,
+    FA_non_pattern is calculated per molecule from its own DP, so that each
+    molecule has the overall FA on average.
+
+    returns polydisperse library: (monomers, offsets)"""
+
+    lengths = chain_lengths(DP, number_molecules, polydispersity, rng)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    molecule_ids = np.repeat(np.arange(number_molecules), lengths)
+    positions = np.arange(offsets[-1]) - offsets[molecule_ids]
+    # specific FA and PA
+    if A_blocks == 0 and B_blocks == 0 and PA is not None:
+        monomers = markov_units(rng.random(len(positions)), overall_FA, PA,
+                                positions == 0)
+    # OPTION A: specific FA and pattern
+    elif A_blocks == 0 and B_blocks == 0:
+        # check combination of overall_FA, FA_pattern and pattern for the
+        # average DP, very short molecules cannot always reach the overall FA
+        position_FA(DP, overall_FA, pattern, FA_pattern)
+        pattern_spaces = np.ceil(lengths / pattern)
+        non_pattern_spaces = lengths - pattern_spaces
+        FA_non_pattern = ((overall_FA * lengths -
+                           pattern_spaces * FA_pattern) /
+                          np.maximum(non_pattern_spaces, 1))
+        FA_non_pattern = np.clip(FA_non_pattern, 0, 1)
+        FA_per_unit = np.where(positions % pattern == 0, FA_pattern,
+                               FA_non_pattern[molecule_ids])
+        monomers = (rng.random(len(positions)) < FA_per_unit).view(np.uint8)
+    # OPTION B: specific A- and B-blocks
+    else:
+        A_or_B = rng.integers(0, 2, number_molecules)
+        template = block_template(lengths.max(), A_blocks, B_blocks)
+        monomers = template[A_or_B[molecule_ids], positions]
+    return (monomers, offsets)
+
+
+def polydisperse_batches(DP, overall_FA, pattern, FA_pattern, A_blocks,
+                         B_blocks, number_molecules, polydispersity, seed=None,
+                         stream=(GENERATE_STREAM,), PA=None, chunks=None):
+    """Generates a polydisperse library chunk by chunk via polydisperse_chunk,
+    each chunk with its own random number generator (see chunk_rngs). If
+    chunks is given, only the chunks with these indices are generated.
+
+    yields polydisperse libraries of one chunk each: (monomers, offsets)"""
+
+    rngs = chunk_rngs(seed, number_molecules, *stream)
+    for idx, (chunk, rng) in enumerate(zip(molecule_chunks(number_molecules),
+                                           rngs)):
+        if chunks is not None and idx not in chunks:
+            continue
+        yield polydisperse_chunk(DP, overall_FA, pattern, FA_pattern,
+                                 A_blocks, B_blocks, len(chunk),
+                                 polydispersity, rng, PA)
+
+
+def flat_library(library):
+    """Converts a library array (see chitosan_library_array) into the format
+    of polydisperse libraries without copying it. Polydisperse libraries
+    are returned unchanged.
+
+    returns (monomers, offsets)"""
+
+    if isinstance(library, tuple):
+        return library
+    number_molecules, DP = library.shape
+    return (library.reshape(-1), np.arange(number_molecules + 1) * DP)
+
+
+# longest n-ads (5 = pentads) whose fractions are returned by diads_triads
+NMR_NGRAM_LENGTH = 5
+
+
+def numpy_ngram_counts(monomers, offsets, max_length, weights=None):
+    """Counts all windows of length 1 to max_length (n-ads) within the
+    molecules of a polydisperse library in a single pass: each window is
+    encoded as binary number of its units, e.g. ABB = 0b100 = 4, and the
+    codes of length n are extended by the next unit to get those of length
+    n + 1. Windows spanning two molecules are ignored. Optional weights give
+    the number of times each molecule occurs.
+
+    returns list with array of number of windows per code for each length:
+    [monads, diads, triads, ...]"""
+
+    lengths = np.diff(offsets)
+    molecule_ids = np.repeat(np.arange(len(lengths)), lengths)
+    # number of units from each unit to the end of its molecule
+    room = offsets[1:][molecule_ids] - np.arange(len(monomers))
+    if weights is not None:
+        weights = np.asarray(weights)[molecule_ids]
+    codes = monomers.astype(np.int64)
+    ngram_counts = []
+    for length in range(1, max_length + 1):
+        number_windows = max(len(monomers) - length + 1, 0)
+        if length > 1:
+            codes = (2 * codes[:number_windows] +
+                     monomers[length - 1:length - 1 + number_windows])
+        within = room[:number_windows] >= length
+        ngram_weights = (None if weights is None else
+                         weights[:number_windows][within])
+        ngram_counts.append(np.bincount(codes[within], weights=ngram_weights,
+                                        minlength=2**length))
+    return ngram_counts
+
+
+def flat_ngram_counts(monomers, offsets, max_length, weights=None):
+    """Same as numpy_ngram_counts, via the fastest engine for the number of
+    units (see run_engine), e.g. numba_ngram_counts.
+
+    returns list with array of number of windows per code for each length"""
+
+    return run_engine("ngram counts", (), monomers, offsets, max_length,
+                      weights, units=len(monomers))
+
+
+register_engine("ngram counts", Engine("numpy", numpy_ngram_counts))
+register_benchmark("ngram counts", lambda DP, molecules: (
+    *benchmark_library(DP, molecules), NMR_NGRAM_LENGTH))
+
+
+def ngram_names(length):
+    """Names the n-ads of a given length in the order of their codes from all
+    A to all B (see flat_ngram_counts), e.g. length 2: AA, AB, BA, BB.
+
+    returns list of names"""
+
+    return ["".join("A" if code >> (length - 1 - position) & 1 else "B"
+                    for position in range(length))
+            for code in range(2**length - 1, -1, -1)]
+
+
+def ngram_fractions(counts):
+    """Calculates the fractions of all n-ads of one length from their counts
+    per code (see flat_ngram_counts).
+
+    returns dictionary: {"F_AA...": fraction, ...} in the order of
+    ngram_names"""
+
+    counts = np.asarray(counts)
+    fractions = counts[::-1] / counts.sum()
+    length = int(np.log2(len(counts)))
+    return {"F_%s" % name: float(fraction)
+            for name, fraction in zip(ngram_names(length), fractions)}
+
+
+def expected_ngram_counts(DP, overall_FA, pattern, FA_pattern, A_blocks,
+                          B_blocks, max_length, polydispersity=None, PA=None):
+    """Calculates the expected number of windows of length 1 to max_length
+    (n-ads) per molecule of a library generated via option A of
+    chitosan_chunk_array: units at different positions are independent, so the
+    probability of an n-ad at a position is the product of the probabilities
+    of its units (see position_FA). The expected fractions equal those of an
+    infinitely large library.
+
+    returns list with array of expected number of windows per code for each
+    length as flat_ngram_counts, or None for block, Markov and polydisperse
+    libraries"""
+
+    if (A_blocks != 0 or B_blocks != 0 or PA is not None or
+            polydispersity is not None):
+        return None
+    FA_per_position = position_FA(DP, overall_FA, pattern, FA_pattern)
+    # probability of unit B (code 0) and unit A (code 1) at each position
+    units = np.stack([1 - FA_per_position, FA_per_position], axis=1)
+    probabilities = units
+    ngram_counts = [probabilities.sum(axis=0)]
+    for length in range(2, max_length + 1):
+        probabilities = (probabilities[:-1, :, None] *
+                         units[length - 1:, None, :])
+        probabilities = probabilities.reshape(DP - length + 1, -1)
+        ngram_counts.append(probabilities.sum(axis=0))
+    return ngram_counts
+
+
+def sweep_ngram_counts(DP, FA_range, pattern, FA_pattern_range, max_length,
+                       number_molecules, seed=None,
+                       stream=(GENERATE_STREAM,), memory_limit=None):
+    """Counts the n-ads of length 1 to max_length (see flat_ngram_counts) of
+    the option A libraries of a whole FA sweep at once. All libraries are
+    generated from the same uniform random numbers as library_batches: as
+    the probability of unit A at each position (see position_FA) only
+    increases along the sweep, each unit turns from B into A once, at its
+    flip point. Each n-ad window therefore changes its code at most
+    max_length times, and only these changes are counted instead of all
+    windows at every point.
+
+    returns list with n-ad counts as flat_ngram_counts for each point of the
+    sweep, or None if the probabilities do not increase along the sweep"""
+
+    thresholds = np.array([position_FA(DP, FA, pattern, FA_pattern)
+                           for FA, FA_pattern in zip(FA_range,
+                                                     FA_pattern_range)])
+    if np.any(np.diff(thresholds, axis=0) < 0):
+        return None
+    number_points = len(thresholds)
+    # positions with the same probabilities along the sweep (pattern or not)
+    classes, position_classes = np.unique(thresholds, axis=1,
+                                          return_inverse=True)
+    position_classes = position_classes.reshape(-1)
+    totals = [np.zeros((number_points + 1, 2**length), dtype=np.int64)
+              for length in range(1, max_length + 1)]
+    # every unit takes part in up to max_length windows
+    max_molecules = batch_molecules(DP * max_length, memory_limit)
+    rngs = chunk_rngs(seed, number_molecules, *stream)
+    for chunk, rng in zip(molecule_chunks(number_molecules), rngs):
+        for start in range(0, len(chunk), max_molecules):
+            uniforms = rng.random((min(max_molecules, len(chunk) - start), DP))
+            # first point at which each unit is A (number_points: never)
+            flips = np.empty(uniforms.shape, dtype=np.int16)
+            for position_class in range(classes.shape[1]):
+                columns = position_classes == position_class
+                flips[:, columns] = np.searchsorted(classes[:, position_class],
+                                                    uniforms[:, columns],
+                                                    side="right")
+            for length, total in enumerate(totals, 1):
+                windows = np.stack([flips[:, unit:DP - length + 1 + unit]
+                                    for unit in range(length)],
+                                   axis=-1).reshape(-1, length)
+                # units of each window in the order of their flip points
+                order = np.sort(windows * length + np.arange(length), axis=1)
+                points = order // length
+                bits = 1 << (length - 1 - order % length)
+                codes = np.cumsum(bits, axis=1)
+                indices = points * 2**length + codes
+                changes = np.bincount(indices.ravel(), minlength=total.size)
+                changes -= np.bincount((indices - bits).ravel(),
+                                       minlength=total.size)
+                total += changes.reshape(total.shape)
+                # all windows start as all B (code 0)
+                total[0, 0] += len(windows)
+    totals = [np.cumsum(total, axis=0)[:number_points] for total in totals]
+    return [[total[point] for total in totals]
+            for point in range(number_points)]
+
+
+#### CLEAVAGE SITES ####
+
+# An enzyme binds 6 units (subsites -3 to +3) and cleaves between subsite -1
+# and +1. Each subsite is in one of three states: unit B = 0, unit A = 1 (as
+# in library arrays) or unoccupied = 2 (beyond a former cut, "-"). A window
+# of 6 subsites is encoded as number in base 3, first subsite first.
+SUBSITE_STATES = {"B": 0, "A": 1, "-": 2}
+# subsite states accepted by each character of a specificity (see enzyme)
+SPECIFICITY_STATES = {"A": (1,), "B": (0,), "X": (0, 1), "_": (0, 1, 2),
+                      ".": (0, 1, 2)}
+
+
+@lru_cache(maxsize=128)
+def specificity_table(minus_specificity, plus_specificity):
+    """Compiles the minus and plus specificity of an enzyme (see enzyme) into
+    a lookup table of all 3^6 combinations of subsite states, indexed by
+    window code (see above). Tables are cached per specificity.
+
+    returns read-only boolean array of length 729: True = cleavage site"""
+
+    codes = np.arange(3**6)
+    table = np.ones(3**6, dtype=bool)
+    for subsite, pref in enumerate(minus_specificity + plus_specificity):
+        states = codes // 3**(5 - subsite) % 3
+        table &= np.isin(states, SPECIFICITY_STATES[pref])
+    table.flags.writeable = False
+    return table
+
+
+def find_sites(monomers, offsets, table):
+    """Finds all cleavage sites of an enzyme (see specificity_table) in a
+    library given as flat monomers and offsets (see flat_library) in one pass
+    of a sliding window over all units. Windows spanning two molecules are
+    ignored.
+
+    returns flat indices of the first unit of each site, in ascending order"""
+
+    number_windows = max(len(monomers) - 5, 0)
+    codes = np.zeros(number_windows, dtype=np.int16)
+    for subsite in range(6):
+        codes = 3 * codes + monomers[subsite:subsite + number_windows]
+    sites = np.flatnonzero(table[codes])
+    # the whole window needs to lie within the molecule of its first unit
+    molecule_ends = offsets[np.searchsorted(offsets, sites, side="right")]
+    return sites[sites + 6 <= molecule_ends]
+
+
+#### CLEAVAGE ENGINE ####
+
+# Cuts are kept as boolean mask over the units of a flat library (see
+# flat_library): cut[i] = True if the bond between unit i-1 and unit i is
+# cleaved. The sites are processed in the order of random priorities (lowest
+# first), which is the same as processing them in a shuffled order.
+
+
+def recheck_sites(monomers, cut, sites, table):
+    """Checks whether enzyme cleavage sites (see find_sites) are still
+    cleavage sites after the cuts in cut, exactly as enzyme does on its list
+    of units with a "-" inserted per cut: the 6 subsites are read starting at
+    the site index, which former cuts within the first 3 units have shifted
+    by one position each (those before the site at most 2 units before it),
+    so the window starts behind the cuts before unit 1 and 2 of the site and
+    ends earlier for each cut within it.
+
+    returns boolean array: True = still a cleavage site"""
+
+    number_sites = len(sites)
+    # units of the site with the possible "-" before units 1 to 5 in between
+    items = np.full((number_sites, 11), SUBSITE_STATES["-"], dtype=np.int64)
+    items[:, 0::2] = monomers[sites[:, None] + np.arange(6)]
+    present = np.ones((number_sites, 11), dtype=bool)
+    present[:, 1::2] = cut[sites[:, None] + np.arange(1, 6)]
+    shift = present[:, 1].astype(np.int64) + present[:, 3]
+    positions = np.cumsum(present, axis=1) - 1 - shift[:, None]
+    rows, columns = np.nonzero(present & (positions >= 0) & (positions < 6))
+    window = np.zeros((number_sites, 6), dtype=np.int64)
+    window[rows, positions[rows, columns]] = items[rows, columns]
+    return table[window @ 3**np.arange(5, -1, -1)]
+
+
+def numpy_enzyme_cuts(monomers, offsets, sites, table, priorities):
+    """Cleaves all molecules of a library given as flat monomers and offsets
+    by an enzyme with the same semantics as enzyme: all sites (see
+    find_sites) are processed in the order of their priorities and only
+    cleaved if still a cleavage site (see recheck_sites). A cut can only
+    destroy sites less than 3 units away, so sites are split into clusters
+    without such neighbours and processed in rounds, round r cleaving the
+    site of rank r in each cluster at once. The first round needs no check.
+
+    returns cut mask (see above)"""
+
+    cut = np.zeros(len(monomers), dtype=bool)
+    if len(sites) == 0:
+        return cut
+    cluster = np.cumsum(np.concatenate([[True], np.diff(sites) > 2])) - 1
+    order = np.lexsort((priorities, cluster))
+    sorted_cluster = cluster[order]
+    ranks = (np.arange(len(order)) -
+             np.searchsorted(sorted_cluster, sorted_cluster))
+    by_rank = order[np.argsort(ranks, kind="stable")]
+    start = 0
+    for rank, count in enumerate(np.bincount(ranks)):
+        round_sites = sites[by_rank[start:start + count]]
+        start += count
+        if rank > 0:
+            round_sites = round_sites[recheck_sites(monomers, cut,
+                                                    round_sites, table)]
+        cut[round_sites + 3] = True
+    return cut
+
+
+def enzyme_cuts(monomers, offsets, sites, table, priorities):
+    """Same as numpy_enzyme_cuts, via the fastest engine for the number of
+    units (see run_engine), e.g. numba_enzyme_cuts.
+
+    returns cut mask"""
+
+    return run_engine("enzyme cuts", (), monomers, offsets, sites, table,
+                      priorities, units=len(monomers))
+
+
+def enzyme_cuts_benchmark(DP, molecules):
+    """Arguments of enzyme_cuts for a library of a given size (see
+    register_benchmark), cleaved by an enzyme with overlapping sites."""
+
+    monomers, offsets = benchmark_library(DP, molecules)
+    table = specificity_table("_BA", "XX_")
+    sites = find_sites(monomers, offsets, table)
+    return (monomers, offsets, sites, table,
+            np.random.default_rng(0).random(len(sites)))
+
+
+register_engine("enzyme cuts", Engine("numpy", numpy_enzyme_cuts))
+register_benchmark("enzyme cuts", enzyme_cuts_benchmark)
+
+
+def nano2_sites(monomers, offsets):
+    """Finds all NaNO2 cleavage sites (B followed by another unit of the same
+    molecule, see nano2) of a library given as flat monomers and offsets.
+
+    returns flat indices of the B units, in ascending order"""
+
+    last_units = np.zeros(len(monomers), dtype=bool)
+    last_units[offsets[1:] - 1] = True
+    return np.flatnonzero((monomers == 0) & ~last_units)
+
+
+def nano2_cut_counts(offsets, sites, cuts, cut_distribution, rng):
+    """Draws the number of NaNO2 cuts of each molecule of a library given by
+    its offsets and sites (see nano2_sites) for a cut_distribution:
+    "fixed" = cuts for every molecule (as nano2 always did)
+    "poisson" = Poisson distributed with mean cuts
+    "binomial" = each site is cleaved with probability cuts (0 to 1), i.e.
+    binomially distributed with the number of sites of the molecule
+    Molecules are never cleaved more often than they have sites (see
+    nano2_cuts). Raises ValueError for other cut distributions and for
+    binomial probabilities outside 0 to 1.
+
+    returns array with the number of cuts per molecule"""
+
+    number_molecules = len(offsets) - 1
+    if cut_distribution == "fixed":
+        return np.full(number_molecules, cuts)
+    if cut_distribution == "poisson":
+        return rng.poisson(max(cuts, 0), number_molecules)
+    if cut_distribution == "binomial":
+        if not 0 <= cuts <= 1:
+            raise ValueError("binomial cuts must be a probability from 0 to "
+                             "1, not %s" % cuts)
+        molecule_ids = np.searchsorted(offsets, sites, side="right") - 1
+        site_counts = np.bincount(molecule_ids, minlength=number_molecules)
+        return rng.binomial(site_counts, cuts)
+    raise ValueError("unknown cut distribution %s" % cut_distribution)
+
+
+def nano2_cuts(monomers, offsets, sites, cuts, priorities):
+    """Cleaves all molecules of a library given as flat monomers and offsets
+    with NaNO2 with the same semantics as nano2: sites (see nano2_sites)
+    are processed in the order of their priorities, and as a cut never
+    destroys another site, the cuts sites with the lowest priorities of each
+    molecule are cleaved, i.e. a uniform random sample of min(cuts, sites)
+    sites. cuts can be given per molecule (see nano2_cut_counts). Only the
+    sites of molecules that are not cleaved at all of their sites need to
+    be sorted.
+
+    returns cut mask (see above)"""
+
+    cut = np.zeros(len(monomers), dtype=bool)
+    molecule_ids = np.searchsorted(offsets, sites, side="right") - 1
+    site_counts = np.bincount(molecule_ids, minlength=len(offsets) - 1)
+    site_cuts = np.broadcast_to(cuts, site_counts.shape)[molecule_ids]
+    all_cleaved = site_cuts >= site_counts[molecule_ids]
+    cut[sites[all_cleaved] + 1] = True
+    # sort the random priorities of the remaining sites within each molecule
+    sampled = np.flatnonzero(~all_cleaved & (site_cuts > 0))
+    order = sampled[np.lexsort((priorities[sampled], molecule_ids[sampled]))]
+    sorted_ids = molecule_ids[order]
+    ranks = np.arange(len(order)) - np.searchsorted(sorted_ids, sorted_ids)
+    cut[sites[order[ranks < site_cuts[order]]] + 1] = True
+    return cut
+
+
+def partial_cuts(cut, efficiency, rng):
+    """Implements an enzyme efficiency < 1 by keeping each cut of a complete
+    digestion with probability efficiency (one random number per cut, in
+    the order of the bonds), which puts the products of the dropped cuts
+    back together. No random numbers are drawn for efficiency >= 1.
+
+    returns cut mask of the remaining cuts"""
+
+    if efficiency >= 1:
+        return cut
+    cuts = np.flatnonzero(cut)
+    cut = cut.copy()
+    cut[cuts[rng.random(len(cuts)) >= efficiency]] = False
+    return cut
+
+
+def cut_products(offsets, cut, trim_ends):
+    """Splits all molecules of a library at their cuts. With trim_ends, the
+    first and last product of each molecule are dropped like enzyme does
+    (including uncleaved molecules).
+
+    returns products as arrays: (molecule_ids, starts, ends), molecule_ids
+    and starts in ascending order, each product being
+    monomers[start:end]"""
+
+    boundaries = cut.copy()
+    boundaries[offsets[:-1][np.diff(offsets) > 0]] = True
+    starts = np.flatnonzero(boundaries)
+    ends = np.append(starts[1:], offsets[-1])
+    molecule_ids = np.searchsorted(offsets, starts, side="right") - 1
+    if trim_ends:
+        inner = ((starts != offsets[molecule_ids]) &
+                 (ends != offsets[molecule_ids + 1]))
+        return (molecule_ids[inner], starts[inner], ends[inner])
+    return (molecule_ids, starts, ends)
+
+
+def digest_library(library, digestion, rng, cut_rng=None):
+    """Cleaves all molecules of a library (library array or polydisperse
+    library, see flat_library) at once as specified by digestion:
+    ("enzyme", minus_specificity, plus_specificity, efficiency) (see enzyme)
+    or ("nano2", cuts[, cut_distribution]) (see nano2), with the same
+    semantics as the cleavage of individual molecules. The priorities of
+    the sites are drawn from rng and the number of cuts (see partial_cuts
+    and nano2_cut_counts) from cut_rng (rng if None), both in the order of
+    the molecules, so that cleaving a library in consecutive parts with the
+    same two generators gives the same products as cleaving it at once.
+
+    returns product table as arrays: (molecule_ids, starts, lengths,
+    A_counts), starts being the index of the first unit within the
+    molecule"""
+
+    if cut_rng is None:
+        cut_rng = rng
+    monomers, offsets = flat_library(library)
+    if digestion[0] == "enzyme":
+        minus_specificity, plus_specificity, efficiency = digestion[1:]
+        table = specificity_table(minus_specificity, plus_specificity)
+        sites = find_sites(monomers, offsets, table)
+        cut = partial_cuts(enzyme_cuts(monomers, offsets, sites, table,
+                                       rng.random(len(sites))),
+                           efficiency, cut_rng)
+    else:
+        cuts = digestion[1]
+        cut_distribution = digestion[2] if len(digestion) > 2 else "fixed"
+        sites = nano2_sites(monomers, offsets)
+        priorities = rng.random(len(sites))
+        cut_counts = nano2_cut_counts(offsets, sites, cuts, cut_distribution,
+                                      cut_rng)
+        cut = nano2_cuts(monomers, offsets, sites, cut_counts, priorities)
+    molecule_ids, starts, ends = cut_products(offsets, cut,
+                                              digestion[0] == "enzyme")
+    A_sums = np.concatenate([[0], np.cumsum(monomers, dtype=np.int64)])
+    return (molecule_ids, starts - offsets[molecule_ids], ends - starts,
+            A_sums[ends] - A_sums[starts])
+
+
+#### EXPECTED DIGESTION ####
+
+# For molecules of option A (see chitosan_chunk_array), every unit is A or B
+# independently of all others, so the expected products of NaNO2 cleavage of
+# an infinite library can be calculated exactly instead of simulated. Sites
+# are the B units at positions 0 to DP-2, a product starts behind a cut (or at
+# the first unit) and ends with a cut B unit (or the last unit).
+
+# expected products less frequent than this per molecule are neglected
+EXPECTED_CUTOFF = 1e-15
+
+
+def expected_products(DP, overall_FA, pattern, FA_pattern, A_blocks,
+                      B_blocks, digestion, polydispersity=None, PA=None):
+    """Calculates the expected products per molecule of a digestion (see
+    digest_library) of an infinite library, if they are known exactly: for
+    NaNO2 with a fixed number of cuts (see nano2_cut_counts) of molecules of
+    option A with one DP, either with random PA (see expected_nano2_random)
+    or with a pattern (see expected_nano2_pattern).
+
+    returns arrays (lengths, A_counts, expected number per molecule) or None
+    if the products need to be simulated"""
+
+    if (digestion[0] != "nano2" or
+            (len(digestion) > 2 and digestion[2] != "fixed") or
+            polydispersity is not None or PA is not None or
+            A_blocks != 0 or B_blocks != 0):
+        return None
+    cuts = digestion[1]
+    FA_per_position = position_FA(DP, overall_FA, pattern, FA_pattern)
+    if np.allclose(FA_per_position, FA_per_position[0], rtol=0, atol=1e-12):
+        return expected_nano2_random(DP, FA_per_position[0], cuts)
+    return expected_nano2_pattern(FA_per_position, pattern, cuts)
+
+
+def expected_digest(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks,
+                    molecules, seed, digestion, *stream, memory_limit=None,
+                    polydispersity=None, PA=None, keep=True):
+    """Expected products of a library of molecules molecules (see
+    expected_products) in the format of digested_library.
+
+    returns list with ((lengths, A_counts) of the products, expected number
+    of each product), or None if the products need to be simulated"""
+
+    products = expected_products(DP, overall_FA, pattern, FA_pattern, A_blocks,
+                                 B_blocks, digestion, polydispersity, PA)
+    if products is None:
+        return None
+    lengths, A_counts, counts = products
+    return [((lengths, A_counts), counts * molecules)]
+
+
+register_engine("digest", Engine("expected", expected_digest,
+                                 features={"expected", "option A", "nano2"},
+                                 requires={"expected"}))
+
+
+def log_power(log_base, exponent):
+    """Calculates exponent * log_base with 0 * log(0) = 0.
+
+    returns array of logarithms"""
+
+    exponent = np.asarray(exponent)
+    with np.errstate(invalid="ignore"):
+        return np.where(exponent == 0, 0.0, exponent * log_base)
+
+
+def composition_table(lengths, A_counts, counts):
+    """Sums up the counts of identical compositions (length, number of As)
+    and drops those below EXPECTED_CUTOFF.
+
+    returns arrays (lengths, A_counts, counts) sorted by length and As"""
+
+    lengths = np.concatenate(lengths).astype(np.int64)
+    A_counts = np.concatenate(A_counts).astype(np.int64)
+    counts = np.concatenate(counts)
+    base = lengths.max() + 1
+    codes, inverse = np.unique(lengths * base + A_counts, return_inverse=True)
+    counts = np.bincount(inverse.ravel(), weights=counts)
+    lengths = codes // base
+    A_counts = codes % base
+    kept = counts >= EXPECTED_CUTOFF
+    return (lengths[kept], A_counts[kept], counts[kept])
+
+
+def expected_nano2_complete(FA_per_position):
+    """Calculates the expected products per molecule if NaNO2 cleaves all
+    sites, for molecules with independent units that are A with the given
+    probability per position (see position_FA). A product is a run of A
+    units between two cut B units (or chain ends), ending with the B.
+
+    returns arrays (lengths, A_counts, expected number per molecule)"""
+
+    DP = len(FA_per_position)
+    N = DP - 1
+    A_prob = np.asarray(FA_per_position, dtype=float)
+    B_prob = 1 - A_prob
+    # probability that units i to j-1 are all A: exp(log_A[j] - log_A[i]) if
+    # there is no position with probability 0 in between
+    with np.errstate(divide="ignore"):
+        logs = np.log(A_prob)
+    log_A = np.concatenate([[0], np.cumsum(np.where(A_prob > 0, logs, 0))])
+    zeros_A = np.concatenate([[0], np.cumsum(A_prob == 0)])
+
+    def all_A(start, end):
+        return np.where(zeros_A[end] == zeros_A[start],
+                        np.exp(log_A[end] - log_A[start]), 0)
+
+    lengths, A_counts, counts = [], [], []
+    # products between two cuts: B at u and v, A in between
+    for length in range(1, N):
+        u = np.arange(N - length)
+        lengths.append([length])
+        A_counts.append([length - 1])
+        counts.append([np.sum(B_prob[u] * B_prob[u + length] *
+                              all_A(u + 1, u + length))])
+    # first product up to the first cut and last product behind the last cut
+    positions = np.arange(N)
+    first = all_A(0, positions) * B_prob[positions]
+    last = B_prob[positions] * all_A(positions + 1, N)
+    last_lengths = N - positions
+    whole = all_A(0, N)
+    lengths += [positions + 1, last_lengths, last_lengths, [DP, DP]]
+    A_counts += [positions, last_lengths, last_lengths - 1, [DP, N]]
+    counts += [first, last * A_prob[N], last * B_prob[N],
+               [whole * A_prob[N], whole * B_prob[N]]]
+    return composition_table(lengths, A_counts, counts)
+
+
+def expected_nano2_random(DP, FA, cuts):
+    """Calculates the expected products per molecule of nano2 with at most
+    cuts cuts (see nano2_cuts) for molecules whose units are all A with
+    probability FA (random PA). The n sites of a molecule are binomially
+    distributed, of which a uniform random subset of min(cuts, n) is cut.
+    A product with c cut sites at its borders and m uncut sites within, out
+    of N_o sites outside, occurs with probability
+    C(N_o, cuts - c) / C(n, cuts), n = c + m + N_o. Written as Beta
+    integral, 1 / C(n, cuts) = (n + 1) integral t^cuts (1 - t)^(n - cuts),
+    the sum over N_o leads to the integrals
+    J(a, b) = integral t^cuts (1 - t)^a (1 - t FB)^b, which are calculated
+    in logarithms via J(a, b) = FA J(a, b - 1) + FB J(a + 1, b - 1).
+    Molecules with fewer sites than cuts are cleaved at all sites.
+
+    returns arrays (lengths, A_counts, expected number per molecule)"""
+
+    N = DP - 1
+    k = int(np.ceil(cuts))
+    if k >= N or FA >= 1:
+        return expected_nano2_complete(np.full(DP, float(FA)))
+    with np.errstate(divide="ignore"):
+        log_FA = np.log(FA)
+        log_FB = np.log1p(-FA)
+    log_factorial = np.concatenate([[0],
+                                    np.cumsum(np.log(np.arange(1, DP + 2)))])
+
+    def log_binomial(n, r):
+        return log_factorial[n] - log_factorial[r] - log_factorial[n - r]
+
+    if k <= 0:
+        # uncleaved molecules: binomial number of As
+        A_counts = np.arange(DP + 1)
+        counts = np.exp(log_binomial(DP, A_counts) +
+                        log_power(log_FA, A_counts) +
+                        log_power(log_FB, DP - A_counts))
+        return composition_table([np.full(DP + 1, DP)], [A_counts], [counts])
+    lengths, A_counts, counts = [], [], []
+    # molecules with n < k sites: all cut, products are runs of A ending
+    # with a B, O outside sites with O <= k - c - 1
+    outside = np.zeros(k)
+    outside[0] = 1
+    below = {1: np.zeros(N + 1), 2: np.zeros(N + 1)}
+    for N_o in range(N + 1):
+        below[1][N_o] = outside[:k - 1].sum()
+        below[2][N_o] = outside[:k - 2].sum() if k > 2 else 0
+        outside[1:] = FA * outside[1:] + (1 - FA) * outside[:-1]
+        outside[0] *= FA
+    length = np.arange(1, N + 1)
+    run = np.exp(log_power(log_FA, length - 1) + log_FB)
+    # first and last product (the last unit of the last product can be A)
+    lengths += [length, length]
+    A_counts += [length - 1, length]
+    counts += [run * below[1][N - length] * (2 - FA),
+               run * below[1][N - length] * FA]
+    inner = length[:-1]
+    lengths.append(inner)
+    A_counts.append(inner - 1)
+    counts.append((N - inner) * run[:-1] * (1 - FA) * below[2][N - 1 - inner])
+    lengths.append([DP, DP])
+    A_counts.append([N, DP])
+    counts.append(np.exp(log_power(log_FA, N)) * np.array([1 - FA, FA]))
+    # molecules with n >= k sites: row b of J for N_o = b + k - c outside
+    # sites, products have l = N - b - k units before their last unit
+    log_J = -np.log(k + 1) + np.concatenate([[0], np.cumsum(
+        np.log(np.arange(1, N - k + 1)) - np.log(np.arange(k + 2, N + 2)))])
+    # a composition sums up at most 4 counts, which are dropped if too rare
+    log_cutoff = np.log(EXPECTED_CUTOFF / 4)
+    for b in range(N - k + 1):
+        if b > 0:
+            log_J_previous = log_J
+            log_J = np.logaddexp(log_FA + log_J[:-1], log_FB + log_J[1:])
+        l = N - b - k
+        for c in (1, 2):
+            j = k - c
+            if j < 0:
+                continue
+            N_o = b + j
+            m = np.arange(l + 1)
+            log_V = (np.log(k + m + 1) + log_binomial(N_o, j) + j * log_FB +
+                     log_J[m])
+            if b > 0:
+                log_V = np.logaddexp(log_V, np.log(j + 1) +
+                                     log_binomial(N_o, j + 1) +
+                                     (j + 1) * log_FB + log_J_previous[m + 1])
+            log_count = (c * log_FB + log_binomial(l, m) +
+                         log_power(log_FB, m) + log_power(log_FA, l - m) +
+                         log_V)
+            if c == 2:
+                log_count += np.log(N - l - 1)
+            frequent = log_count >= log_cutoff
+            count = np.exp(log_count[frequent])
+            m = m[frequent]
+            if c == 1:
+                # first product and last product
+                lengths += [np.full(len(m), l + 1)] * 2
+                A_counts += [l - m, l - m + 1]
+                counts += [count * (2 - FA), count * FA]
+            else:
+                lengths.append(np.full(len(m), l + 1))
+                A_counts.append(l - m)
+                counts.append(count)
+    return composition_table(lengths, A_counts, counts)
+
+
+def expected_nano2_pattern(FA_per_position, pattern, cuts):
+    """Calculates the expected products per molecule of nano2 with at most
+    cuts cuts (see nano2_cuts) for molecules whose units are A with the
+    probability of their position, FA_pattern at every nth position and
+    FA_non_pattern at all others (see position_FA). A product from unit u to
+    v - 1 has c cut sites at its borders (units u - 1 and v - 1, if within
+    the molecule) and m uncut sites within. A uniform random subset of cuts
+    of the n = c + m + N_o sites, N_o outside the product, contains the
+    border sites and none of the others within with probability
+    C(N_o, cuts - c) / C(n, cuts), or 1 for m = 0 if n <= cuts. The number
+    of B units of a part of a molecule only depends on its number of pattern
+    positions and other positions, so products are grouped by these, and the
+    probability is summed over the distribution of N_o for all groups at
+    once as matrix product.
+
+    returns arrays (lengths, A_counts, expected number per molecule)"""
+
+    DP = len(FA_per_position)
+    N = DP - 1
+    k = max(int(np.ceil(cuts)), 0)
+    if k >= N:
+        return expected_nano2_complete(FA_per_position)
+    A_prob = np.asarray(FA_per_position, dtype=float)
+    B_prob = 1 - A_prob
+    is_pattern = np.arange(DP) % pattern == 0
+    B_pattern = B_prob[0]
+    B_other = B_prob[1] if pattern > 1 else B_pattern
+    log_factorial = np.concatenate([[0], np.cumsum(
+        np.log(np.arange(1, 2 * DP + 1)))])
+
+    def log_binomial(n, r):
+        return log_factorial[n] - log_factorial[r] - log_factorial[n - r]
+
+    @lru_cache(maxsize=None)
+    def B_counts(pattern_units, other_units):
+        # distribution of the number of B units
+        distribution = [1.0]
+        for units, B in ((pattern_units, B_pattern),
+                         (other_units, B_other)):
+            B_units = np.arange(units + 1)
+            with np.errstate(divide="ignore"):
+                distribution = np.convolve(distribution, np.exp(
+                    log_binomial(units, B_units) +
+                    log_power(np.log(B), B_units) +
+                    log_power(np.log1p(-B), units - B_units)))
+        return distribution
+
+    def pattern_units(start, end):
+        # number of pattern positions from start to end - 1
+        return -(-end // pattern) + start // -pattern
+
+    # products (u, v) grouped by length, pattern positions within and the
+    # kind of unit at both borders (0 = chain end, 1 = pattern, 2 = other)
+    u, v = np.triu_indices(DP + 1, 1)
+    left = np.where(u > 0, 2 - is_pattern[u - 1], 0)
+    right = np.where(v < DP, 2 - is_pattern[np.minimum(v, N) - 1], 0)
+    length = v - u
+    inner_pattern = pattern_units(u, v - 1)
+    groups, products = np.unique(
+        ((length * DP + inner_pattern) * 3 + left) * 3 + right,
+        return_counts=True)
+    right, left = groups % 3, groups // 3 % 3
+    length, inner_pattern = divmod(groups // 9, DP)
+    c = (left > 0).astype(np.int64) + (right > 0)
+    outside_pattern = (pattern_units(0, N) - inner_pattern - (left == 1) -
+                       (right == 1))
+    outside_units = N - (length - 1) - c
+    # probability of the border sites being cut and m sites within not, per
+    # group, summed over the outside sites
+    outsides, outside_ids = np.unique(
+        np.stack([c, outside_pattern, outside_units], axis=1), axis=0,
+        return_inverse=True)
+    outside_ids = outside_ids.ravel()
+    sums = np.zeros((len(outsides), N + 1))
+    N_o = np.arange(N + 1)[:, None]
+    m = np.arange(N + 1)[None, :]
+    for border_cuts in range(3):
+        j = k - border_cuts
+        rows = np.flatnonzero(outsides[:, 0] == border_cuts)
+        if j < 0 or len(rows) == 0:
+            continue
+        n = N_o + border_cuts + m
+        probability = np.where(
+            (N_o >= j) & (n >= k),
+            np.exp(log_binomial(np.maximum(N_o, j), j) -
+                   log_binomial(np.maximum(n, k), k)), 0)
+        probability = np.where(n < k, m == 0, probability)
+        distributions = np.zeros((len(rows), N + 1))
+        for row, (_, pattern_outside, units) in enumerate(outsides[rows]):
+            distributions[row, :units + 1] = B_counts(
+                int(pattern_outside), int(units - pattern_outside))
+        sums[rows] = distributions @ probability
+    lengths, A_counts, counts = [], [], []
+    for group in range(len(groups)):
+        l = length[group]
+        border = np.prod([B_pattern if kind == 1 else B_other
+                          for kind in (left[group], right[group]) if kind])
+        count = (products[group] * border *
+                 B_counts(int(inner_pattern[group]),
+                          int(l - 1 - inner_pattern[group])) *
+                 sums[outside_ids[group], :l])
+        B_units = np.arange(l)
+        if right[group]:
+            lengths.append(np.full(l, l))
+            A_counts.append(l - 1 - B_units)
+            counts.append(count)
+        else:
+            # the last unit of the molecule is no site
+            lengths += [np.full(l, l)] * 2
+            A_counts += [l - B_units, l - 1 - B_units]
+            counts += [count * A_prob[N], count * B_prob[N]]
+    return composition_table(lengths, A_counts, counts)
+
+
+#### NUMBA KERNELS ####
+
+# Optional kernels for the loops that do not vectorize naturally, compiled by
+# Numba (if installed) on first use. They give the same results as the NumPy
+# functions, are only used if they pass numba_parity and are registered as
+# engines, so that they are used where they are faster (see EngineTuner).
+
+# use the Numba kernels if Numba is installed (and they pass numba_parity)
+USE_NUMBA = True
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def enzyme_cuts_kernel(monomers, sites, table, order, dash):
+        """Processes the sites (see find_sites) one by one in the given order
+        and cleaves each that is still a cleavage site (see recheck_sites)."""
+
+        cut = np.zeros(len(monomers), dtype=np.bool_)
+        items = np.empty(11, dtype=np.int64)
+        present = np.empty(11, dtype=np.bool_)
+        window = np.empty(6, dtype=np.int64)
+        for idx in order:
+            site = sites[idx]
+            for unit in range(6):
+                items[2 * unit] = monomers[site + unit]
+                present[2 * unit] = True
+            for unit in range(1, 6):
+                items[2 * unit - 1] = dash
+                present[2 * unit - 1] = cut[site + unit]
+            window[:] = 0
+            position = -1 - np.int64(present[1]) - np.int64(present[3])
+            for slot in range(11):
+                if present[slot]:
+                    position += 1
+                    if 0 <= position < 6:
+                        window[position] = items[slot]
+            code = 0
+            for subsite in range(6):
+                code = 3 * code + window[subsite]
+            if table[code]:
+                cut[site + 3] = True
+        return cut
+
+    @numba.njit(cache=True)
+    def markov_units_kernel(random_numbers, A_after_A, A_after_B, overall_FA,
+                            first):
+        """Generates the units of Markov chains one after the other."""
+
+        units = np.empty(len(random_numbers), dtype=np.uint8)
+        previous = False
+        for idx in range(len(random_numbers)):
+            if first[idx]:
+                previous = random_numbers[idx] < overall_FA
+            elif previous:
+                previous = random_numbers[idx] < A_after_A
+            else:
+                previous = random_numbers[idx] < A_after_B
+            units[idx] = previous
+        return units
+
+    @numba.njit(cache=True)
+    def ngram_counts_kernel(monomers, offsets, max_length, weights):
+        """Counts the windows of length 1 to max_length starting at each unit
+        within its molecule, row n - 1 holding the counts of length n."""
+
+        counts = np.zeros((max_length, 2**max_length), dtype=weights.dtype)
+        for molecule in range(len(offsets) - 1):
+            end = offsets[molecule + 1]
+            weight = weights[molecule]
+            for start in range(offsets[molecule], end):
+                code = 0
+                for length in range(1, min(max_length, end - start) + 1):
+                    code = 2 * code + monomers[start + length - 1]
+                    counts[length - 1, code] += weight
+        return counts
+
+
+def numba_enzyme_cuts(monomers, offsets, sites, table, priorities):
+    """Same as numpy_enzyme_cuts, processing the sites one by one in order of
+    their priorities in a Numba kernel.
+
+    returns cut mask"""
+
+    return enzyme_cuts_kernel(np.ascontiguousarray(monomers, dtype=np.uint8),
+                              np.asarray(sites, dtype=np.int64),
+                              np.asarray(table),
+                              np.argsort(priorities, kind="stable"),
+                              SUBSITE_STATES["-"])
+
+
+def numba_markov_units(random_numbers, overall_FA, PA, first):
+    """Same as numpy_markov_units, generating one unit after the other in a
+    Numba kernel.
+
+    returns array of units (A = 1, B = 0)"""
+
+    A_after_A, A_after_B = markov_probabilities(overall_FA, PA)
+    return markov_units_kernel(random_numbers, A_after_A, A_after_B,
+                               overall_FA, np.asarray(first, dtype=bool))
+
+
+def numba_ngram_counts(monomers, offsets, max_length, weights=None):
+    """Same as numpy_ngram_counts, reading the windows of all lengths starting
+    at each unit at once in a Numba kernel.
+
+    returns list with array of number of windows per code for each length"""
+
+    if weights is None:
+        weights = np.ones(len(offsets) - 1, dtype=np.int64)
+    else:
+        weights = np.asarray(weights, dtype=np.float64)
+    counts = ngram_counts_kernel(np.ascontiguousarray(monomers, np.uint8),
+                                 np.asarray(offsets, dtype=np.int64),
+                                 max_length, weights)
+    return [counts[length - 1, :2**length]
+            for length in range(1, max_length + 1)]
+
+
+@lru_cache(maxsize=None)
+def numba_parity():
+    """Compiles the Numba kernels and compares them with the NumPy functions
+    for a small random polydisperse library.
+
+    returns True if all results are the same"""
+
+    rng = np.random.default_rng(0)
+    lengths = rng.integers(1, 60, 50)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    random_numbers = rng.random(offsets[-1])
+    first = np.zeros(offsets[-1], dtype=bool)
+    first[offsets[:-1]] = True
+    for overall_FA, PA in ((0.3, 0.4), (0.5, 1.0), (0.6, 1.6)):
+        if not np.array_equal(numba_markov_units(random_numbers, overall_FA,
+                                                 PA, first),
+                              numpy_markov_units(random_numbers, overall_FA,
+                                                 PA, first)):
+            return False
+    monomers = numpy_markov_units(random_numbers, 0.4, 0.8, first)
+    specificities = (("_BA", "XX_"), ("XXX", "XXX"), ("__A", "A__"),
+                     ("_BX", "BX_"))
+    for minus_specificity, plus_specificity in specificities:
+        table = specificity_table(minus_specificity, plus_specificity)
+        sites = find_sites(monomers, offsets, table)
+        priorities = rng.random(len(sites))
+        if not np.array_equal(numba_enzyme_cuts(monomers, offsets, sites,
+                                                table, priorities),
+                              numpy_enzyme_cuts(monomers, offsets, sites,
+                                                table, priorities)):
+            return False
+    for weights in (None, rng.integers(1, 5, len(lengths))):
+        numba_sweep = numba_ngram_counts(monomers, offsets, 5, weights)
+        numpy_sweep = numpy_ngram_counts(monomers, offsets, 5, weights)
+        for numba_counts, numpy_counts in zip(numba_sweep, numpy_sweep):
+            if (numba_counts.dtype != numpy_counts.dtype or
+                    not np.array_equal(numba_counts, numpy_counts)):
+                return False
+    return True
+
+
+def numba_kernels():
+    """Checks whether the Numba kernels can be used: Numba is installed,
+    USE_NUMBA is set and the kernels pass numba_parity.
+
+    returns True if the kernels can be used"""
+
+    if numba is None or not USE_NUMBA:
+        return False
+    try:
+        return numba_parity()
+    except Exception:
+        return False
+
+
+register_engine("markov units", Engine("numba", numba_markov_units,
+                                       available=numba_kernels))
+register_engine("enzyme cuts", Engine("numba", numba_enzyme_cuts,
+                                      available=numba_kernels))
+register_engine("ngram counts", Engine("numba", numba_ngram_counts,
+                                       available=numba_kernels))
+
+
+#### PACKED LIBRARIES ####
+
+# number of set bits for every possible byte, used if numpy lacks bitwise_count
+POPCOUNT_TABLE = np.array([bin(byte).count("1") for byte in range(256)],
+                          dtype=np.uint8)
+
+
+def pack_library(library):
+    """Packs a library array (see chitosan_library_array) into 1 bit per unit.
+    Each molecule starts at a new 64-bit word, bit i of a molecule (counted
+    from the least significant bit of its first word) being unit i.
+
+    returns packed library: (words, DP) with words of shape
+    (number_molecules, words per molecule) and dtype uint64"""
+
+    packed = np.packbits(library, axis=1, bitorder="little")
+    padding = -packed.shape[1] % 8
+    if padding:
+        packed = np.pad(packed, ((0, 0), (0, padding)))
+    words = np.ascontiguousarray(packed).view("<u8")
+    return (words, library.shape[1])
+
+
+def popcount(words, weights=None):
+    """Counts all set bits in the words of a packed library. If weights are
+    given, the bits of each molecule are counted weights[molecule] times.
+
+    returns number of set bits"""
+
+    if hasattr(np, "bitwise_count"):
+        bits = np.bitwise_count(words)
+    else:
+        bits = POPCOUNT_TABLE[words.view(np.uint8)]
+    if weights is None:
+        return int(bits.sum(dtype=np.int64))
+    return (bits.reshape(len(words), -1).sum(axis=1, dtype=np.int64) @
+            np.asarray(weights))
+
+
+def shift_packed(words, shift):
+    """Shifts all molecules of a packed library by 1 <= shift < 64 units, so
+    that bit i of the result is unit i + shift of the same molecule.
+
+    returns shifted words"""
+
+    carry = np.zeros_like(words)
+    carry[:, :-1] = words[:, 1:] << np.uint64(64 - shift)
+    return (words >> np.uint64(shift)) | carry
+
+
+def packed_window_mask(words, DP, window):
+    """Marks the bits of each molecule at which a window of given length
+    (2 = diad, 3 = triad) starts and still lies within the molecule.
+
+    returns mask of shape (words per molecule,)"""
+
+    bits = np.arange(words.shape[1] * 64) < DP - window + 1
+    return np.packbits(bits, bitorder="little").view("<u8")
+
+
+def packed_ngram_counts(monomers, offsets, max_length, weights=None):
+    """Same as numpy_ngram_counts for libraries of molecules of the same DP:
+    the library is packed (see pack_library), and the windows with a given
+    code are the set bits of the AND of the molecules shifted by each unit
+    of the window (NOT for unit B), e.g. AB = first & ~second. The windows
+    of length n + 1 extend those of length n by one more unit, so all n-ads
+    take 2 + 4 + ... + 2**max_length bitwise operations and popcounts.
+
+    returns list with array of number of windows per code for each length,
+    or None for polydisperse libraries"""
+
+    lengths = np.diff(offsets)
+    if (len(lengths) == 0 or np.any(lengths != lengths[0]) or
+            max_length > 64):
+        return None
+    words, DP = pack_library(monomers.reshape(len(lengths), lengths[0]))
+    dtype = np.int64 if weights is None else np.float64
+    # windows matching each code of the current length, first the empty code
+    matches = [~np.zeros_like(words)]
+    ngram_counts = []
+    for length in range(1, max_length + 1):
+        unit = words if length == 1 else shift_packed(words, length - 1)
+        not_unit = ~unit
+        matches = [match & bits for match in matches
+                   for bits in (not_unit, unit)]
+        mask = packed_window_mask(words, DP, length)
+        ngram_counts.append(np.array([popcount(match & mask, weights)
+                                      for match in matches], dtype=dtype))
+    return ngram_counts
+
+
+register_engine("ngram counts", Engine("packed", packed_ngram_counts))
+
+
+#### RESULT CACHE ####
+
+# version of the cached results, to be increased whenever the simulation
+# changes so that older results on disk are no longer used
+RESULT_CACHE_VERSION = 2
+# upper limits (in bytes) for the results kept in memory and on disk
+RESULT_CACHE_BYTES = 64 * 2**20
+RESULT_DISK_BYTES = 2**30
+RESULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "lcp_simulator_cache")
+
+
+def canonical_parameters(value):
+    """Converts simulation parameters to a canonical form for hashing:
+    tuples to lists and all numbers (also numpy numbers) to ints if they are
+    whole numbers and to floats otherwise, so that e.g. DP 100 and 100.0 or
+    (1, 2) and [1, 2] give the same key, while large seeds stay exact.
+
+    returns canonical parameters"""
+
+    if isinstance(value, dict):
+        return {str(key): canonical_parameters(item)
+                for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [canonical_parameters(item) for item in value]
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return int(value) if float(value).is_integer() else float(value)
+    if value is None or isinstance(value, str):
+        return value
+    return repr(value)
+
+
+class ResultCache:
+    """Cache of simulation results (lists of arrays, e.g. composition
+    matrices) under a hash of their parameters (see canonical_parameters):
+    the most recently used results are kept in memory up to memory_bytes,
+    and all results are written to directory (.npz files) up to disk_bytes,
+    the least recently used ones being removed first. Files that cannot be
+    read are removed and count as misses. Counts hits in memory and on
+    disk, misses and evictions."""
+
+    def __init__(self, memory_bytes, directory=None, disk_bytes=0):
+        self.memory_bytes = memory_bytes
+        self.directory = directory
+        self.disk_bytes = disk_bytes
+        self.entries = OrderedDict()
+        self.entries_bytes = 0
+        self.lock = threading.Lock()
+        self.counters = {"memory hits": 0, "disk hits": 0, "misses": 0,
+                         "memory evictions": 0, "disk evictions": 0}
+
+    def key(self, kind, parameters):
+        text = json.dumps([RESULT_CACHE_VERSION, kind,
+                           canonical_parameters(parameters)],
+                          sort_keys=True)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, "%s.npz" % key)
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.counters["memory hits"] += 1
+                return self.entries[key]
+        arrays = None
+        if self.directory is not None:
+            try:
+                with np.load(self.path(key)) as stored:
+                    arrays = [stored["arr_%d" % idx]
+                              for idx in range(len(stored.files))]
+                # files are evicted by last use
+                os.utime(self.path(key))
+            except FileNotFoundError:
+                arrays = None
+            except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+                # corrupted or truncated file, calculated again
+                arrays = None
+                try:
+                    os.remove(self.path(key))
+                except OSError:
+                    pass
+        with self.lock:
+            if arrays is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["disk hits"] += 1
+            self.remember(key, arrays)
+        return arrays
+
+    def put(self, key, arrays):
+        with self.lock:
+            self.remember(key, arrays)
+        if self.directory is not None and self.disk_bytes > 0:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                temporary = "%s.%s.tmp.npz" % (self.path(key)[:-4],
+                                               os.getpid())
+                np.savez(temporary, *arrays)
+                os.replace(temporary, self.path(key))
+                self.evict_disk()
+            except OSError:
+                pass
+
+    def remember(self, key, arrays):
+        size = sum(array.nbytes for array in arrays)
+        if key in self.entries or size > self.memory_bytes:
+            return
+        self.entries[key] = arrays
+        self.entries_bytes += size
+        while self.entries_bytes > self.memory_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.entries_bytes -= sum(array.nbytes for array in evicted)
+            self.counters["memory evictions"] += 1
+
+    def evict_disk(self):
+        files = [entry for entry in os.scandir(self.directory)
+                 if entry.name.endswith(".npz") and ".tmp" not in entry.name]
+        files.sort(key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in files)
+        for entry in files:
+            if total <= self.disk_bytes:
+                break
+            total -= entry.stat().st_size
+            try:
+                os.remove(entry.path)
+                self.counters["disk evictions"] += 1
+            except OSError:
+                pass
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["entries in memory"] = len(self.entries)
+            stats["bytes in memory"] = self.entries_bytes
+        requests = stats["memory hits"] + stats["disk hits"] + stats["misses"]
+        hits = stats["memory hits"] + stats["disk hits"]
+        stats["hit rate"] = hits / requests if requests else 0.0
+        return stats
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.entries_bytes = 0
+
+
+RESULT_CACHE = ResultCache(RESULT_CACHE_BYTES, RESULT_CACHE_DIR,
+                           RESULT_DISK_BYTES)
+
+
+def cached_arrays(kind, parameters, compute):
+    """Looks up the result of a simulation of a given kind (e.g. "digest")
+    with given parameters in RESULT_CACHE, or calculates it via compute and
+    stores it. Only results with a given seed are cached, since all others
+    are supposed to differ.
+
+    returns list of arrays"""
+
+    if parameters.get("seed") is None:
+        return compute()
+    key = RESULT_CACHE.key(kind, parameters)
+    arrays = RESULT_CACHE.get(key)
+    if arrays is None:
+        arrays = [np.asarray(array) for array in compute()]
+        RESULT_CACHE.put(key, arrays)
+    return arrays
+
 
 @anvil.server.callable
-def histogram_DP_FAp_molar_enzyme(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules, minus_specificity, plus_specificity, efficiency):
-    # generate library
-    library = chitosan_library(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules)
-    # cleave and count products per DP and track FA
-    product_dict = {}
-    all_products = 0
-    for substrate in library:
-        product_list = enzyme(substrate, minus_specificity, plus_specificity, efficiency)
-        for product in product_list:
-            all_products += 1
-            if len(product) in product_dict:
-                product_dict[len(product)][0] += 1
-                product_dict[len(product)][1] += product.count("A")
+def result_cache_stats():
+    """Hits, misses and evictions of the result cache (see ResultCache).
+
+    returns dictionary of counters and hit rate"""
+
+    return RESULT_CACHE.stats()
+
+
+# upper limit (in bytes) for the bit-packed libraries kept for further
+# digestions (see cached_batches)
+LIBRARY_CACHE_BYTES = 256 * 2**20
+LIBRARY_CACHE = ResultCache(LIBRARY_CACHE_BYTES)
+
+
+def library_parameters(DP, overall_FA, pattern, FA_pattern, A_blocks,
+                       B_blocks, molecules, seed, stream=(), memory_limit=None,
+                       polydispersity=None, PA=None):
+    """Generation parameters of a library (see simulated_digest, stream
+    being appended to the generation stream) under which it is kept in
+    LIBRARY_CACHE.
+
+    returns dictionary of parameters"""
+
+    return {"DP": DP, "overall_FA": overall_FA, "pattern": pattern,
+            "FA_pattern": FA_pattern, "A_blocks": A_blocks,
+            "B_blocks": B_blocks, "molecules": molecules, "seed": seed,
+            "stream": (GENERATE_STREAM, *stream),
+            "memory_limit": memory_limit,
+            "polydispersity": polydispersity, "PA": PA}
+
+
+def pack_batch(batch):
+    """Packs a batch of a library (library array or polydisperse library)
+    with 8 units per byte (see np.packbits) for LIBRARY_CACHE.
+
+    returns [packed units, offsets], offsets only holding the DP for
+    library arrays"""
+
+    if isinstance(batch, tuple):
+        return [np.packbits(batch[0]), batch[1]]
+    return [np.packbits(batch, axis=1), np.array([batch.shape[1]])]
+
+
+def unpack_batch(packed, offsets):
+    """Unpacks a batch packed by pack_batch.
+
+    returns library array or polydisperse library"""
+
+    if len(offsets) == 1:
+        return np.unpackbits(packed, axis=1, count=int(offsets[0]))
+    return (np.unpackbits(packed, count=int(offsets[-1])), offsets)
+
+
+def cached_batches(parameters, batches):
+    """Yields the batches of a generated library (library arrays of
+    library_batches or polydisperse libraries of polydisperse_batches) from
+    LIBRARY_CACHE under its generation parameters, or from batches, which
+    are then stored if the whole library fits into LIBRARY_CACHE. Libraries
+    are kept with 8 units per byte (see pack_batch), or as library file if
+    they are too large (see filed_batches). Only libraries with a given seed
+    are stored, since all others are supposed to differ.
+
+    yields batches in the same order as batches"""
+
+    if parameters.get("seed") is None:
+        yield from batches
+        return
+    key = LIBRARY_CACHE.key("library", parameters)
+    stored = LIBRARY_CACHE.get(key)
+    if stored is not None:
+        for packed, offsets in zip(stored[::2], stored[1::2]):
+            yield unpack_batch(packed, offsets)
+        return
+    if library_file_fits(parameters):
+        yield from filed_batches(key, parameters, batches)
+        return
+    packed_batches = []
+    size = 0
+    for batch in batches:
+        if packed_batches is not None:
+            packed_batches += pack_batch(batch)
+            size += packed_batches[-2].nbytes + packed_batches[-1].nbytes
+            if size > LIBRARY_CACHE.memory_bytes:
+                packed_batches = None
+        yield batch
+    if packed_batches is not None:
+        LIBRARY_CACHE.put(key, packed_batches)
+
+
+#### LIBRARY FILES ####
+
+# Libraries too large for LIBRARY_CACHE are kept as .npy files of their
+# library array in LIBRARY_FILE_DIR (up to LIBRARY_DISK_BYTES, the least
+# recently used ones being removed first). They are reopened memory-mapped,
+# so that further digestions read them batch by batch instead of generating
+# them again, and worker processes share their pages instead of copies. A
+# JSON sidecar (<key>.json) holds the generation parameters and is written
+# last, so that only complete libraries are found. Polydisperse libraries
+# are only kept in LIBRARY_CACHE.
+
+LIBRARY_FILE_DIR = os.path.join(tempfile.gettempdir(),
+                                "lcp_simulator_libraries")
+LIBRARY_DISK_BYTES = 4 * 2**30
+
+
+def library_file_paths(key):
+    """Paths of the library file kept under a key of LIBRARY_CACHE.
+
+    returns (library path, sidecar path)"""
+
+    base = os.path.join(LIBRARY_FILE_DIR, key)
+    return "%s.npy" % base, "%s.json" % base
+
+
+def library_file_fits(parameters):
+    """Decides whether a library with given generation parameters (see
+    library_parameters) is kept as library file: library arrays too large
+    for LIBRARY_CACHE (8 units per byte) that fit into LIBRARY_DISK_BYTES
+    (one byte per unit).
+
+    returns bool"""
+
+    size = parameters["DP"] * parameters["molecules"]
+    return (parameters["polydispersity"] is None and
+            size / 8 > LIBRARY_CACHE.memory_bytes and
+            size <= LIBRARY_DISK_BYTES)
+
+
+def create_library_file(key, parameters):
+    """Creates a temporary .npy file for the library array with given
+    generation parameters, which is filled via write_batches and completed
+    via finish_library_file.
+
+    returns path of the temporary file"""
+
+    library_path, _ = library_file_paths(key)
+    os.makedirs(LIBRARY_FILE_DIR, exist_ok=True)
+    path = "%s.%s.tmp.npy" % (library_path[:-4], os.getpid())
+    library = np.lib.format.open_memmap(
+        path, mode="w+", dtype=np.uint8,
+        shape=(int(parameters["molecules"]), int(parameters["DP"])))
+    del library
+    return path
+
+
+def write_batches(library, batches, first_molecule=0):
+    """Writes batches of a library array into a library file opened
+    memory-mapped for writing (see create_library_file), the first batch
+    at molecule first_molecule.
+
+    yields the batches"""
+
+    for batch in batches:
+        library[first_molecule:first_molecule + len(batch)] = batch
+        first_molecule += len(batch)
+        yield batch
+    library.flush()
+
+
+def finish_library_file(path, key, parameters):
+    """Moves a filled temporary library file (see create_library_file) to
+    its place in LIBRARY_FILE_DIR, writes its sidecar and removes the least
+    recently used library files beyond LIBRARY_DISK_BYTES."""
+
+    library_path, sidecar_path = library_file_paths(key)
+    os.replace(path, library_path)
+    temporary = "%s.%s.tmp" % (sidecar_path, os.getpid())
+    with open(temporary, "w") as sidecar:
+        json.dump(canonical_parameters(parameters), sidecar)
+    os.replace(temporary, sidecar_path)
+    files = [entry for entry in os.scandir(LIBRARY_FILE_DIR)
+             if entry.name.endswith(".json")]
+    files.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    total = 0
+    for entry in files:
+        library_path, _ = library_file_paths(entry.name[:-5])
+        try:
+            total += os.path.getsize(library_path)
+        except OSError:
+            pass
+        if total > LIBRARY_DISK_BYTES:
+            remove_library_file(entry.name[:-5])
+
+
+def remove_library_file(key):
+    """Removes the library file kept under a key of LIBRARY_CACHE, if
+    any."""
+
+    for path in library_file_paths(key)[::-1]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def load_library(key):
+    """Opens the library file kept under a key of LIBRARY_CACHE
+    memory-mapped and read-only. Files that cannot be read or do not match
+    their sidecar are removed.
+
+    returns library array, or None if there is none"""
+
+    library_path, sidecar_path = library_file_paths(key)
+    try:
+        with open(sidecar_path) as sidecar:
+            parameters = json.load(sidecar)
+        library = np.load(library_path, mmap_mode="r")
+        # files are evicted by last use
+        os.utime(sidecar_path)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        remove_library_file(key)
+        return None
+    if library.shape != (parameters["molecules"], parameters["DP"]):
+        del library
+        remove_library_file(key)
+        return None
+    return library
+
+
+def array_batches(library, memory_limit=None, chunks=None):
+    """Splits a library array (e.g. opened via load_library) into the
+    batches of library_batches with merge_chunks False, as views of the
+    library. If chunks is given, only the chunks with these indices are
+    returned.
+
+    yields library arrays of shape (molecules in batch, DP)"""
+
+    max_molecules = batch_molecules(library.shape[1], memory_limit)
+    for idx, chunk in enumerate(molecule_chunks(len(library))):
+        if chunks is not None and idx not in chunks:
+            continue
+        for start in range(chunk[0], chunk[-1] + 1, max_molecules):
+            yield library[start:min(start + max_molecules, chunk[-1] + 1)]
+
+
+def filed_batches(key, parameters, batches):
+    """Yields the batches of a library array from its library file under a
+    key of LIBRARY_CACHE (see load_library), or from batches, which are
+    then written into a new library file (see create_library_file).
+
+    yields batches in the same order as batches"""
+
+    library = load_library(key)
+    if library is not None:
+        yield from array_batches(library, parameters["memory_limit"])
+        return
+    try:
+        path = create_library_file(key, parameters)
+    except OSError:
+        yield from batches
+        return
+    try:
+        yield from write_batches(np.load(path, mmap_mode="r+"), batches)
+        finish_library_file(path, key, parameters)
+    finally:
+        # only left if the library was not generated completely
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+#### SHARED MEMORY ####
+
+# Worker processes exchange arrays (libraries and composition counts) via
+# blocks of shared memory instead of pickling them.
+
+
+def share_array(array):
+    """Copies an array into a new block of shared memory, which other
+    processes attach via attach_array without copying or pickling it. The
+    block has to be closed and unlinked by its creator when done.
+
+    returns (SharedMemory, descriptor: {"name", "shape", "dtype"})"""
+
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return block, {"name": block.name, "shape": list(array.shape),
+                   "dtype": array.dtype.str}
+
+
+def attach_array(descriptor):
+    """Attaches an array in shared memory (see share_array). The block has to
+    be kept (and closed when done) as long as the array is used.
+
+    returns (SharedMemory, array)"""
+
+    block = shared_memory.SharedMemory(name=descriptor["name"])
+    return block, np.ndarray(descriptor["shape"],
+                             dtype=np.dtype(descriptor["dtype"]),
+                             buffer=block.buf)
+
+
+def share_arrays(arrays):
+    """Copies a list of arrays (e.g. the packed batches of a library, see
+    pack_batch) into one new block of shared memory, each starting at a
+    multiple of 8 bytes. Other processes attach them via attach_arrays. The
+    block has to be closed and unlinked by its creator when done.
+
+    returns (SharedMemory, descriptor: {"name", "arrays"})"""
+
+    starts = [0]
+    for array in arrays:
+        starts.append(starts[-1] + -(-array.nbytes // 8) * 8)
+    block = shared_memory.SharedMemory(create=True, size=max(starts[-1], 1))
+    for array, start in zip(arrays, starts):
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf,
+                   offset=start)[...] = array
+    return block, {"name": block.name,
+                   "arrays": [(start, list(array.shape), array.dtype.str)
+                              for array, start in zip(arrays, starts)]}
+
+
+def attach_arrays(descriptor):
+    """Attaches the arrays in shared memory of share_arrays. The block has to
+    be kept (and closed when done) as long as the arrays are used.
+
+    returns (SharedMemory, list of arrays)"""
+
+    block = shared_memory.SharedMemory(name=descriptor["name"])
+    return block, [np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf,
+                              offset=start)
+                   for start, shape, dtype in descriptor["arrays"]]
+
+
+#### PARALLEL DIGESTION ####
+
+# worker processes for the digestion of one library (None: one per CPU)
+DIGEST_WORKERS = None
+
+
+def digest_chunks(parameters, chunks, slab=None, task=0, shared=None,
+                  keep=False, library_file=None):
+    """Generates and cleaves the given chunks of a library (see
+    simulate_digest for parameters) in a worker process and counts the
+    products per composition (see composition_matrix) into row task of a
+    composition count slab in shared memory (see share_array), as far as
+    they fit. If shared is given as (descriptor, batch indices), the
+    batches are unpacked from a library of LIBRARY_CACHE in shared memory
+    (see share_arrays) instead of being generated. With keep, the generated
+    batches are also returned packed (see pack_batch) for LIBRARY_CACHE.
+    If library_file is given as (path, mmap_mode), the batches are read
+    from a library file (mmap_mode "r", see load_library), or the generated
+    batches are written into one (mmap_mode "r+", see create_library_file).
+
+    returns (compositions that do not fit into the slab (all without slab),
+    list of packed batches or None)"""
+
+    block = None
+    if library_file is not None and library_file[1] == "r":
+        batches = array_batches(np.load(*library_file), chunks=chunks)
+    elif shared is not None:
+        block, stored = attach_arrays(shared[0])
+        batches = (unpack_batch(stored[2 * idx], stored[2 * idx + 1])
+                   for idx in shared[1])
+    elif parameters["polydispersity"] is not None:
+        batches = polydisperse_batches(
+            parameters["DP"], parameters["overall_FA"], parameters["pattern"],
+            parameters["FA_pattern"], parameters["A_blocks"],
+            parameters["B_blocks"], parameters["molecules"],
+            parameters["polydispersity"], parameters["seed"],
+            (GENERATE_STREAM, *parameters["stream"]), parameters["PA"],
+            chunks)
+    else:
+        batches = library_batches(
+            parameters["DP"], parameters["overall_FA"], parameters["pattern"],
+            parameters["FA_pattern"], parameters["A_blocks"],
+            parameters["B_blocks"], parameters["molecules"],
+            parameters["seed"], (GENERATE_STREAM, *parameters["stream"]),
+            PA=parameters["PA"], merge_chunks=False, chunks=chunks)
+    if library_file is not None and library_file[1] == "r+":
+        batches = write_batches(np.load(*library_file), batches,
+                                chunks[0] * CHUNK_MOLECULES)
+    packed_batches = [] if keep else None
+
+    def kept(batches):
+        for batch in batches:
+            packed_batches.extend(pack_batch(batch))
+            yield batch
+
+    if keep:
+        batches = kept(batches)
+    try:
+        compositions = composition_matrix(digest_batches(
+            batches, parameters["molecules"], parameters["seed"],
+            parameters["digestion"], *parameters["stream"],
+            first_chunk=chunks[0]))
+    finally:
+        if block is not None:
+            # the views into the block need to be released before closing it
+            del stored
+            block.close()
+    if slab is None:
+        return compositions, packed_batches
+    block, counts = attach_array(slab)
+    A_counts, B_counts, composition_counts = compositions
+    fits = (A_counts < counts.shape[1]) & (B_counts < counts.shape[2])
+    counts[task, A_counts[fits], B_counts[fits]] += composition_counts[fits]
+    del counts
+    block.close()
+    return tuple(array[~fits] for array in compositions), packed_batches
+
+
+def batch_chunks(stored):
+    """Finds the chunk (see molecule_chunks) of each packed batch of a library
+    in LIBRARY_CACHE (see cached_batches).
+
+    returns array with the chunk index of each batch"""
+
+    molecules = [packed.shape[0] if len(offsets) == 1 else len(offsets) - 1
+                 for packed, offsets in zip(stored[::2], stored[1::2])]
+    first_molecules = np.concatenate([[0], np.cumsum(molecules)[:-1]])
+    return first_molecules // CHUNK_MOLECULES
+
+
+def parallel_composition_matrix(parameters, workers=None, default_seed=None):
+    """Generates and cleaves a library (see simulate_digest for parameters)
+    as composition_matrix(digested_library(...)), but split into contiguous
+    ranges of chunks processed by a pool of worker processes (workers,
+    DIGEST_WORKERS if None). A library kept in LIBRARY_CACHE is shared with
+    the workers (see share_arrays) instead of being generated again, and a
+    library that is generated by the workers is added to LIBRARY_CACHE if it
+    fits. Larger libraries are read from or written into a library file by
+    the workers instead (see library_file_fits). Each worker adds its
+    product counts into its own row of a slab in shared memory, which is
+    summed at the end. Every chunk has its own random numbers and counts
+    are whole numbers, so the result does not depend on the number of
+    workers. Expected products and libraries of one chunk or with A- and
+    B-blocks are cleaved in process. Libraries without a seed are generated
+    with default_seed (a new one if None) and never kept.
+
+    returns compositions: (A_counts, B_counts, counts)"""
+
+    if workers is None:
+        workers = DIGEST_WORKERS
+    if workers is None:
+        workers = os.cpu_count() or 1
+    number_chunks = len(molecule_chunks(parameters["molecules"]))
+    workers = min(workers, number_chunks)
+    seeded = parameters["seed"] is not None
+    seed = parameters["seed"] if seeded else default_seed
+    if (workers <= 1 or parameters["expected"] or
+            parameters["A_blocks"] != 0 or parameters["B_blocks"] != 0):
+        return composition_matrix(digested_library(
+            parameters["DP"], parameters["overall_FA"], parameters["pattern"],
+            parameters["FA_pattern"], parameters["A_blocks"],
+            parameters["B_blocks"], parameters["molecules"], seed,
+            parameters["digestion"], *parameters["stream"],
+            polydispersity=parameters["polydispersity"], PA=parameters["PA"],
+            expected=parameters["expected"], keep=seeded))
+    key = None
+    stored = None
+    library_file = None
+    if seeded:
+        generation = library_parameters(
+            parameters["DP"], parameters["overall_FA"], parameters["pattern"],
+            parameters["FA_pattern"], parameters["A_blocks"],
+            parameters["B_blocks"], parameters["molecules"],
+            parameters["seed"], parameters["stream"],
+            polydispersity=parameters["polydispersity"], PA=parameters["PA"])
+        key = LIBRARY_CACHE.key("library", generation)
+        stored = LIBRARY_CACHE.get(key)
+        if stored is None and library_file_fits(generation):
+            if load_library(key) is not None:
+                library_file = (library_file_paths(key)[0], "r")
             else:
-                product_dict[len(product)] = [1, product.count("A")]
-    # calculate average FA and prepare output list
-    DP_list = []
-    average_FA_list = []
-    mole_fraction_list = []
-    for DP in range(min(product_dict), max(product_dict) + 1):
-        if DP in product_dict:
-            DP_list.append(DP)
-            mole_fraction = product_dict[DP][0] / all_products
-            mole_fraction_list.append(mole_fraction)
-            average_FA = product_dict[DP][1] / (DP * product_dict[DP][0])
-            average_FA_list.append(average_FA)
-    output_list = [DP_list, mole_fraction_list, average_FA_list]
-    return(output_list)
+                try:
+                    library_file = (create_library_file(key, generation),
+                                    "r+")
+                except OSError:
+                    pass
+    parameters = dict(parameters, seed=resolve_seed(seed))
+    tasks = [range(chunks[0], chunks[-1] + 1)
+             for chunks in np.array_split(np.arange(number_chunks), workers)]
+    shared = [None] * workers
+    library_block = None
+    if stored is not None:
+        library_block, descriptor = share_arrays(stored)
+        chunk_of_batch = batch_chunks(stored)
+        shared = [(descriptor, np.flatnonzero(
+            (chunk_of_batch >= chunks[0]) &
+            (chunk_of_batch <= chunks[-1])).tolist()) for chunks in tasks]
+    # generated libraries are kept if they are likely to fit (see
+    # cached_batches)
+    keep = (key is not None and stored is None and library_file is None and
+            parameters["DP"] * parameters["molecules"] / 8 <=
+            LIBRARY_CACHE.memory_bytes)
+    size = parameters["DP"] + 1
+    block = None
+    if (size <= DENSE_COMPOSITION_UNITS and
+            workers * size * size * 8 <= MEMORY_LIMIT):
+        block, slab = share_array(np.zeros((workers, size, size)))
+    # the engines are timed once here rather than in every worker
+    ENGINE_TUNER.current()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(
+                digest_chunks, [parameters] * workers, tasks,
+                [slab if block is not None else None] * workers,
+                range(workers), shared, [keep] * workers,
+                [library_file] * workers))
+        digested = [((A_counts + B_counts, A_counts), counts)
+                    for (A_counts, B_counts, counts), _ in results]
+        if block is not None:
+            _, counts = attach_array(slab)
+            matrix = counts.sum(axis=0)
+            del counts
+            A_counts, B_counts = np.nonzero(matrix)
+            digested.append(((A_counts + B_counts, A_counts),
+                             matrix[A_counts, B_counts]))
+        if library_file is not None and library_file[1] == "r+":
+            finish_library_file(library_file[0], key, generation)
+    finally:
+        for created in (block, library_block):
+            if created is not None:
+                created.close()
+                created.unlink()
+        if library_file is not None and library_file[1] == "r+":
+            # only left if the library was not generated completely
+            try:
+                os.remove(library_file[0])
+            except OSError:
+                pass
+    if keep:
+        packed_batches = [array for _, packed in results for array in packed]
+        if (sum(array.nbytes for array in packed_batches) <=
+                LIBRARY_CACHE.memory_bytes):
+            LIBRARY_CACHE.put(key, packed_batches)
+    return composition_matrix(digested)
+
+
+#### DIGEST SIMULATION ####
+
+# DigestResult methods that clients can request via digest_outputs
+DIGEST_OUTPUTS = ("histogram", "profile", "block_sizes")
+
+
+class DigestResult:
+    """Products of one library digestion (see simulate_digest), counted per
+    composition (see composition_matrix). The DP histograms, product
+    profiles and block sizes are only calculated when requested, and each is
+    kept for further requests."""
+
+    def __init__(self, compositions, digestion):
+        self.compositions = compositions
+        self.digestion = digestion
+        self.outputs = {}
+
+    def histogram(self, mass_A=None, mass_B=None):
+        """DP histogram, molar or weight if mass_A and mass_B are given (see
+        DP_histogram)."""
+
+        key = ("histogram", mass_A, mass_B)
+        if key not in self.outputs:
+            # 17 = mass difference between GlcN and anhydromannose
+            mass_offset = 17 if self.digestion[0] == "nano2" else 0
+            self.outputs[key] = DP_histogram(self.compositions, mass_A, mass_B,
+                                             mass_offset)
+        return self.outputs[key]
+
+    def profile(self, mass_A=None, mass_B=None):
+        """Product profile, molar or weight if mass_A and mass_B are given
+        (see composition_profile)."""
+
+        key = ("profile", mass_A, mass_B)
+        if key not in self.outputs:
+            self.outputs[key] = composition_profile(self.compositions, mass_A,
+                                                    mass_B)
+        return self.outputs[key]
+
+    def block_sizes(self, A_cutoff=False, DP_cutoff=False, ion_eff=False):
+        """Block sizes An, Bn, Aw and Bw (see composition_blocks)."""
+
+        key = ("block_sizes", A_cutoff, DP_cutoff, ion_eff)
+        if key not in self.outputs:
+            self.outputs[key] = composition_blocks(self.compositions, A_cutoff,
+                                                   DP_cutoff, ion_eff)
+        return self.outputs[key]
+
+
+def simulate_digest(spec, workers=None, default_seed=None):
+    """Generates and digests a library once as specified by spec, a
+    dictionary with the arguments of digested_library: "DP", "overall_FA",
+    "pattern", "FA_pattern" (or "strength", see FA_pattern_calc), "A_blocks",
+    "B_blocks", "molecules" and "digestion" (see digest_library), and
+    optionally "seed", "polydispersity", "PA", "stream", "mode"
+    ("simulate" or "expected", which raises ValueError where the expected
+    products are not known, see expected_products). The library is cleaved
+    by workers processes (see parallel_composition_matrix), which is not
+    part of spec so that clients cannot choose it. Without a seed in spec,
+    the library is generated with default_seed (e.g. the seed shared by all
+    points of a sweep), but neither it nor the result are cached.
+
+    returns DigestResult"""
+
+    FA_pattern = spec.get("FA_pattern")
+    if FA_pattern is None:
+        FA_pattern = FA_pattern_calc(spec["overall_FA"], spec["pattern"],
+                                     spec.get("strength", 0))
+    digestion = tuple(spec["digestion"])
+    parameters = {"DP": spec["DP"], "overall_FA": spec["overall_FA"],
+                  "pattern": spec["pattern"], "FA_pattern": FA_pattern,
+                  "A_blocks": spec["A_blocks"], "B_blocks": spec["B_blocks"],
+                  "molecules": spec["molecules"], "seed": spec.get("seed"),
+                  "digestion": digestion, "stream": spec.get("stream", ()),
+                  "polydispersity": spec.get("polydispersity"),
+                  "PA": spec.get("PA"),
+                  "expected": spec.get("mode", "simulate") == "expected"}
+    compositions = cached_arrays(
+        "digest", parameters,
+        lambda: parallel_composition_matrix(parameters, workers,
+                                            default_seed))
+    return DigestResult(tuple(compositions), digestion)
+
+
+@anvil.server.callable
+def digest_outputs(spec, outputs):
+    """Calculates several outputs of one library digestion (see
+    simulate_digest), e.g. the molar and weight histograms for the same
+    library. Each output is given as name of a DigestResult method and its
+    arguments: [["histogram"], ["histogram", mass_A, mass_B], ["profile"],
+    ["block_sizes", A_cutoff, DP_cutoff, ion_eff]]. Raises ValueError for
+    names not in DIGEST_OUTPUTS.
+
+    returns list of outputs in the given order"""
+
+    for output in outputs:
+        if output[0] not in DIGEST_OUTPUTS:
+            raise ValueError("unknown output %s" % output[0])
+    result = simulate_digest(spec)
+    return [getattr(result, output[0])(*output[1:]) for output in outputs]
+
+
+#### DP HISTOGRAM ####
+
+@anvil.server.callable
+def histogram_DP_FAp_molar_enzyme(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules, minus_specificity, plus_specificity, efficiency, seed=None, polydispersity=None):
+    # generate library, cleave and count products per composition
+    result = simulate_digest({"DP": DP, "overall_FA": overall_FA,
+                              "pattern": pattern, "FA_pattern": FA_pattern,
+                              "A_blocks": A_blocks, "B_blocks": B_blocks,
+                              "molecules": molecules,
+                              "digestion": ("enzyme", minus_specificity,
+                                            plus_specificity, efficiency),
+                              "seed": seed, "polydispersity": polydispersity})
+    # calculate mole fraction and average FA per DP
+    return(result.histogram())
 
     
 @anvil.server.callable
-def histogram_DP_FAp_molar_nano2(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules, cuts):
-    # generate library
-    library = chitosan_library(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules)
-    # cleave and count products per DP and track FA
-    product_dict = {}
-    all_products = 0
-    for substrate in library:
-        product_list = nano2(substrate, cuts)
-        for product in product_list:
-            all_products += 1
-            if len(product) in product_dict:
-                product_dict[len(product)][0] += 1
-                product_dict[len(product)][1] += product.count("A")
-            else:
-                product_dict[len(product)] = [1, product.count("A")]
-    # calculate average FA and prepare output list
-    DP_list = []
-    average_FA_list = []
-    mole_fraction_list = []
-    for DP in range(min(product_dict), max(product_dict) + 1):
-        if DP in product_dict:
-            DP_list.append(DP)
-            mole_fraction = product_dict[DP][0] / all_products
-            mole_fraction_list.append(mole_fraction)
-            average_FA = product_dict[DP][1] / (DP * product_dict[DP][0])
-            average_FA_list.append(average_FA)
-    output_list = [DP_list, mole_fraction_list, average_FA_list]
-    return(output_list)
+def histogram_DP_FAp_molar_nano2(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules, cuts, seed=None, polydispersity=None, cut_distribution="fixed", mode="simulate"):
+    # generate library, cleave and count products per composition
+    result = simulate_digest({"DP": DP, "overall_FA": overall_FA,
+                              "pattern": pattern, "FA_pattern": FA_pattern,
+                              "A_blocks": A_blocks, "B_blocks": B_blocks,
+                              "molecules": molecules,
+                              "digestion": ("nano2", cuts, cut_distribution),
+                              "seed": seed, "polydispersity": polydispersity,
+                              "mode": mode})
+    # calculate mole fraction and average FA per DP
+    return(result.histogram())
 
     
 @anvil.server.callable
-def histogram_DP_FAp_weight_enzyme(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules, minus_specificity, plus_specificity, efficiency, mass_A, mass_B):
-    # generate library
-    library = chitosan_library(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules)
-    # cleave and count products per DP and track FA
-    product_dict = {}
-    all_products = 0
-    for substrate in library:
-        product_list = enzyme(substrate, minus_specificity, plus_specificity, efficiency)
-        for product in product_list:
-            all_products += 1
-            if len(product) in product_dict:
-                product_dict[len(product)][0] += 1
-                product_dict[len(product)][1] += product.count("A")
-            else:
-                product_dict[len(product)] = [1, product.count("A")]
-    # calculate average FA and prepare output list
-    DP_list = []
-    average_FA_list = []
-    mass_mole_fraction_list = []
-    mass_mole_fraction_sum = 0
-    weight_fraction_list = []
-    for DP in range(min(product_dict), max(product_dict) + 1):
-        if DP in product_dict:
-            DP_list.append(DP)
-            mole_fraction = product_dict[DP][0] / all_products
-            average_FA = product_dict[DP][1] / (DP * product_dict[DP][0])
-            average_FA_list.append(average_FA)
-            average_mass = DP * (average_FA * mass_A + (1-average_FA) * mass_B) - (DP-1)*18
-            mass_mole_fraction = mole_fraction * average_mass
-            mass_mole_fraction_list.append(mass_mole_fraction)
-            mass_mole_fraction_sum += mass_mole_fraction
-    for mass_mole_fraction in mass_mole_fraction_list:
-        weight_fraction = mass_mole_fraction / mass_mole_fraction_sum
-        weight_fraction_list.append(weight_fraction)
-    output_list = [DP_list, weight_fraction_list, average_FA_list]
-    return(output_list)
+def histogram_DP_FAp_weight_enzyme(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules, minus_specificity, plus_specificity, efficiency, mass_A, mass_B, seed=None, polydispersity=None):
+    # generate library, cleave and count products per composition
+    result = simulate_digest({"DP": DP, "overall_FA": overall_FA,
+                              "pattern": pattern, "FA_pattern": FA_pattern,
+                              "A_blocks": A_blocks, "B_blocks": B_blocks,
+                              "molecules": molecules,
+                              "digestion": ("enzyme", minus_specificity,
+                                            plus_specificity, efficiency),
+                              "seed": seed, "polydispersity": polydispersity})
+    # calculate weight fraction and average FA per DP
+    return(result.histogram(mass_A, mass_B))
 
     
 @anvil.server.callable
-def histogram_DP_FAp_weight_nano2(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules, cuts, mass_A, mass_B):
-    # generate library
-    library = chitosan_library(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules)
-    # cleave and count products per DP and track FA
-    product_dict = {}
-    all_products = 0
-    for substrate in library:
-        product_list = nano2(substrate, cuts)
-        for product in product_list:
-            all_products += 1
-            if len(product) in product_dict:
-                product_dict[len(product)][0] += 1
-                product_dict[len(product)][1] += product.count("A")
-            else:
-                product_dict[len(product)] = [1, product.count("A")]
-    # calculate average FA and prepare output list
-    DP_list = []
-    average_FA_list = []
-    mass_mole_fraction_list = []
-    mass_mole_fraction_sum = 0
-    weight_fraction_list = []
-    for DP in range(min(product_dict), max(product_dict) + 1):
-        if DP in product_dict:
-            DP_list.append(DP)
-            mole_fraction = product_dict[DP][0] / all_products
-            average_FA = product_dict[DP][1] / (DP * product_dict[DP][0])
-            average_FA_list.append(average_FA)
-            average_mass = DP * (average_FA * mass_A + (1-average_FA) * mass_B) - (DP-1)*18 - 17 # 17 = mass difference between GlcN and anhydromannose
-            mass_mole_fraction = mole_fraction * average_mass
-            mass_mole_fraction_list.append(mass_mole_fraction)
-            mass_mole_fraction_sum += mass_mole_fraction
-    for mass_mole_fraction in mass_mole_fraction_list:
-        weight_fraction = mass_mole_fraction / mass_mole_fraction_sum
-        weight_fraction_list.append(weight_fraction)
-    output_list = [DP_list, weight_fraction_list, average_FA_list]
-    return(output_list)
+def histogram_DP_FAp_weight_nano2(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules, cuts, mass_A, mass_B, seed=None, polydispersity=None, cut_distribution="fixed", mode="simulate"):
+    # generate library, cleave and count products per composition
+    result = simulate_digest({"DP": DP, "overall_FA": overall_FA,
+                              "pattern": pattern, "FA_pattern": FA_pattern,
+                              "A_blocks": A_blocks, "B_blocks": B_blocks,
+                              "molecules": molecules,
+                              "digestion": ("nano2", cuts, cut_distribution),
+                              "seed": seed, "polydispersity": polydispersity,
+                              "mode": mode})
+    # calculate weight fraction and average FA per DP
+    return(result.histogram(mass_A, mass_B))
 
     
 @anvil.server.callable
-def histogram_DP_strength_molar_enzyme(DP, overall_FA, pattern, strength, A_blocks, B_blocks, molecules, minus_specificity, plus_specificity, efficiency):
-    # generate library
-    FA_pattern = FA_pattern_calc(overall_FA, pattern, strength)
-    library = chitosan_library(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules)
-    # cleave and count products per DP and track FA
-    product_dict = {}
-    all_products = 0
-    for substrate in library:
-        product_list = enzyme(substrate, minus_specificity, plus_specificity, efficiency)
-        for product in product_list:
-            all_products += 1
-            if len(product) in product_dict:
-                product_dict[len(product)][0] += 1
-                product_dict[len(product)][1] += product.count("A")
-            else:
-                product_dict[len(product)] = [1, product.count("A")]
-    # calculate average FA and prepare output list
-    DP_list = []
-    average_FA_list = []
-    mole_fraction_list = []
-    for DP in range(min(product_dict), max(product_dict) + 1):
-        if DP in product_dict:
-            DP_list.append(DP)
-            mole_fraction = product_dict[DP][0] / all_products
-            mole_fraction_list.append(mole_fraction)
-            average_FA = product_dict[DP][1] / (DP * product_dict[DP][0])
-            average_FA_list.append(average_FA)
-    output_list = [DP_list, mole_fraction_list, average_FA_list]
-    return(output_list)
+def histogram_DP_strength_molar_enzyme(DP, overall_FA, pattern, strength, A_blocks, B_blocks, molecules, minus_specificity, plus_specificity, efficiency, seed=None, polydispersity=None):
+    # generate library, cleave and count products per composition
+    result = simulate_digest({"DP": DP, "overall_FA": overall_FA,
+                              "pattern": pattern, "strength": strength,
+                              "A_blocks": A_blocks, "B_blocks": B_blocks,
+                              "molecules": molecules,
+                              "digestion": ("enzyme", minus_specificity,
+                                            plus_specificity, efficiency),
+                              "seed": seed, "polydispersity": polydispersity})
+    # calculate mole fraction and average FA per DP
+    return(result.histogram())
 
     
 @anvil.server.callable
-def histogram_DP_strength_molar_nano2(DP, overall_FA, pattern, strength, A_blocks, B_blocks, molecules, cuts):
-    # generate library
-    FA_pattern = FA_pattern_calc(overall_FA, pattern, strength)
-    library = chitosan_library(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules)
-    # cleave and count products per DP and track FA
-    product_dict = {}
-    all_products = 0
-    for substrate in library:
-        product_list = nano2(substrate, cuts)
-        for product in product_list:
-            all_products += 1
-            if len(product) in product_dict:
-                product_dict[len(product)][0] += 1
-                product_dict[len(product)][1] += product.count("A")
-            else:
-                product_dict[len(product)] = [1, product.count("A")]
-    # calculate average FA and prepare output list
-    DP_list = []
-    average_FA_list = []
-    mole_fraction_list = []
-    for DP in range(min(product_dict), max(product_dict) + 1):
-        if DP in product_dict:
-            DP_list.append(DP)
-            mole_fraction = product_dict[DP][0] / all_products
-            mole_fraction_list.append(mole_fraction)
-            average_FA = product_dict[DP][1] / (DP * product_dict[DP][0])
-            average_FA_list.append(average_FA)
-    output_list = [DP_list, mole_fraction_list, average_FA_list]
-    return(output_list)
+def histogram_DP_strength_molar_nano2(DP, overall_FA, pattern, strength, A_blocks, B_blocks, molecules, cuts, seed=None, polydispersity=None, cut_distribution="fixed", mode="simulate"):
+    # generate library, cleave and count products per composition
+    result = simulate_digest({"DP": DP, "overall_FA": overall_FA,
+                              "pattern": pattern, "strength": strength,
+                              "A_blocks": A_blocks, "B_blocks": B_blocks,
+                              "molecules": molecules,
+                              "digestion": ("nano2", cuts, cut_distribution),
+                              "seed": seed, "polydispersity": polydispersity,
+                              "mode": mode})
+    # calculate mole fraction and average FA per DP
+    return(result.histogram())
 
     
 @anvil.server.callable
-def histogram_DP_strength_weight_enzyme(DP, overall_FA, pattern, strength, A_blocks, B_blocks, molecules, minus_specificity, plus_specificity, efficiency, mass_A, mass_B):
-    # generate library
-    FA_pattern = FA_pattern_calc(overall_FA, pattern, strength)
-    library = chitosan_library(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules)
-    # cleave and count products per DP and track FA
-    product_dict = {}
-    all_products = 0
-    for substrate in library:
-        product_list = enzyme(substrate, minus_specificity, plus_specificity, efficiency)
-        for product in product_list:
-            all_products += 1
-            if len(product) in product_dict:
-                product_dict[len(product)][0] += 1
-                product_dict[len(product)][1] += product.count("A")
-            else:
-                product_dict[len(product)] = [1, product.count("A")]
-    # calculate average FA and prepare output list
-    DP_list = []
-    average_FA_list = []
-    mass_mole_fraction_list = []
-    mass_mole_fraction_sum = 0
-    weight_fraction_list = []
-    for DP in range(min(product_dict), max(product_dict) + 1):
-        if DP in product_dict:
-            DP_list.append(DP)
-            mole_fraction = product_dict[DP][0] / all_products
-            average_FA = product_dict[DP][1] / (DP * product_dict[DP][0])
-            average_FA_list.append(average_FA)
-            average_mass = DP * (average_FA * mass_A + (1-average_FA) * mass_B) - (DP-1)*18
-            mass_mole_fraction = mole_fraction * average_mass
-            mass_mole_fraction_list.append(mass_mole_fraction)
-            mass_mole_fraction_sum += mass_mole_fraction
-    for mass_mole_fraction in mass_mole_fraction_list:
-        weight_fraction = mass_mole_fraction / mass_mole_fraction_sum
-        weight_fraction_list.append(weight_fraction)
-    output_list = [DP_list, weight_fraction_list, average_FA_list]
-    return(output_list)
+def histogram_DP_strength_weight_enzyme(DP, overall_FA, pattern, strength, A_blocks, B_blocks, molecules, minus_specificity, plus_specificity, efficiency, mass_A, mass_B, seed=None, polydispersity=None):
+    # generate library, cleave and count products per composition
+    result = simulate_digest({"DP": DP, "overall_FA": overall_FA,
+                              "pattern": pattern, "strength": strength,
+                              "A_blocks": A_blocks, "B_blocks": B_blocks,
+                              "molecules": molecules,
+                              "digestion": ("enzyme", minus_specificity,
+                                            plus_specificity, efficiency),
+                              "seed": seed, "polydispersity": polydispersity})
+    # calculate weight fraction and average FA per DP
+    return(result.histogram(mass_A, mass_B))
 
     
 @anvil.server.callable
-def histogram_DP_strength_weight_nano2(DP, overall_FA, pattern, strength, A_blocks, B_blocks, molecules, cuts, mass_A, mass_B):
-    # generate library
-    FA_pattern = FA_pattern_calc(overall_FA, pattern, strength)
-    library = chitosan_library(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules)
-    # cleave and count products per DP and track FA
-    product_dict = {}
-    all_products = 0
-    for substrate in library:
-        product_list = nano2(substrate, cuts)
-        for product in product_list:
-            all_products += 1
-            if len(product) in product_dict:
-                product_dict[len(product)][0] += 1
-                product_dict[len(product)][1] += product.count("A")
-            else:
-                product_dict[len(product)] = [1, product.count("A")]
-    # calculate average FA and prepare output list
-    DP_list = []
-    average_FA_list = []
-    mass_mole_fraction_list = []
-    mass_mole_fraction_sum = 0
-    weight_fraction_list = []
-    for DP in range(min(product_dict), max(product_dict) + 1):
-        if DP in product_dict:
-            DP_list.append(DP)
-            mole_fraction = product_dict[DP][0] / all_products
-            average_FA = product_dict[DP][1] / (DP * product_dict[DP][0])
-            average_FA_list.append(average_FA)
-            average_mass = DP * (average_FA * mass_A + (1-average_FA) * mass_B) - (DP-1)*18 - 17 # 17 = mass difference between GlcN and anhydromannose
-            mass_mole_fraction = mole_fraction * average_mass
-            mass_mole_fraction_list.append(mass_mole_fraction)
-            mass_mole_fraction_sum += mass_mole_fraction
-    for mass_mole_fraction in mass_mole_fraction_list:
-        weight_fraction = mass_mole_fraction / mass_mole_fraction_sum
-        weight_fraction_list.append(weight_fraction)
-    output_list = [DP_list, weight_fraction_list, average_FA_list]
-    return(output_list)
+def histogram_DP_strength_weight_nano2(DP, overall_FA, pattern, strength, A_blocks, B_blocks, molecules, cuts, mass_A, mass_B, seed=None, polydispersity=None, cut_distribution="fixed", mode="simulate"):
+    # generate library, cleave and count products per composition
+    result = simulate_digest({"DP": DP, "overall_FA": overall_FA,
+                              "pattern": pattern, "strength": strength,
+                              "A_blocks": A_blocks, "B_blocks": B_blocks,
+                              "molecules": molecules,
+                              "digestion": ("nano2", cuts, cut_distribution),
+                              "seed": seed, "polydispersity": polydispersity,
+                              "mode": mode})
+    # calculate weight fraction and average FA per DP
+    return(result.histogram(mass_A, mass_B))
 
     
 @anvil.server.callable
@@ -712,247 +3243,115 @@ def histogram_csv(data, ylabel, filename):
 #### PRODUCT PROFILE ####
 
 @anvil.server.callable
-def profile_FAp_molar_enzyme(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules, minus_specificity, plus_specificity, efficiency):
-    # generate library
-    library = chitosan_library(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules)
-    # cleave and save product compositions
-    profile_list = []
-    oligomer_list = []
-    for substrate in library:
-        product_list = enzyme(substrate, minus_specificity,
-                            plus_specificity, efficiency)
-        for product in product_list:
-            oligomer = "A%sB%s" % (product.count("A"), product.count("B"))
-            profile_list.append(oligomer)
-            if oligomer not in oligomer_list:
-                oligomer_list.append(oligomer)
-    # count products per composition
-    length_profile_list = len(profile_list)
-    output_list = []
-    oligomer_list.sort()
-    oligomer_list.sort(key=calc_DP)
-    proportion_list = []
-    for i in oligomer_list:
-        proportion = profile_list.count(i) / length_profile_list
-        proportion_list.append(proportion)
-    output_list = [oligomer_list, proportion_list]
-    return(output_list)
+def profile_FAp_molar_enzyme(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules, minus_specificity, plus_specificity, efficiency, seed=None, polydispersity=None):
+    # generate library, cleave and count products per composition
+    result = simulate_digest({"DP": DP, "overall_FA": overall_FA,
+                              "pattern": pattern, "FA_pattern": FA_pattern,
+                              "A_blocks": A_blocks, "B_blocks": B_blocks,
+                              "molecules": molecules,
+                              "digestion": ("enzyme", minus_specificity,
+                                            plus_specificity, efficiency),
+                              "seed": seed, "polydispersity": polydispersity})
+    # calculate proportions per composition
+    return(result.profile())
 
     
 @anvil.server.callable
-def profile_FAp_molar_nano2(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules, cuts):
-    # generate library
-    library = chitosan_library(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules)
-    # cleave and save product compositions
-    profile_list = []
-    oligomer_list = []
-    for substrate in library:
-        product_list = nano2(substrate, cuts)
-        for product in product_list:
-            oligomer = "A%sB%s" % (product.count("A"), product.count("B"))
-            profile_list.append(oligomer)
-            if oligomer not in oligomer_list:
-                oligomer_list.append(oligomer)
-    # count products per composition
-    length_profile_list = len(profile_list)
-    output_list = []
-    oligomer_list.sort()
-    oligomer_list.sort(key=calc_DP)
-    proportion_list = []
-    for i in oligomer_list:
-        proportion = profile_list.count(i) / length_profile_list
-        proportion_list.append(proportion)
-    output_list = [oligomer_list, proportion_list]
-    return(output_list)
+def profile_FAp_molar_nano2(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules, cuts, seed=None, polydispersity=None, cut_distribution="fixed", mode="simulate"):
+    # generate library, cleave and count products per composition
+    result = simulate_digest({"DP": DP, "overall_FA": overall_FA,
+                              "pattern": pattern, "FA_pattern": FA_pattern,
+                              "A_blocks": A_blocks, "B_blocks": B_blocks,
+                              "molecules": molecules,
+                              "digestion": ("nano2", cuts, cut_distribution),
+                              "seed": seed, "polydispersity": polydispersity,
+                              "mode": mode})
+    # calculate proportions per composition
+    return(result.profile())
 
 
 @anvil.server.callable
-def profile_FAp_weight_enzyme(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules, minus_specificity, plus_specificity, efficiency, mass_A, mass_B):
-    # generate library
-    library = chitosan_library(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules)
-    # cleave and save product compositions
-    profile_list = []
-    oligomer_list = []
-    mass_all_products = 0
-    for substrate in library:
-        product_list = enzyme(substrate, minus_specificity,
-                            plus_specificity, efficiency)
-        for product in product_list:
-            oligomer = "A%sB%s" % (product.count("A"), product.count("B"))
-            mass_oligomer = product.count("A") * mass_A + product.count("B") * mass_B
-            mass_all_products += mass_oligomer
-            profile_list.append(oligomer)
-            if oligomer not in oligomer_list:
-                oligomer_list.append(oligomer)
-    # calculate masses
-    output_list = []
-    oligomer_list.sort()
-    oligomer_list.sort(key=calc_DP)
-    proportion_list = []
-    for oligomer in oligomer_list:
-        number_A = int(re.search('(A)(\d+)', oligomer).group(2))
-        number_B = int(re.search('(B)(\d+)', oligomer).group(2))
-        mass_oligomer = number_A * mass_A + number_B * mass_B
-        proportion = profile_list.count(oligomer) * mass_oligomer / mass_all_products
-        proportion_list.append(proportion)
-    output_list = [oligomer_list, proportion_list]
-    return(output_list)
+def profile_FAp_weight_enzyme(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules, minus_specificity, plus_specificity, efficiency, mass_A, mass_B, seed=None, polydispersity=None):
+    # generate library, cleave and count products per composition
+    result = simulate_digest({"DP": DP, "overall_FA": overall_FA,
+                              "pattern": pattern, "FA_pattern": FA_pattern,
+                              "A_blocks": A_blocks, "B_blocks": B_blocks,
+                              "molecules": molecules,
+                              "digestion": ("enzyme", minus_specificity,
+                                            plus_specificity, efficiency),
+                              "seed": seed, "polydispersity": polydispersity})
+    # calculate mass proportions per composition
+    return(result.profile(mass_A, mass_B))
 
     
 @anvil.server.callable
-def profile_FAp_weight_nano2(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules, cuts, mass_A, mass_B):
-    # generate library
-    library = chitosan_library(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules)
-    # cleave and save product compositions
-    profile_list = []
-    oligomer_list = []
-    mass_all_products = 0
-    for substrate in library:
-        product_list = nano2(substrate, cuts)
-        for product in product_list:
-            oligomer = "A%sB%s" % (product.count("A"), product.count("B"))
-            mass_oligomer = product.count("A") * mass_A + product.count("B") * mass_B
-            mass_all_products += mass_oligomer
-            profile_list.append(oligomer)
-            if oligomer not in oligomer_list:
-                oligomer_list.append(oligomer)
-    # calculate masses
-    output_list = []
-    oligomer_list.sort()
-    oligomer_list.sort(key=calc_DP)
-    proportion_list = []
-    for oligomer in oligomer_list:
-        number_A = int(re.search('(A)(\d+)', oligomer).group(2))
-        number_B = int(re.search('(B)(\d+)', oligomer).group(2))
-        mass_oligomer = number_A * mass_A + number_B * mass_B
-        proportion = profile_list.count(oligomer) * mass_oligomer / mass_all_products
-        proportion_list.append(proportion)
-    output_list = [oligomer_list, proportion_list]
-    return(output_list)
+def profile_FAp_weight_nano2(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules, cuts, mass_A, mass_B, seed=None, polydispersity=None, cut_distribution="fixed", mode="simulate"):
+    # generate library, cleave and count products per composition
+    result = simulate_digest({"DP": DP, "overall_FA": overall_FA,
+                              "pattern": pattern, "FA_pattern": FA_pattern,
+                              "A_blocks": A_blocks, "B_blocks": B_blocks,
+                              "molecules": molecules,
+                              "digestion": ("nano2", cuts, cut_distribution),
+                              "seed": seed, "polydispersity": polydispersity,
+                              "mode": mode})
+    # calculate mass proportions per composition
+    return(result.profile(mass_A, mass_B))
 
     
 @anvil.server.callable
-def profile_strength_molar_enzyme(DP, overall_FA, pattern, strength, A_blocks, B_blocks, molecules, minus_specificity, plus_specificity, efficiency):
-    # generate library
-    FA_pattern = FA_pattern_calc(overall_FA, pattern, strength)
-    library = chitosan_library(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules)
-    # cleave and save product compositions
-    profile_list = []
-    oligomer_list = []
-    for substrate in library:
-        product_list = enzyme(substrate, minus_specificity,
-                            plus_specificity, efficiency)
-        for product in product_list:
-            oligomer = "A%sB%s" % (product.count("A"), product.count("B"))
-            profile_list.append(oligomer)
-            if oligomer not in oligomer_list:
-                oligomer_list.append(oligomer)
-    # count products per composition
-    length_profile_list = len(profile_list)
-    output_list = []
-    oligomer_list.sort()
-    oligomer_list.sort(key=calc_DP)
-    proportion_list = []
-    for i in oligomer_list:
-        proportion = profile_list.count(i) / length_profile_list
-        proportion_list.append(proportion)
-    output_list = [oligomer_list, proportion_list]
-    return(output_list)
+def profile_strength_molar_enzyme(DP, overall_FA, pattern, strength, A_blocks, B_blocks, molecules, minus_specificity, plus_specificity, efficiency, seed=None, polydispersity=None):
+    # generate library, cleave and count products per composition
+    result = simulate_digest({"DP": DP, "overall_FA": overall_FA,
+                              "pattern": pattern, "strength": strength,
+                              "A_blocks": A_blocks, "B_blocks": B_blocks,
+                              "molecules": molecules,
+                              "digestion": ("enzyme", minus_specificity,
+                                            plus_specificity, efficiency),
+                              "seed": seed, "polydispersity": polydispersity})
+    # calculate proportions per composition
+    return(result.profile())
 
 
 @anvil.server.callable
-def profile_strength_molar_nano2(DP, overall_FA, pattern, strength, A_blocks, B_blocks, molecules, cuts):
-    # generate library
-    FA_pattern = FA_pattern_calc(overall_FA, pattern, strength)
-    library = chitosan_library(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules)
-    # cleave and save product compositions
-    profile_list = []
-    oligomer_list = []
-    for substrate in library:
-        product_list = nano2(substrate, cuts)
-        for product in product_list:
-            oligomer = "A%sB%s" % (product.count("A"), product.count("B"))
-            profile_list.append(oligomer)
-            if oligomer not in oligomer_list:
-                oligomer_list.append(oligomer)
-    # count products per composition
-    length_profile_list = len(profile_list)
-    output_list = []
-    oligomer_list.sort()
-    oligomer_list.sort(key=calc_DP)
-    proportion_list = []
-    for i in oligomer_list:
-        proportion = profile_list.count(i) / length_profile_list
-        proportion_list.append(proportion)
-    output_list = [oligomer_list, proportion_list]
-    return(output_list)
+def profile_strength_molar_nano2(DP, overall_FA, pattern, strength, A_blocks, B_blocks, molecules, cuts, seed=None, polydispersity=None, cut_distribution="fixed", mode="simulate"):
+    # generate library, cleave and count products per composition
+    result = simulate_digest({"DP": DP, "overall_FA": overall_FA,
+                              "pattern": pattern, "strength": strength,
+                              "A_blocks": A_blocks, "B_blocks": B_blocks,
+                              "molecules": molecules,
+                              "digestion": ("nano2", cuts, cut_distribution),
+                              "seed": seed, "polydispersity": polydispersity,
+                              "mode": mode})
+    # calculate proportions per composition
+    return(result.profile())
 
 
 @anvil.server.callable
-def profile_strength_weight_enzyme(DP, overall_FA, pattern, strength, A_blocks, B_blocks, molecules, minus_specificity, plus_specificity, efficiency, mass_A, mass_B):
-    # generate library
-    FA_pattern = FA_pattern_calc(overall_FA, pattern, strength)
-    library = chitosan_library(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules)
-    # cleave and save product compositions
-    profile_list = []
-    oligomer_list = []
-    mass_all_products = 0
-    for substrate in library:
-        product_list = enzyme(substrate, minus_specificity,
-                            plus_specificity, efficiency)
-        for product in product_list:
-            oligomer = "A%sB%s" % (product.count("A"), product.count("B"))
-            mass_oligomer = product.count("A") * mass_A + product.count("B") * mass_B
-            mass_all_products += mass_oligomer
-            profile_list.append(oligomer)
-            if oligomer not in oligomer_list:
-                oligomer_list.append(oligomer)
-    # calculate masses
-    output_list = []
-    oligomer_list.sort()
-    oligomer_list.sort(key=calc_DP)
-    proportion_list = []
-    for oligomer in oligomer_list:
-        number_A = int(re.search('(A)(\d+)', oligomer).group(2))
-        number_B = int(re.search('(B)(\d+)', oligomer).group(2))
-        mass_oligomer = number_A * mass_A + number_B * mass_B
-        proportion = profile_list.count(oligomer) * mass_oligomer / mass_all_products
-        proportion_list.append(proportion)
-    output_list = [oligomer_list, proportion_list]
-    return(output_list)
+def profile_strength_weight_enzyme(DP, overall_FA, pattern, strength, A_blocks, B_blocks, molecules, minus_specificity, plus_specificity, efficiency, mass_A, mass_B, seed=None, polydispersity=None):
+    # generate library, cleave and count products per composition
+    result = simulate_digest({"DP": DP, "overall_FA": overall_FA,
+                              "pattern": pattern, "strength": strength,
+                              "A_blocks": A_blocks, "B_blocks": B_blocks,
+                              "molecules": molecules,
+                              "digestion": ("enzyme", minus_specificity,
+                                            plus_specificity, efficiency),
+                              "seed": seed, "polydispersity": polydispersity})
+    # calculate mass proportions per composition
+    return(result.profile(mass_A, mass_B))
 
     
 @anvil.server.callable
-def profile_strength_weight_nano2(DP, overall_FA, pattern, strength, A_blocks, B_blocks, molecules, cuts, mass_A, mass_B):
-    # generate library
-    FA_pattern = FA_pattern_calc(overall_FA, pattern, strength)
-    library = chitosan_library(DP, overall_FA, pattern, FA_pattern, A_blocks, B_blocks, molecules)
-    # cleave and save product compositions
-    profile_list = []
-    oligomer_list = []
-    mass_all_products = 0
-    for substrate in library:
-        product_list = nano2(substrate, cuts)
-        for product in product_list:
-            oligomer = "A%sB%s" % (product.count("A"), product.count("B"))
-            mass_oligomer = product.count("A") * mass_A + product.count("B") * mass_B
-            mass_all_products += mass_oligomer
-            profile_list.append(oligomer)
-            if oligomer not in oligomer_list:
-                oligomer_list.append(oligomer)
-    # calculate masses
-    output_list = []
-    oligomer_list.sort()
-    oligomer_list.sort(key=calc_DP)
-    proportion_list = []
-    for oligomer in oligomer_list:
-        number_A = int(re.search('(A)(\d+)', oligomer).group(2))
-        number_B = int(re.search('(B)(\d+)', oligomer).group(2))
-        mass_oligomer = number_A * mass_A + number_B * mass_B
-        proportion = profile_list.count(oligomer) * mass_oligomer / mass_all_products
-        proportion_list.append(proportion)
-    output_list = [oligomer_list, proportion_list]
-    return(output_list)
+def profile_strength_weight_nano2(DP, overall_FA, pattern, strength, A_blocks, B_blocks, molecules, cuts, mass_A, mass_B, seed=None, polydispersity=None, cut_distribution="fixed", mode="simulate"):
+    # generate library, cleave and count products per composition
+    result = simulate_digest({"DP": DP, "overall_FA": overall_FA,
+                              "pattern": pattern, "strength": strength,
+                              "A_blocks": A_blocks, "B_blocks": B_blocks,
+                              "molecules": molecules,
+                              "digestion": ("nano2", cuts, cut_distribution),
+                              "seed": seed, "polydispersity": polydispersity,
+                              "mode": mode})
+    # calculate mass proportions per composition
+    return(result.profile(mass_A, mass_B))
 
     
 @anvil.server.callable
@@ -998,10 +3397,188 @@ def profile_csv(data, ylabel, filename):
     csv_file = anvil.media.from_file('/tmp/data.csv', 'csv', ('%s.csv' % filename))
     return csv_file
 
+#### FA SWEEPS ####
+
+# worker processes for the points of an FA sweep (None: one per CPU)
+SWEEP_WORKERS = None
+# step between the points of a sweep over all FA (see diads_triads)
+FA_SWEEP_STEP = 0.02
+
+
+def sweep_map(function, arguments, workers=None):
+    """Calls function for the arguments of each point of an FA sweep, in
+    parallel in a pool of worker processes (workers, SWEEP_WORKERS if None).
+    All random numbers of a point follow from its seed and stream (see
+    chunk_rngs), so the results do not depend on the number of workers.
+
+    returns list of results in the order of the points"""
+
+    arguments = list(arguments)
+    if workers is None:
+        workers = SWEEP_WORKERS
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(arguments))
+    if workers <= 1:
+        return [function(*point_arguments) for point_arguments in arguments]
+    # the engines are timed once here rather than in every worker
+    ENGINE_TUNER.current()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(function, *zip(*arguments)))
+
+
+def simulated_ngram_counts(DP, FA, pattern, FA_pattern, A_blocks, B_blocks,
+                           molecules, seed, polydispersity=None, PA=None):
+    """Counts monads to pentads (see flat_ngram_counts) of the library of one
+    point of the NMR sweep batch by batch in one pass.
+
+    returns list with array of number of windows per code for each length"""
+
+    ngram_counts = [np.zeros(2**length, dtype=np.int64)
+                    for length in range(1, NMR_NGRAM_LENGTH + 1)]
+    if polydispersity is not None:
+        libraries = polydisperse_batches(DP, FA, pattern, FA_pattern,
+                                         A_blocks, B_blocks, molecules,
+                                         polydispersity, seed,
+                                         (GENERATE_STREAM, *SWEEP_STREAM), PA)
+        batches = ((batch, None) for batch in libraries)
+    elif A_blocks == 0 and B_blocks == 0:
+        libraries = library_batches(DP, FA, pattern, FA_pattern, A_blocks,
+                                    B_blocks, molecules, seed,
+                                    (GENERATE_STREAM, *SWEEP_STREAM), PA=PA)
+        batches = ((batch, None) for batch in libraries)
+    else:
+        batches = [block_library(DP, A_blocks, B_blocks, molecules, seed,
+                                 (GENERATE_STREAM, *SWEEP_STREAM))]
+    for library, multiplicities in batches:
+        library_counts = flat_ngram_counts(*flat_library(library),
+                                           NMR_NGRAM_LENGTH, multiplicities)
+        for total, counts in zip(ngram_counts, library_counts):
+            total += counts.astype(np.int64)
+    return ngram_counts
+
+
+def block_sizes_point(DP, FA, pattern, FA_pattern, A_blocks, B_blocks,
+                      molecules, efficiency, A_cutoff, DP_cutoff, ion_eff,
+                      seed, polydispersity=None, PA=None, workers=None,
+                      default_seed=None):
+    """Digests the library of one point of the block size sweep with an enzyme
+    cleaving between B and A (see simulate_digest, with workers processes
+    and default_seed).
+
+    returns block sizes as composition_blocks"""
+
+    result = simulate_digest({"DP": DP, "overall_FA": FA, "pattern": pattern,
+                              "FA_pattern": FA_pattern, "A_blocks": A_blocks,
+                              "B_blocks": B_blocks, "molecules": molecules,
+                              "digestion": ("enzyme", ".BA", "XX.",
+                                            efficiency),
+                              "seed": seed, "polydispersity": polydispersity,
+                              "PA": PA, "stream": SWEEP_STREAM}, workers,
+                             default_seed)
+    return result.block_sizes(A_cutoff, DP_cutoff, ion_eff)
+
+
+def nmr_ngram_counts(DP, FA_range, pattern, FA_pattern_range, A_blocks,
+                     B_blocks, molecules, seed=None, polydispersity=None,
+                     PA=None, mode="simulate"):
+    """Counts monads to pentads (see flat_ngram_counts) of the libraries of all
+    points of the NMR sweep via the first "nmr sweep" engine that can (see
+    run_engine): expected counts if mode is "expected" (see expected_sweep,
+    raises ValueError where they are not known exactly), otherwise the
+    fastest of all points at once for option A libraries (see
+    threshold_sweep) and one library per point (see simulated_sweep). A
+    sweep of a single point is always simulated.
+
+    returns list with n-ad counts per length for each point"""
+
+    features = library_features(A_blocks, B_blocks, polydispersity, PA)
+    if mode == "expected":
+        features.add("expected")
+    if len(FA_range) == 1:
+        features.add("single point")
+    return run_engine("nmr sweep", features, DP, FA_range, pattern,
+                      FA_pattern_range, A_blocks, B_blocks, molecules,
+                      resolve_seed(seed), polydispersity, PA,
+                      units=DP * molecules)
+
+
+def expected_sweep(DP, FA_range, pattern, FA_pattern_range, A_blocks, B_blocks,
+                   molecules, seed, polydispersity=None, PA=None,
+                   workers=None):
+    """Expected n-ad counts of all points of the NMR sweep (see
+    expected_ngram_counts).
+
+    returns list with n-ad counts per length for each point, or None if they
+    are not known for all points"""
+
+    sweep = [expected_ngram_counts(DP, FA, pattern, FA_pattern, A_blocks,
+                                   B_blocks, NMR_NGRAM_LENGTH, polydispersity,
+                                   PA)
+             for FA, FA_pattern in zip(FA_range, FA_pattern_range)]
+    return None if any(counts is None for counts in sweep) else sweep
+
+
+def threshold_sweep(DP, FA_range, pattern, FA_pattern_range, A_blocks,
+                    B_blocks, molecules, seed, polydispersity=None, PA=None,
+                    workers=None):
+    """N-ad counts of all points of the NMR sweep of option A libraries at once
+    (see sweep_ngram_counts).
+
+    returns list with n-ad counts per length for each point, or None"""
+
+    return sweep_ngram_counts(DP, FA_range, pattern, FA_pattern_range,
+                              NMR_NGRAM_LENGTH, molecules, seed,
+                              (GENERATE_STREAM, *SWEEP_STREAM))
+
+
+def simulated_sweep(DP, FA_range, pattern, FA_pattern_range, A_blocks,
+                    B_blocks, molecules, seed, polydispersity=None, PA=None,
+                    workers=None):
+    """N-ad counts of all points of the NMR sweep, one library per point (see
+    simulated_ngram_counts), in parallel in workers processes (see
+    sweep_map).
+
+    returns list with n-ad counts per length for each point"""
+
+    return sweep_map(simulated_ngram_counts,
+                     [(DP, FA, pattern, FA_pattern, A_blocks, B_blocks,
+                       molecules, seed, polydispersity, PA)
+                      for FA, FA_pattern in zip(FA_range, FA_pattern_range)],
+                     workers)
+
+
+def nmr_sweep_benchmark(DP, molecules):
+    """Arguments of the "nmr sweep" engines for the sweep of diads_triads
+    over all FA with random option A libraries of a given size, with the
+    worker processes of the sweep (see register_benchmark). The threshold
+    sweep takes about as long for one point as for all of them, while the
+    simulation takes about as long per point, so both are timed for the
+    whole sweep."""
+
+    FA_range = list(np.arange(FA_SWEEP_STEP, 1, FA_SWEEP_STEP))
+    return (DP, FA_range, 1, FA_range, 0, 0, molecules, 0, None, None, None)
+
+
+# the sweep and the simulation use the same random numbers, a single point
+# is simulated faster than the whole sweep
+register_engine("nmr sweep", Engine("expected", expected_sweep,
+                                    features={"expected", "option A",
+                                              "single point"},
+                                    requires={"expected"}))
+register_engine("nmr sweep", Engine("threshold sweep", threshold_sweep,
+                                    features={"option A"}))
+register_engine("nmr sweep", Engine("simulated", simulated_sweep,
+                                    features=SIMULATED_FEATURES |
+                                    {"single point"}))
+register_benchmark("nmr sweep", nmr_sweep_benchmark, {"option A"})
+
+
 #### NMR ####
 
 @anvil.server.callable
-def diads_triads(DP, overall_FA, A_blocks, B_blocks, molecules, strength, pattern):
+def diads_triads(DP, overall_FA, A_blocks, B_blocks, molecules, strength, pattern,
+                 seed=None, polydispersity=None, PA=None, mode="simulate"):
     output_dict = {}
     FA_list = []
     FA_pattern_list = []
@@ -1018,7 +3595,10 @@ def diads_triads(DP, overall_FA, A_blocks, B_blocks, molecules, strength, patter
     F_BBA_list = []
     F_BAB_list = []
     F_BBB_list = []
-    step = 0.02
+    ngram_lists = {"F_%s" % name: []
+                   for length in range(4, NMR_NGRAM_LENGTH + 1)
+                   for name in ngram_names(length)}
+    step = FA_SWEEP_STEP
     if A_blocks == 0 and B_blocks == 0:
         if overall_FA == None:
             FA_range = np.arange(step, 1, step)
@@ -1026,18 +3606,35 @@ def diads_triads(DP, overall_FA, A_blocks, B_blocks, molecules, strength, patter
             FA_range = [overall_FA]
     else:
         FA_range = [A_blocks/(A_blocks + B_blocks)]
-    for FA in FA_range:
+    if PA is None:
+        FA_pattern_range = [FA_pattern_calc(FA, pattern, strength)
+                            for FA in FA_range]
+    else:
+        # Markov chains have no pattern
+        FA_pattern_range = list(FA_range)
+    parameters = {"DP": DP, "FA_range": FA_range, "pattern": pattern,
+                  "FA_pattern_range": FA_pattern_range, "A_blocks": A_blocks,
+                  "B_blocks": B_blocks, "molecules": molecules, "seed": seed,
+                  "polydispersity": polydispersity, "PA": PA, "mode": mode}
+    # n-ad counts per length, each of shape (FA points, codes)
+    sweep = cached_arrays("ngram counts", parameters, lambda: [
+        np.array(counts) for counts in zip(*nmr_ngram_counts(
+            DP, FA_range, pattern, FA_pattern_range, A_blocks, B_blocks,
+            molecules, seed, polydispersity, PA, mode))])
+    for point, (FA, FA_pattern) in enumerate(zip(FA_range, FA_pattern_range)):
         FA_list.append(FA)
-        FA_pattern = FA_pattern_calc(FA, pattern, strength)
         FA_pattern_list.append(FA_pattern)
-        library = chitosan_library(DP, FA, pattern, FA_pattern, A_blocks, B_blocks, molecules)
-        diads_PA_values = diads_PA(library)
+        ngram_counts = [counts[point] for counts in sweep]
+        diad_counts = ngram_counts[1]
+        triad_counts = ngram_counts[2][[0b111, 0b110, 0b011, 0b101, 0b100,
+                                        0b001, 0b010, 0b000]]
+        diads_PA_values = diad_fractions(*diad_counts[::-1].tolist())
         F_AA_list.append(diads_PA_values[0])
         F_AB_list.append(diads_PA_values[1])
         F_BA_list.append(diads_PA_values[2])
         F_BB_list.append(diads_PA_values[3])
         PA_list.append(diads_PA_values[4])
-        triads_values = triads(library)
+        triads_values = triad_fractions(triad_counts.tolist())
         F_AAA_list.append(triads_values[0])
         F_AAB_list.append(triads_values[1])
         F_BAA_list.append(triads_values[2])
@@ -1045,7 +3642,11 @@ def diads_triads(DP, overall_FA, A_blocks, B_blocks, molecules, strength, patter
         F_ABB_list.append(triads_values[4])
         F_BBA_list.append(triads_values[5])
         F_BAB_list.append(triads_values[6])
-        F_BBB_list.append(triads_values[7])    
+        F_BBB_list.append(triads_values[7])
+        for length in range(4, NMR_NGRAM_LENGTH + 1):
+            fractions = ngram_fractions(ngram_counts[length - 1])
+            for name, fraction in fractions.items():
+                ngram_lists[name].append(fraction)
     output_dict["average fraction unit A"] = FA_list
     output_dict["average fraction unit A in pattern"] = FA_pattern_list
     output_dict["F_AA"] = F_AA_list
@@ -1061,6 +3662,7 @@ def diads_triads(DP, overall_FA, A_blocks, B_blocks, molecules, strength, patter
     output_dict["F_BBA"] = F_BBA_list
     output_dict["F_BAB"] = F_BAB_list
     output_dict["F_BBB"] = F_BBB_list
+    output_dict.update(ngram_lists)
     return(output_dict)
 
     
@@ -1087,8 +3689,11 @@ def make_PA_plot(data_nmr, overall_FA, filename):
 @anvil.server.callable
 def nmr_csv(data_nmr, filename):
     df = pd.DataFrame(data_nmr)
+    ngram_columns = ["F_%s" % name
+                     for length in range(4, NMR_NGRAM_LENGTH + 1)
+                     for name in ngram_names(length)]
     df.to_csv('/tmp/data.csv', index=False, encoding='utf-8-sig', columns=["average fraction unit A", "average fraction unit A in pattern", "PA", "F_AA", "F_AB", "F_BA", "F_BB",
-                                                                           "F_AAA", "F_AAB", "F_BAA", "F_ABA", "F_ABB", "F_BBA", "F_BAB", "F_BBB"])
+                                                                           "F_AAA", "F_AAB", "F_BAA", "F_ABA", "F_ABB", "F_BBA", "F_BAB", "F_BBB"] + ngram_columns)
     csv_file = anvil.media.from_file('/tmp/data.csv', 'csv', ('%s.csv' % filename))
     return csv_file
 
@@ -1097,7 +3702,8 @@ def nmr_csv(data_nmr, filename):
 
 @anvil.server.callable
 def block_sizes(DP, overall_FA, A_blocks, B_blocks, molecules, strength, pattern,
-                efficiency, A_cutoff, DP_cutoff, ion_eff):
+                efficiency, A_cutoff, DP_cutoff, ion_eff, seed=None,
+                polydispersity=None, PA=None):
     output_dict = {}
     FA_list = []
     FA_pattern_list = []
@@ -1105,7 +3711,7 @@ def block_sizes(DP, overall_FA, A_blocks, B_blocks, molecules, strength, pattern
     Bn_list = []
     Aw_list = []
     Bw_list = []
-    step = 0.02
+    step = FA_SWEEP_STEP
     if A_blocks == 0 and B_blocks == 0:
         if overall_FA == None:
             FA_range = np.arange(step, 1, step)
@@ -1113,19 +3719,26 @@ def block_sizes(DP, overall_FA, A_blocks, B_blocks, molecules, strength, pattern
             FA_range = [overall_FA]
     else:
         FA_range = [A_blocks/(A_blocks + B_blocks)]
-    for FA in FA_range:
+    # all points use the same seed, which is only part of the cache keys if
+    # it was given
+    sweep_seed = resolve_seed(seed)
+    if PA is None:
+        FA_pattern_range = [FA_pattern_calc(FA, pattern, strength)
+                            for FA in FA_range]
+    else:
+        # Markov chains have no pattern
+        FA_pattern_range = list(FA_range)
+    # the points of a sweep are digested in parallel (see SWEEP_WORKERS), a
+    # single point in parallel chunks (see DIGEST_WORKERS)
+    digest_workers = None if len(FA_range) == 1 else 1
+    outputs = sweep_map(block_sizes_point, [
+        (DP, FA, pattern, FA_pattern, A_blocks, B_blocks, molecules,
+         efficiency, A_cutoff, DP_cutoff, ion_eff, seed, polydispersity, PA,
+         digest_workers, sweep_seed)
+        for FA, FA_pattern in zip(FA_range, FA_pattern_range)])
+    for FA, FA_pattern, output in zip(FA_range, FA_pattern_range, outputs):
         FA_list.append(FA)
-        FA_pattern = FA_pattern_calc(FA, pattern, strength)
         FA_pattern_list.append(FA_pattern)
-        library = chitosan_library(DP, FA, pattern, FA_pattern, A_blocks, B_blocks, molecules)
-        all_products = []
-        for substrate in library:
-            product_list = enzyme(substrate, ".BA", "XX.", efficiency)
-            for product in product_list:
-                all_products.append(product)
-                all_products.append(product)
-                all_products.append(product)
-        output = blocks(all_products, A_cutoff, DP_cutoff, ion_eff)
         An_list.append(output[0])
         Bn_list.append(output[1])
         Aw_list.append(output[2])
@@ -1176,3 +3789,8 @@ def blocks_csv(data_blocks, filename):
                                                                           "block(A)w", "block(B)w"])
     csv_file = anvil.media.from_file('/tmp/data.csv', 'csv', ('%s.csv' % filename))
     return csv_file
+
+
+# all engines are registered now (see EngineTuner)
+if ENGINE_WARM_UP:
+    threading.Thread(target=ENGINE_TUNER.current, daemon=True).start()
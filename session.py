@@ -0,0 +1,8 @@
+import random
+
+# One seed per browser session, sent with every simulation: submitting the
+# same input again, switching between molar and weight fractions or between
+# the DP histogram and product profile tabs then reuses the libraries and
+# results the server cached for this seed, while every new session still
+# gets new random molecules.
+SEED = random.randrange(2**32)
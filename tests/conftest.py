@@ -0,0 +1,32 @@
+import itertools
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server_module  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def empty_caches(tmp_path, monkeypatch):
+    """Gives every test its own result and library caches, so that results
+    are calculated rather than read from an earlier test or session. Tests
+    call the returned function to empty them again, e.g. to calculate the
+    same result twice."""
+
+    directories = itertools.count()
+
+    def empty():
+        monkeypatch.setattr(server_module, "RESULT_CACHE", server_module.ResultCache(
+            server_module.RESULT_CACHE_BYTES,
+            str(tmp_path / ("results%d" % next(directories))),
+            server_module.RESULT_DISK_BYTES))
+        monkeypatch.setattr(server_module, "LIBRARY_CACHE", server_module.ResultCache(
+            server_module.LIBRARY_CACHE_BYTES))
+        monkeypatch.setattr(server_module, "LIBRARY_FILE_DIR", str(
+            tmp_path / ("libraries%d" % next(directories))))
+
+    empty()
+    return empty
@@ -0,0 +1,149 @@
+import itertools
+import random
+import re
+
+import numpy as np
+import pytest
+
+import server_module as sm
+
+
+SPEC = {"DP": 80, "overall_FA": 0.4, "pattern": 3, "FA_pattern": 0.6,
+        "A_blocks": 0, "B_blocks": 0, "molecules": 300,
+        "digestion": ("enzyme", "_BA", "XX_", 0.8), "seed": 4}
+
+
+def test_outputs_match_callables():
+    histogram, weight_histogram, profile = sm.digest_outputs(
+        SPEC, [["histogram"], ["histogram", 203, 161], ["profile"]])
+    arguments = (80, 0.4, 3, 0.6, 0, 0, 300, "_BA", "XX_", 0.8)
+    assert histogram == sm.histogram_DP_FAp_molar_enzyme(*arguments, seed=4)
+    assert weight_histogram == sm.histogram_DP_FAp_weight_enzyme(
+        *arguments, 203, 161, seed=4)
+    assert profile == sm.profile_FAp_molar_enzyme(*arguments, seed=4)
+
+
+@pytest.mark.parametrize("name", ["__init__", "__class__", "outputs",
+                                  "compositions", "missing"])
+def test_only_public_outputs(name):
+    with pytest.raises(ValueError):
+        sm.digest_outputs(SPEC, [["histogram"], [name]])
+
+
+SPECIFICITIES = [("_BA", "XX_"), ("XXX", "XXX"), ("__A", "A__"),
+                 ("_BX", "BX_"), (".BA", "XX."), ("ABB", "AAB"),
+                 ("AAA", "AAA"), ("BBB", "BBB"), ("_AB", "A__"),
+                 ("XBA", "_XX"), ("___", "___")]
+
+
+def regex_subsites(minus_specificity, plus_specificity):
+    # subsite patterns of the original string-based enzyme
+    return [{"X": "[^-]", "_": "."}.get(pref, pref)
+            for pref in minus_specificity + plus_specificity]
+
+
+def regex_matches(subsites, units, idx):
+    return all(re.match(pref, units[idx + subsite])
+               for subsite, pref in enumerate(subsites))
+
+
+def regex_enzyme(substrate, subsites, order, efficiency, random_numbers):
+    """Original string-based enzyme, processing the cleavage sites in the
+    given order instead of a shuffled one and keeping each cut if its
+    random number lies below efficiency."""
+
+    dig_substrate = [*substrate]
+    sites = [idx for idx in range(len(substrate) - 5)
+             if regex_matches(subsites, dig_substrate, idx)]
+    sites = [sites[position] for position in order]
+    for clvg_no in range(len(sites)):
+        if regex_matches(subsites, dig_substrate, sites[clvg_no]):
+            dig_substrate.insert(sites[clvg_no] + 3, "-")
+            sites = [idx + 1 if idx > sites[clvg_no] else idx
+                     for idx in sites]
+    dig_substrate_list = "".join(dig_substrate).split("-")
+    partial_dig_sub_list = [dig_substrate_list[0]]
+    for product in dig_substrate_list[1:]:
+        if next(random_numbers) < efficiency:
+            partial_dig_sub_list.append(product)
+        else:
+            partial_dig_sub_list[-1] = partial_dig_sub_list[-1] + product
+    return partial_dig_sub_list[1:-1]
+
+
+def recorded(rng, numbers):
+    while True:
+        numbers.append(rng.random())
+        yield numbers[-1]
+
+
+class Numbers:
+    """Hands out the same random numbers as the regex enzyme drew."""
+
+    def __init__(self, numbers):
+        self.numbers = np.asarray(numbers)
+
+    def random(self, size):
+        assert size == len(self.numbers)
+        return self.numbers
+
+
+@pytest.mark.parametrize("minus_specificity, plus_specificity",
+                         SPECIFICITIES)
+def test_specificity_table_matches_regex(minus_specificity,
+                                         plus_specificity):
+    subsites = regex_subsites(minus_specificity, plus_specificity)
+    table = sm.specificity_table(minus_specificity, plus_specificity)
+    states = sorted(sm.SUBSITE_STATES, key=sm.SUBSITE_STATES.get)
+    for code, window in enumerate(itertools.product(states, repeat=6)):
+        assert table[code] == regex_matches(subsites, window, 0)
+
+
+@pytest.mark.parametrize("cuts", [sm.numpy_enzyme_cuts, sm.enzyme_cuts])
+def test_cut_engine_matches_regex(cuts):
+    shuffle = random.Random(9)
+    rng = np.random.default_rng(9)
+    for _ in range(300):
+        minus_specificity, plus_specificity = shuffle.choice(SPECIFICITIES)
+        efficiency = shuffle.choice([1, 0.8, 0.3])
+        subsites = regex_subsites(minus_specificity, plus_specificity)
+        table = sm.specificity_table(minus_specificity, plus_specificity)
+        substrates = ["".join(rng.choice(["A", "B"], size, p=[FA, 1 - FA]))
+                      for size, FA in zip(rng.integers(1, 40, 3),
+                                          rng.random(3))]
+        monomers = sm.molecule_array("".join(substrates))
+        offsets = np.cumsum([0] + [len(substrate)
+                                   for substrate in substrates])
+        sites = sm.find_sites(monomers, offsets, table)
+        # the same shuffled order per molecule and random number per cut
+        # for both cleavages
+        priorities = np.empty(len(sites))
+        numbers = []
+        expected = []
+        for substrate, start, end in zip(substrates, offsets[:-1],
+                                         offsets[1:]):
+            positions = np.flatnonzero((sites >= start) & (sites < end))
+            order = list(range(len(positions)))
+            shuffle.shuffle(order)
+            priorities[positions[order]] = np.arange(len(positions))
+            expected += regex_enzyme(substrate, subsites, order,
+                                     efficiency, recorded(rng, numbers))
+        cut = cuts(monomers, offsets, sites, table, priorities)
+        cut = sm.partial_cuts(cut, efficiency, Numbers(numbers))
+        _, starts, ends = sm.cut_products(offsets, cut, True)
+        units = "".join(substrates)
+        assert [units[start:end] for start, end in
+                zip(starts.tolist(), ends.tolist())] == expected
+
+
+def test_form_requests_of_one_session_share_the_simulation():
+    # as sent by the DP histogram and product profile forms
+    spec = {"DP": 80, "overall_FA": 0.4, "pattern": 3, "A_blocks": 0,
+            "B_blocks": 0, "molecules": 300, "seed": 1234, "strength": 0.5,
+            "digestion": ["enzyme", "_BA", "XX_", 0.8]}
+    for output in (["histogram"], ["histogram", 203, 161], ["profile"],
+                   ["profile", 203, 161]):
+        sm.digest_outputs(spec, [output])
+    stats = sm.RESULT_CACHE.stats()
+    assert stats["misses"] == 1
+    assert stats["memory hits"] == 3
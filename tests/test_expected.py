@@ -0,0 +1,104 @@
+import itertools
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import server_module as sm
+
+
+def enumerated_products(FA_per_position, cuts):
+    """Expected products per molecule of NaNO2 with a fixed number of cuts,
+    by enumerating all molecules and all equally likely sets of cut sites.
+
+    returns Counter {(length, A_count): expected number}"""
+
+    DP = len(FA_per_position)
+    products = Counter()
+    for units in itertools.product((0, 1), repeat=DP):
+        probability = np.prod([FA if unit else 1 - FA
+                               for unit, FA in zip(units, FA_per_position)])
+        sites = [position for position in range(DP - 1)
+                 if units[position] == 0]
+        cut_sets = list(itertools.combinations(sites, min(cuts, len(sites))))
+        for cut_set in cut_sets:
+            boundaries = [0] + [site + 1 for site in cut_set] + [DP]
+            for start, end in zip(boundaries[:-1], boundaries[1:]):
+                products[(end - start, sum(units[start:end]))] += (
+                    probability / len(cut_sets))
+    return products
+
+
+def expected_table(DP, overall_FA, pattern, FA_pattern, cuts):
+    lengths, A_counts, counts = sm.expected_products(
+        DP, overall_FA, pattern, FA_pattern, 0, 0, ("nano2", cuts))
+    table = Counter()
+    for length, A_count, count in zip(lengths, A_counts, counts):
+        table[(int(length), int(A_count))] += count
+    return table
+
+
+def assert_same_products(expected, enumerated):
+    for key in set(expected) | set(enumerated):
+        assert expected[key] == pytest.approx(enumerated[key], abs=1e-12)
+
+
+@pytest.mark.parametrize("DP, overall_FA, cuts", [
+    (2, 0.5, 1), (5, 0.3, 2), (7, 0.6, 3), (8, 0.45, 1), (9, 0.2, 4),
+    (6, 0.4, 0), (6, 0.7, 10),
+])
+def test_random_PA_matches_enumeration(DP, overall_FA, cuts):
+    assert_same_products(
+        expected_table(DP, overall_FA, 1, overall_FA, cuts),
+        enumerated_products(sm.position_FA(DP, overall_FA, 1, overall_FA),
+                            cuts))
+
+
+@pytest.mark.parametrize("DP, overall_FA, pattern, FA_pattern", [
+    (6, 0.4, 2, 0.7), (7, 0.5, 3, 0.9), (9, 0.3, 3, 0.1),
+])
+def test_complete_cleavage_matches_enumeration(DP, overall_FA, pattern,
+                                               FA_pattern):
+    assert_same_products(
+        expected_table(DP, overall_FA, pattern, FA_pattern, DP - 1),
+        enumerated_products(sm.position_FA(DP, overall_FA, pattern,
+                                           FA_pattern), DP - 1))
+
+
+@pytest.mark.parametrize("DP, overall_FA, pattern, FA_pattern, cuts", [
+    (6, 0.4, 2, 0.7, 2), (7, 0.5, 3, 0.9, 1), (9, 0.3, 3, 0.1, 3),
+    (8, 0.45, 2, 0.2, 0), (9, 0.5, 4, 0.95, 4), (9, 0.35, 2, 0.6, 7),
+])
+def test_pattern_with_cut_budget_matches_enumeration(DP, overall_FA, pattern,
+                                                     FA_pattern, cuts):
+    assert_same_products(
+        expected_table(DP, overall_FA, pattern, FA_pattern, cuts),
+        enumerated_products(sm.position_FA(DP, overall_FA, pattern,
+                                           FA_pattern), cuts))
+
+
+@pytest.mark.parametrize("pattern, FA_pattern", [(1, 0.4), (3, 0.7)])
+def test_expected_histogram_matches_simulation(pattern, FA_pattern):
+    spec = {"DP": 60, "overall_FA": 0.4, "pattern": pattern,
+            "FA_pattern": FA_pattern, "A_blocks": 0, "B_blocks": 0,
+            "molecules": 20000, "digestion": ("nano2", 8), "seed": 0}
+    simulated = sm.simulate_digest(spec).histogram()
+    expected = sm.simulate_digest(dict(spec, mode="expected")).histogram()
+    fractions = dict(zip(expected[0], expected[1]))
+    for DP, fraction in zip(simulated[0], simulated[1]):
+        assert fraction == pytest.approx(fractions[DP], abs=0.005)
+
+
+@pytest.mark.parametrize("changes", [
+    {"A_blocks": 3, "B_blocks": 2},
+    {"polydispersity": {"distribution": "poisson"}},
+    {"PA": 1.2},
+    {"digestion": ("nano2", 8, "poisson")},
+    {"digestion": ("enzyme", "_BA", "XX_", 1)},
+])
+def test_expected_mode_without_closed_form_raises(changes):
+    spec = {"DP": 60, "overall_FA": 0.4, "pattern": 1, "FA_pattern": 0.4,
+            "A_blocks": 0, "B_blocks": 0, "molecules": 100,
+            "digestion": ("nano2", 8), "seed": 0, "mode": "expected"}
+    with pytest.raises(ValueError):
+        sm.simulate_digest(dict(spec, **changes))
@@ -0,0 +1,32 @@
+import pytest
+
+import server_module as sm
+
+
+@pytest.mark.parametrize("simulate", [
+    lambda: sm.position_FA(60, 0.1, 2, 0.9),
+    lambda: sm.histogram_DP_FAp_molar_nano2(60, 0.1, 2, 0.9, 0, 0, 100, 4,
+                                            seed=1),
+    lambda: sm.histogram_DP_FAp_molar_nano2(
+        60, 0.1, 2, 0.9, 0, 0, 100, 4, seed=1,
+        polydispersity={"distribution": "poisson"}),
+    lambda: sm.profile_FAp_molar_nano2(60, 0.1, 2, 0.9, 0, 0, 100, 4,
+                                       mode="expected"),
+])
+def test_inconsistent_pattern_raises(simulate):
+    with pytest.raises(ValueError, match="not sensible"):
+        simulate()
+
+
+@pytest.mark.parametrize("overall_FA, PA", [(0.3, -0.1), (0.3, 1.5),
+                                            (0.5, 2.1), (0, 1.1)])
+def test_unachievable_PA_raises(overall_FA, PA):
+    with pytest.raises(ValueError, match="not possible"):
+        sm.markov_probabilities(overall_FA, PA)
+
+
+def test_highest_PA_alternates():
+    # a PA rounded to the highest value gives a strictly alternating chain
+    assert sm.markov_probabilities(0.5, 2) == (0, 1)
+    A_after_A, A_after_B = sm.markov_probabilities(0.3, 1 / 0.7)
+    assert A_after_A == pytest.approx(0)
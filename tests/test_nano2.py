@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+import server_module as sm
+
+
+SUBSTRATE = "ABBABABBBAAB" * 5
+
+
+@pytest.mark.parametrize("cut_distribution", ["fixed", "poisson",
+                                              "binomial"])
+def test_products_make_up_the_molecule(cut_distribution):
+    cuts = 0.5 if cut_distribution == "binomial" else 6
+    products = sm.nano2(SUBSTRATE, cuts, np.random.default_rng(0),
+                        cut_distribution)
+    assert "".join(products) == SUBSTRATE
+    # every product but the last ends with a cleaved B unit
+    assert all(product.endswith("B") for product in products[:-1])
+
+
+def test_fixed_cuts():
+    products = sm.nano2(SUBSTRATE, 6, np.random.default_rng(0))
+    assert len(products) == 7
+
+
+def test_library_digestion_matches_molecules():
+    library = (sm.molecule_array(SUBSTRATE), np.array([0, len(SUBSTRATE)]))
+    for seed in range(5):
+        products = sm.nano2(SUBSTRATE, 4, np.random.default_rng(seed))
+        _, _, lengths, A_counts = sm.digest_library(
+            library, ("nano2", 4), np.random.default_rng(seed))
+        assert lengths.tolist() == [len(product) for product in products]
+        assert A_counts.tolist() == [product.count("A")
+                                     for product in products]
+
+
+@pytest.mark.parametrize("cuts", [-0.1, 1.5, 5])
+def test_binomial_cuts_must_be_probabilities(cuts):
+    with pytest.raises(ValueError):
+        sm.nano2(SUBSTRATE, cuts, np.random.default_rng(0), "binomial")
+
+
+def test_unknown_cut_distribution_raises():
+    with pytest.raises(ValueError):
+        sm.nano2(SUBSTRATE, 3, np.random.default_rng(0), "uniform")
+    with pytest.raises(ValueError):
+        sm.histogram_DP_FAp_molar_nano2(50, 0.4, 1, 0.4, 0, 0, 20, 3, seed=0,
+                                        cut_distribution="uniform")
@@ -0,0 +1,86 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import server_module as sm
+
+
+def enumerated_ngram_counts(FA_per_position, max_length):
+    """Expected n-ad counts per molecule by enumerating all molecules."""
+
+    DP = len(FA_per_position)
+    counts = [np.zeros(2**length) for length in range(1, max_length + 1)]
+    for units in itertools.product((0, 1), repeat=DP):
+        probability = np.prod([FA if unit else 1 - FA
+                               for unit, FA in zip(units, FA_per_position)])
+        for length in range(1, max_length + 1):
+            for start in range(DP - length + 1):
+                code = int("".join(map(str, units[start:start + length])), 2)
+                counts[length - 1][code] += probability
+    return counts
+
+
+@pytest.mark.parametrize("DP, overall_FA, pattern, FA_pattern", [
+    (6, 0.4, 1, 0.4), (8, 0.5, 3, 0.8), (9, 0.3, 2, 0.1),
+])
+def test_expected_counts_match_enumeration(DP, overall_FA, pattern,
+                                           FA_pattern):
+    expected = sm.expected_ngram_counts(DP, overall_FA, pattern, FA_pattern,
+                                        0, 0, 4)
+    enumerated = enumerated_ngram_counts(
+        sm.position_FA(DP, overall_FA, pattern, FA_pattern), 4)
+    for expected_counts, enumerated_counts in zip(expected, enumerated):
+        assert np.allclose(expected_counts, enumerated_counts, rtol=0,
+                           atol=1e-12)
+
+
+def test_expected_fractions_match_simulation():
+    FA_range = [0.2, 0.5]
+    FA_pattern_range = [0.4, 0.7]
+    expected = sm.nmr_ngram_counts(50, FA_range, 3, FA_pattern_range, 0, 0,
+                                   100, seed=0, mode="expected")
+    simulated = sm.nmr_ngram_counts(50, FA_range, 3, FA_pattern_range, 0, 0,
+                                    20000, seed=0)
+    for expected_point, simulated_point in zip(expected, simulated):
+        for expected_counts, simulated_counts in zip(expected_point,
+                                                     simulated_point):
+            assert np.allclose(expected_counts / expected_counts.sum(),
+                               simulated_counts / simulated_counts.sum(),
+                               rtol=0, atol=0.005)
+
+
+@pytest.mark.parametrize("A_blocks, B_blocks, polydispersity, PA", [
+    (3, 2, None, None),
+    (0, 0, {"distribution": "poisson"}, None),
+    (0, 0, None, 1.2),
+])
+def test_expected_mode_without_closed_form_raises(A_blocks, B_blocks,
+                                                  polydispersity, PA):
+    with pytest.raises(ValueError):
+        sm.nmr_ngram_counts(50, [0.4], 1, [0.4], A_blocks, B_blocks, 100,
+                            seed=0, polydispersity=polydispersity, PA=PA,
+                            mode="expected")
+
+
+@pytest.mark.parametrize("DP, molecules", [(7, 50), (64, 20), (65, 20),
+                                           (300, 40)])
+@pytest.mark.parametrize("weighted", [False, True])
+def test_packed_counts_match_unpacked(DP, molecules, weighted):
+    rng = np.random.default_rng(DP)
+    library = (rng.random((molecules, DP)) < 0.4).view(np.uint8)
+    monomers, offsets = sm.flat_library(library)
+    weights = rng.integers(1, 5, molecules) if weighted else None
+    for packed_counts, numpy_counts in zip(
+            sm.packed_ngram_counts(monomers, offsets, 5, weights),
+            sm.numpy_ngram_counts(monomers, offsets, 5, weights)):
+        assert packed_counts.dtype == numpy_counts.dtype
+        assert np.array_equal(packed_counts, numpy_counts)
+
+
+def test_packed_counts_leave_polydisperse_libraries_to_other_engines():
+    offsets = np.array([0, 3, 8])
+    monomers = np.ones(8, dtype=np.uint8)
+    assert sm.packed_ngram_counts(monomers, offsets, 5) is None
+    assert np.array_equal(sm.flat_ngram_counts(monomers, offsets, 2)[1],
+                          [0, 0, 0, 6])
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+import server_module as sm
+
+
+pytest.importorskip("numba")
+
+
+def polydisperse_library(seed):
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(1, 80, 300)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    monomers = (rng.random(offsets[-1]) < 0.45).view(np.uint8)
+    return monomers, offsets
+
+
+def test_kernels_are_used():
+    assert sm.numba_kernels()
+
+
+@pytest.mark.parametrize("overall_FA, PA", [(0.3, 0.4), (0.5, 1.0),
+                                            (0.6, 1.6), (0.1, 0.2)])
+def test_markov_units(overall_FA, PA):
+    monomers, offsets = polydisperse_library(1)
+    random_numbers = np.random.default_rng(2).random(offsets[-1])
+    first = np.zeros(offsets[-1], dtype=bool)
+    first[offsets[:-1]] = True
+    assert np.array_equal(
+        sm.numba_markov_units(random_numbers, overall_FA, PA, first),
+        sm.numpy_markov_units(random_numbers, overall_FA, PA, first))
+
+
+@pytest.mark.parametrize("minus_specificity, plus_specificity", [
+    ("_BA", "XX_"), ("XXX", "XXX"), ("__A", "A__"), ("_BX", "BX_"),
+    (".BA", "XX."), ("ABB", "AAB"),
+])
+def test_enzyme_cuts(minus_specificity, plus_specificity):
+    monomers, offsets = polydisperse_library(3)
+    table = sm.specificity_table(minus_specificity, plus_specificity)
+    sites = sm.find_sites(monomers, offsets, table)
+    priorities = np.random.default_rng(4).random(len(sites))
+    assert np.array_equal(
+        sm.numba_enzyme_cuts(monomers, offsets, sites, table, priorities),
+        sm.numpy_enzyme_cuts(monomers, offsets, sites, table, priorities))
+
+
+@pytest.mark.parametrize("weighted", [False, True])
+def test_ngram_counts(weighted):
+    monomers, offsets = polydisperse_library(5)
+    weights = None
+    if weighted:
+        weights = np.random.default_rng(6).integers(0, 5, len(offsets) - 1)
+    for numba_counts, numpy_counts in zip(
+            sm.numba_ngram_counts(monomers, offsets, 5, weights),
+            sm.numpy_ngram_counts(monomers, offsets, 5, weights)):
+        assert numba_counts.dtype == numpy_counts.dtype
+        assert np.array_equal(numba_counts, numpy_counts)
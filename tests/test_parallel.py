@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+import server_module as sm
+
+
+def spec(**changes):
+    spec = {"DP": 60, "overall_FA": 0.4, "pattern": 3, "FA_pattern": 0.6,
+            "A_blocks": 0, "B_blocks": 0, "molecules": 1000,
+            "digestion": ("enzyme", "_BA", "XX_", 0.8), "seed": 9}
+    spec.update(changes)
+    return spec
+
+
+def compositions(spec, workers):
+    result = sm.simulate_digest(spec, workers)
+    return [np.asarray(array) for array in result.compositions]
+
+
+def assert_same(first, second):
+    for first_array, second_array in zip(first, second):
+        assert np.array_equal(first_array, second_array)
+
+
+@pytest.mark.parametrize("changes", [
+    {},
+    {"polydispersity": {"distribution": "poisson"}},
+    {"PA": 1.3, "pattern": 1, "FA_pattern": 0.4},
+    {"digestion": ("nano2", 6)},
+])
+def test_results_do_not_depend_on_workers(empty_caches, changes):
+    serial = compositions(spec(**changes), 1)
+    empty_caches()
+    for workers in (2, 3):
+        assert_same(compositions(spec(**changes), workers), serial)
+        empty_caches()
+
+
+def test_workers_keep_and_share_the_library(empty_caches):
+    compositions(spec(), 2)
+    assert sm.LIBRARY_CACHE.stats()["entries in memory"] == 1
+    # another digestion of the same library reads it from LIBRARY_CACHE
+    nano2 = compositions(spec(digestion=("nano2", 6)), 2)
+    assert sm.LIBRARY_CACHE.stats()["memory hits"] == 1
+    empty_caches()
+    assert_same(nano2, compositions(spec(digestion=("nano2", 6)), 1))
+
+
+def test_libraries_without_seed_are_not_kept():
+    A_counts, B_counts, counts = compositions(spec(seed=None), 2)
+    assert sm.LIBRARY_CACHE.stats()["entries in memory"] == 0
+    assert int(((A_counts + B_counts) * counts).sum()) <= 60 * 1000
+
+
+def test_shared_arrays_round_trip():
+    arrays = [np.arange(5, dtype=np.uint8), np.arange(7, dtype=np.int64),
+              np.ones((3, 4), dtype=np.uint8), np.zeros(0)]
+    block, descriptor = sm.share_arrays(arrays)
+    try:
+        attached_block, attached = sm.attach_arrays(descriptor)
+        for array, shared in zip(arrays, attached):
+            assert shared.dtype == array.dtype
+            assert np.array_equal(shared, array)
+        del attached, shared
+        attached_block.close()
+    finally:
+        block.close()
+        block.unlink()
+
+
+def test_packed_batches_round_trip():
+    library = sm.chitosan_library_array(13, 0.4, 1, 0.4, 0, 0, 10, seed=0)
+    assert np.array_equal(sm.unpack_batch(*sm.pack_batch(library)), library)
+    monomers, offsets = next(sm.polydisperse_batches(
+        13, 0.4, 1, 0.4, 0, 0, 10, {"distribution": "poisson"}, seed=0))
+    unpacked = sm.unpack_batch(*sm.pack_batch((monomers, offsets)))
+    assert np.array_equal(unpacked[0], monomers)
+    assert np.array_equal(unpacked[1], offsets)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_large_libraries_are_kept_as_files(empty_caches, monkeypatch,
+                                           workers):
+    nano2 = compositions(spec(digestion=("nano2", 6)), 1)
+    empty_caches()
+    # libraries of more than 100 bytes do not fit into LIBRARY_CACHE
+    monkeypatch.setattr(sm, "LIBRARY_CACHE", sm.ResultCache(100))
+    compositions(spec(), workers)
+    assert sm.LIBRARY_CACHE.stats()["entries in memory"] == 0
+    key = sm.LIBRARY_CACHE.key("library", sm.library_parameters(
+        60, 0.4, 3, 0.6, 0, 0, 1000, 9))
+    library = sm.load_library(key)
+    assert np.array_equal(library, sm.chitosan_library_array(
+        60, 0.4, 3, 0.6, 0, 0, 1000, seed=9))
+    del library
+    # another digestion of the same library reads it from the file
+    def generated_again(*args, **kwargs):
+        raise AssertionError("the library was generated again")
+        yield
+
+    monkeypatch.setattr(sm, "library_batches", generated_again)
+    assert_same(compositions(spec(digestion=("nano2", 6)), workers), nano2)
+    assert len(list(sm.os.scandir(sm.LIBRARY_FILE_DIR))) == 2
+
+
+def test_damaged_library_files_are_removed():
+    parameters = sm.library_parameters(60, 0.4, 3, 0.6, 0, 0, 1000, 9)
+    key = sm.LIBRARY_CACHE.key("library", parameters)
+    path = sm.create_library_file(key, parameters)
+    sm.finish_library_file(path, key, parameters)
+    assert sm.load_library(key).shape == (1000, 60)
+    library_path, sidecar_path = sm.library_file_paths(key)
+    with open(library_path, "r+b") as library:
+        library.truncate(1000)
+    assert sm.load_library(key) is None
+    assert not sm.os.path.exists(sidecar_path)
+    assert sm.load_library(key) is None
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import server_module as sm
+
+
+POISSON = {"distribution": "poisson"}
+
+
+def test_unknown_distribution_raises():
+    with pytest.raises(ValueError):
+        sm.chain_lengths(100, 10, {"distribution": "uniform"},
+                         np.random.default_rng(0))
+
+
+@pytest.mark.parametrize("polydispersity", [
+    POISSON,
+    {"distribution": "schulz_zimm", "dispersity": 1.5},
+    {"distribution": "lognormal", "dispersity": 1.2},
+    {"distribution": "histogram", "DP": [50, 100, 150],
+     "fractions": [1, 2, 1]},
+])
+def test_chain_lengths(polydispersity):
+    lengths = sm.chain_lengths(100, 5000, polydispersity,
+                               np.random.default_rng(0))
+    assert lengths.dtype == np.int64
+    assert lengths.min() >= 1
+    assert abs(lengths.mean() - 100) < 5
+
+
+def test_batches_are_flat_libraries():
+    batches = list(sm.polydisperse_batches(40, 0.4, 3, 0.6, 0, 0, 600,
+                                           POISSON, seed=1))
+    assert len(batches) == len(sm.molecule_chunks(600))
+    assert sum(len(offsets) - 1 for _, offsets in batches) == 600
+    for monomers, offsets in batches:
+        assert offsets[0] == 0 and offsets[-1] == len(monomers)
+        assert np.all(np.diff(offsets) >= 1)
+        assert set(np.unique(monomers)) <= {0, 1}
+
+
+def test_chunks_are_generated_independently():
+    batches = list(sm.polydisperse_batches(40, 0.4, 3, 0.6, 0, 0, 600,
+                                           POISSON, seed=1))
+    chunk = next(sm.polydisperse_batches(40, 0.4, 3, 0.6, 0, 0, 600,
+                                         POISSON, seed=1, chunks=[2]))
+    assert np.array_equal(chunk[0], batches[2][0])
+    assert np.array_equal(chunk[1], batches[2][1])
+
+
+@pytest.mark.parametrize("DP, molecules, polydispersity", [
+    (0, 10, POISSON),
+    (-5, 10, POISSON),
+    (float("inf"), 10, POISSON),
+    (100, -1, POISSON),
+    (100, 10, {"distribution": "schulz_zimm", "dispersity": 0.5}),
+    (100, 10, {"distribution": "lognormal", "dispersity": float("nan")}),
+    (100, 10, {"distribution": "histogram", "DP": [50, -100],
+               "fractions": [1, 1]}),
+    (100, 10, {"distribution": "histogram", "DP": [50, 100],
+               "fractions": [0, 0]}),
+    (100, 10, {"distribution": "histogram", "DP": [50, 100],
+               "fractions": [1]}),
+])
+def test_chain_lengths_reject_nonsense(DP, molecules, polydispersity):
+    with pytest.raises(ValueError, match="not sensible"):
+        sm.chain_lengths(DP, molecules, polydispersity,
+                         np.random.default_rng(0))
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+import server_module as sm
+
+
+def test_library_depends_only_on_the_seed():
+    arguments = (80, 0.4, 3, 0.6, 0, 0, 500)
+    library = sm.chitosan_library_array(*arguments, seed=5)
+    assert np.array_equal(library, sm.chitosan_library_array(*arguments,
+                                                             seed=5))
+    assert not np.array_equal(library, sm.chitosan_library_array(*arguments,
+                                                                 seed=6))
+
+
+@pytest.mark.parametrize("simulate", [
+    lambda seed: sm.histogram_DP_FAp_molar_enzyme(
+        60, 0.4, 3, 0.6, 0, 0, 1000, "_BA", "XX_", 0.8, seed=seed),
+    lambda seed: sm.profile_FAp_molar_nano2(
+        60, 0.4, 3, 0.6, 0, 0, 1000, 6, seed=seed),
+    lambda seed: sm.diads_triads(60, 0.4, 0, 0, 1000, 0, 1, seed=seed),
+])
+def test_callables_are_reproducible(empty_caches, simulate):
+    first = simulate(7)
+    # calculated again rather than read from the result cache
+    empty_caches()
+    assert simulate(7) == first
+    empty_caches()
+    assert simulate(8) != first
+
+
+def test_seed_is_part_of_the_cache_key():
+    first = sm.histogram_DP_FAp_molar_enzyme(60, 0.4, 3, 0.6, 0, 0, 1000,
+                                             "_BA", "XX_", 0.8, seed=7)
+    other = sm.histogram_DP_FAp_molar_enzyme(60, 0.4, 3, 0.6, 0, 0, 1000,
+                                             "_BA", "XX_", 0.8, seed=8)
+    assert first != other
+    assert sm.RESULT_CACHE.stats()["misses"] == 2
+
+
+@pytest.mark.parametrize("digestion", [
+    ("enzyme", "_BA", "XX_", 0.7),
+    ("nano2", 10, "poisson"),
+    ("nano2", 0.3, "binomial"),
+])
+@pytest.mark.parametrize("PA, polydispersity", [
+    (None, None),
+    (1.3, None),
+    (None, {"distribution": "poisson"}),
+])
+def test_digestion_does_not_depend_on_the_batches(digestion, PA,
+                                                  polydispersity):
+    def composition(memory_limit):
+        return sm.composition_matrix(sm.simulated_digest(
+            300, 0.4, 3, 0.6, 0, 0, 600, 5, digestion, PA=PA,
+            polydispersity=polydispersity, memory_limit=memory_limit))
+    # a batch of seven molecules splits every chunk into several batches
+    for whole, batched in zip(composition(None),
+                              composition(300 * sm.BYTES_PER_UNIT * 7)):
+        assert np.array_equal(whole, batched)
+
+
+@pytest.mark.parametrize("damage", [
+    lambda data: data[:len(data) // 2],
+    lambda data: b"",
+    lambda data: b"not a zip file" * 10,
+])
+def test_damaged_cache_files_are_misses(tmp_path, damage):
+    cache = sm.ResultCache(10**6, str(tmp_path), 10**6)
+    key = cache.key("digest", {"seed": 1})
+    cache.put(key, [np.arange(100)])
+    path = cache.path(key)
+    with open(path, "rb") as stored:
+        data = stored.read()
+    with open(path, "wb") as stored:
+        stored.write(damage(data))
+    # a new cache only finds the result on disk
+    cache = sm.ResultCache(10**6, str(tmp_path), 10**6)
+    assert cache.get(key) is None
+    assert cache.stats()["misses"] == 1
+    assert not (tmp_path / path).exists()
@@ -0,0 +1,89 @@
+import inspect
+
+import numpy as np
+import pytest
+
+import server_module as sm
+
+
+@pytest.mark.parametrize("callable_name", ["diads_triads", "block_sizes"])
+def test_clients_cannot_choose_workers(callable_name):
+    parameters = inspect.signature(getattr(sm, callable_name)).parameters
+    assert "workers" not in parameters
+
+
+def test_ngram_counts_do_not_depend_on_workers(monkeypatch):
+    FA_range = [0.2, 0.4, 0.6]
+    arguments = (40, FA_range, 2, [0.3, 0.5, 0.7], 0, 0, 500, 7)
+    sweeps = []
+    for workers in (1, 2):
+        monkeypatch.setattr(sm, "SWEEP_WORKERS", workers)
+        sweeps.append(sm.simulated_sweep(*arguments))
+    for serial, parallel in zip(*sweeps):
+        for serial_counts, parallel_counts in zip(serial, parallel):
+            assert np.array_equal(serial_counts, parallel_counts)
+
+
+def test_block_sizes_do_not_depend_on_workers(monkeypatch):
+    outputs = []
+    for workers in (1, 2):
+        monkeypatch.setattr(sm, "SWEEP_WORKERS", workers)
+        outputs.append(sm.block_sizes(60, None, 0, 0, 100, 0.2, 3, 0.7, 3,
+                                      10, True, seed=3))
+    assert outputs[0] == outputs[1]
+
+
+def test_threshold_sweep_matches_simulation():
+    arguments = (57, [0.2, 0.4, 0.6], 3, [0.3, 0.6, 0.8], 0, 0, 1000, 11)
+    sweep = sm.threshold_sweep(*arguments)
+    simulated = sm.simulated_sweep(*arguments, workers=1)
+    for sweep_point, simulated_point in zip(sweep, simulated):
+        for sweep_counts, simulated_counts in zip(sweep_point,
+                                                  simulated_point):
+            assert np.array_equal(sweep_counts, simulated_counts)
+
+
+def test_only_seeded_block_sizes_are_cached(monkeypatch):
+    monkeypatch.setattr(sm, "SWEEP_WORKERS", 1)
+    arguments = (60, None, 0, 0, 100, 0.2, 3, 0.7, 3, 10, True)
+    sm.block_sizes(*arguments)
+    assert sm.RESULT_CACHE.stats()["misses"] == 0
+    assert sm.RESULT_CACHE.stats()["entries in memory"] == 0
+    assert sm.LIBRARY_CACHE.stats()["entries in memory"] == 0
+    first = sm.block_sizes(*arguments, seed=3)
+    points = len(first["average fraction unit A"])
+    assert sm.RESULT_CACHE.stats()["misses"] == points
+    assert sm.block_sizes(*arguments, seed=3) == first
+    assert sm.RESULT_CACHE.stats()["memory hits"] == points
+
+
+def test_sweep_engines_are_timed_on_the_whole_sweep():
+    arguments = sm.nmr_sweep_benchmark(100, 16)
+    assert len(arguments[1]) == 49
+    # with the worker processes of the sweep
+    assert arguments[-1] is None
+
+
+def test_single_points_are_simulated(monkeypatch):
+    monkeypatch.setattr(sm.ENGINE_TUNER, "seconds", lambda operation, units: {
+        "threshold sweep": 0.1, "simulated": 1.0})
+
+    def names(*features):
+        return [engine.name for engine in sm.engines_for(
+            "nmr sweep", {"option A", *features}, 100 * 16)]
+
+    assert names() == ["threshold sweep", "simulated"]
+    assert names("single point") == ["simulated"]
+    assert names("single point", "expected") == ["expected"]
+
+
+def test_timings_of_other_benchmarks_are_discarded(tmp_path):
+    path = tmp_path / "engines.json"
+    timings = {"nmr sweep": {"simulated": [1.0, 1.0, 1.0]}}
+    path.write_text(sm.json.dumps({"sizes": sm.CALIBRATION_SIZES,
+                                   "timings": timings}))
+    assert sm.EngineTuner(str(path)).load() is None
+    path.write_text(sm.json.dumps({"version": sm.CALIBRATION_VERSION,
+                                   "sizes": sm.CALIBRATION_SIZES,
+                                   "timings": timings}))
+    assert sm.EngineTuner(str(path)).load() == timings